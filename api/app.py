@@ -1,51 +1,77 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scrapy.crawler import CrawlerRunner, CrawlerProcess
-from scrapy.utils.project import get_project_settings
+from api.jobs import COMPLETED, FINISHED, QUEUED, RUNNING, CrawlJob, CrawlJobManager, QueueFullError
+from api.results import render_results
+from index.src.cache import LRUCache, RedisCache, ResultCache
 from index.src.indexer import InvertedIndex
+from index.src.metrics import REGISTRY, tracing
+from index.src.profiler import SamplingProfiler
+from index.src.segment import convert_json_index
 from index.src.search import SearchEngine
-from crawler.spider import SylphSpider
-from twisted.internet import reactor
-import asyncio
 import uvicorn
-import subprocess
-import json
 import logging
-from contextlib import asynccontextmanager
+from itertools import islice
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager, nullcontext
+import time
 logger = logging.getLogger(__name__)
 
+index_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'index', 'data')
+# How often searches check for segments flushed by the crawler
+REFRESH_INTERVAL = 1.0
+# Set by api/serve.py in its workers, which the parent replaces with fresh forks after merges
+FORKED_WORKER = False
+# Shared with other workers and crawl processes so /metrics covers them all (see index/src/metrics.py)
+metrics_dir = os.environ.get('SYLPH_METRICS_DIR')
+REQUEST_SECONDS = REGISTRY.histogram('sylph_request_seconds', 'API request latency', labels=('method', 'route', 'status'))
+profiler = SamplingProfiler()
+# /debug/ routes let clients start the profiler and read stacks, off unless asked for
+DEBUG_ENDPOINTS = os.environ.get('SYLPH_DEBUG_ENDPOINTS', '').lower() in ('1', 'true', 'yes')
+
+
+def open_index() -> None:
+    os.makedirs(index_dir, exist_ok=True)
+    index_file = os.path.join(index_dir, 'index.seg')
+    legacy_index_file = os.path.join(index_dir, 'index.json')
+    if not os.path.exists(index_file) and os.path.exists(legacy_index_file):
+        convert_json_index(legacy_index_file, index_file)
+    index.open(index_dir)
+    logger.info(f"Opened index with {index.doc_count} documents from {index_dir}")
+
+
+def refresh_index() -> None:
+    index.refresh(min_interval=REFRESH_INTERVAL)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
-        global crawled_data, index, search_engine
-        outputFile = os.path.join(os.path.dirname(__file__), 'output.jsonl')
-        if os.path.exists(outputFile):
-            with open(outputFile, 'r') as f:
-                crawled_data = [json.loads(line) for line in f if line.strip()]
-            logger.info(f"Loaded {len(crawled_data)} documents")
-
-        index_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'index', 'data')
-        index_file = os.path.join(index_dir, 'index.json')
-        if os.path.exists(index_file):
-            index.load_index(index_file)
-            logger.info(f"Loaded index with {len(index.trie)} tokens from {index_file}")
+        # api/serve.py opens the index before forking its workers
+        if index.directory is None:
+            open_index()
     except Exception as e:
         logger.error(f"Error during startup: {e}")
+    if metrics_dir:
+        REGISTRY.attach(metrics_dir)
+    if os.environ.get('SYLPH_PROFILE'):
+        profiler.start()
 
     yield
 
+    # A worker retired for a merged snapshot lets its crawls finish
+    await crawl_jobs.shutdown(cancel=not FORKED_WORKER)
+    profiler.stop()
+    REGISTRY.retire()
     try:
-        if len(index.trie) > 0:
-            index_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'index', 'data')
-            index_file = os.path.join(index_dir, 'index.json')
-            os.makedirs(index_dir, exist_ok=True)
-            index.save_index(index_file)
-            logger.info(f"Saved index with {len(index.trie)} tokens on shutdown")
+        if index.directory is not None:
+            index.flush()
+            index.close()
+            logger.info("Flushed index on shutdown")
     except Exception as e:
         logger.error(f"Error during shutdown: {str(e)}")
 
@@ -54,7 +80,7 @@ app = FastAPI(
     title = "Sylph Search Engine",
     description="A search Engine Focused on Swiftness and Fast results",
     version="0.0.1",
-    lifespnan = lifespan
+    lifespan = lifespan
 )
 
 app.add_middleware(
@@ -65,129 +91,177 @@ app.add_middleware(
     allow_headers = ["*"]
 )
 
-crawled_data = []
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates, not paths, keep job IDs out of the labels
+    route = request.scope.get('route')
+    REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                            route.path if route is not None else 'unmatched', str(response.status_code))
+    return response
+
 
 @app.get("/")
 async def read_root():
     return {"Message" : "Welcome to Sylph, Your Fastest Search Engine"}
 
 index = InvertedIndex()
-search_engine = SearchEngine(index)
+# Workers share results through Redis when SYLPH_REDIS_URL is set
+redis_url = os.environ.get('SYLPH_REDIS_URL')
+result_cache = ResultCache(RedisCache.from_url(redis_url) if redis_url else LRUCache())
+search_engine = SearchEngine(index, cache=result_cache)
+
+
+async def refresh_after_crawl(job: CrawlJob) -> None:
+    if index.directory is None:
+        index.open(index_dir)
+    index.refresh(force=True)
 
 
-@app.post("/crawl/")
+crawl_jobs = CrawlJobManager(
+    jobs_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crawls'),
+    index_dir=index_dir,
+    max_running=int(os.environ.get('SYLPH_MAX_CRAWL_JOBS', 2)),
+    on_complete=refresh_after_crawl,
+    metrics_dir=metrics_dir
+)
+
+
+@app.post("/crawl/", status_code=202)
 async def start_crawler(urls: List[str]):
+    """Queues a crawl and returns at once; poll /crawl/{job_id} for progress"""
+    if not urls:
+        raise HTTPException(status_code=400, detail="No URLs to crawl")
     try:
-        urls_str = ','. join(urls)
-        
-        outputFile  = os.path.join(os.path.dirname(__file__), 'output.jsonl')
-
-        if os.path.exists(outputFile):
-            os.remove(outputFile)
-        
-        outputFile  = os.path.join(os.path.dirname(__file__), 'output.jsonl')
-        index_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'index', 'data')
         os.makedirs(index_dir, exist_ok=True)
+        job = crawl_jobs.submit(urls)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "Message": "Crawl queued",
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/crawl/{job.id}"
+    }
 
-        subprocess.call([
-            'scrapy', 'crawl', 'sylph_spider', 
-            '-a', f'start_urls={urls_str}', 
-            '-o', outputFile
-        ], restore_signals= True)
 
+@app.get("/crawl/")
+async def list_crawls():
+    jobs = crawl_jobs.all_jobs()
+    return {
+        "running": sum(1 for job in jobs if job.status == RUNNING),
+        "queued": sum(1 for job in jobs if job.status == QUEUED),
+        "jobs": [job.to_dict() for job in reversed(jobs)]
+    }
 
-        global crawled_data
-        with open(outputFile, 'r') as f:
-            crawled_data = [json.loads(line) for line in f if line.strip()]
 
-        print(f"Crawled {len(crawled_data)} documents")
+def get_job(job_id: str) -> CrawlJob:
+    job = crawl_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No crawl job {job_id}")
+    return job
 
-        for item in crawled_data:
-            print(f"Indexing document: {item['url']}")
-            print(f"Text length: {len(item['text'])}")
-            
 
-        for item in crawled_data:
-            full_text = f"{item['title']} {item['meta_description']} {item['text']}"
-            index.add_document(
-                doc_id=item['url'],
-                title=item['title'],
-                text=full_text
-               
-            )
+@app.get("/crawl/{job_id}")
+async def crawl_status(job_id: str):
+    job = get_job(job_id)
+    return dict(job.to_dict(), Tokens_Indexed=len(index) if job.status == COMPLETED else None)
 
-        index_file = os.path.join(index_dir, 'index.json')
-        print(f"Saving index with {len(index.trie)} tokens")
-        index.save_index(index_file)
 
+@app.get("/crawl/{job_id}/items")
+async def crawl_items(job_id: str, offset: int = 0, limit: int = 100, text: bool = False):
+    """Crawled items; ``text`` adds each page's text from the index, where it is stored"""
+    job = get_job(job_id)
+    items = list(islice(job.iter_items(), max(offset, 0), max(offset, 0) + max(limit, 0)))
+    if text:
+        refresh_index()
+        for item in items:
+            item['text'] = index.text_by_url(item['url'])
+    return {"job_id": job.id, "status": job.status, "offset": offset, "items": items}
+
+
+@app.delete("/crawl/{job_id}")
+async def cancel_crawl(job_id: str):
+    job = get_job(job_id)
+    if job_id not in crawl_jobs.jobs and job.status not in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Crawl job {job_id} runs in another worker")
+    if not crawl_jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Crawl job {job_id} already {job.status}")
+    return job.to_dict()
 
-        return {
-            "Message": "Crawling Complete",
-            "Documents_Crawled": len(crawled_data),
-            "Tokens_Indexed": len(index.trie),
-            "Data": crawled_data
-        }
-    except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/search/")
-async def search(query: str, limit: Optional[int] = 10):
-    outputFile = os.path.join(os.path.dirname(__file__), 'output.jsonl')
-    if os.path.exists(outputFile):
-            with open(outputFile, 'r') as f:
-                crawled_data = [json.loads(line) for line in f if line.strip()]
-    if not crawled_data:
+async def search(query: str, limit: Optional[int] = 10, fuzzy: int = Query(0, ge=0, le=2), trace: bool = False):
+    """``trace`` adds the time spent in each stage of this search to the response"""
+    refresh_index()
+    if index.doc_count == 0:
         raise HTTPException(status_code=404, detail="No crawled data available")
     
-    scored_results = search_engine.search(query, limit)
-    results = []
-    for doc_score in scored_results:
-           
-        doc = next((item for item in crawled_data if item['url'] == doc_score.doc_id), None)
-        if doc:
-            text = doc['text']
-            query_terms = query.lower().split()
-            snippet = ""
-            
-            if text:
-                best_pos = min(doc_score.positions) if doc_score.positions else float('inf')
-                if best_pos != float('inf'):
-                    start = max(0, best_pos - 100)
-                    end = min(len(text), best_pos + 200)
-                    snippet = text[start:end].strip()
-                    if start > 0:
-                        snippet = f"...{snippet}"
-                    if end < len(text):
-                        snippet = f"{snippet}..."
-            
-            results.append({
-                'url': doc['url'],
-                'title': doc['title'],
-                'description': doc['meta_description'],
-                'snippet': snippet if snippet else doc['meta_description'],
-                'score': doc_score.score,
-                'matches': {
-                    'title': doc_score.title_match,
-                    'description': doc_score.description_match
-                }
-            })
-
-    # Sort by score (already sorted by search engine, but just to be sure)
-    results.sort(key=lambda x: x['score'], reverse=True)
+    with tracing() if trace else nullcontext() as search_trace:
+        scored_results = search_engine.search(query, limit, fuzzy=fuzzy)
+        results = render_results(index, scored_results)
 
-    return {
+    response = {
         "query": query,
         "results_count": len(results),
         "results": results[:limit]
     }
+    if trace:
+        response["trace"] = search_trace.to_dict()
+    return response
+
+
+@app.get("/suggest/")
+async def suggest(prefix: str, limit: Optional[int] = 10):
+    refresh_index()
+    completions = index.completions().complete(prefix.strip().lower(), limit)
+    return {
+        "prefix": prefix,
+        "suggestions": [{"term": word, "doc_freq": doc_freq} for word, _, doc_freq in completions]
+    }
 
 
 @app.get("/stats/")
 async def get_stats():
+    refresh_index()
     return {
-        "total_pages_crawled": len(crawled_data),
-        "unique_domains": len(set(item['url'] for item in crawled_data))
+        "total_pages_crawled": index.doc_count,
+        "unique_domains": len(set(urlparse(doc.url).netloc for _, doc in index.iter_documents())),
+        "cache": result_cache.stats.to_dict()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage and request latency histograms in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def require_debug_endpoints() -> None:
+    if not DEBUG_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.post("/debug/profiler")
+async def toggle_profiler(enabled: bool, reset: bool = False):
+    """Starts or stops this worker's sampling profiler, ``reset`` drops the stacks sampled so far"""
+    require_debug_endpoints()
+    if reset:
+        profiler.reset()
+    if enabled:
+        profiler.start()
+    else:
+        profiler.stop()
+    return {"running": profiler.running, "samples": profiler.samples}
+
+
+@app.get("/debug/profiler", response_class=PlainTextResponse)
+async def profile():
+    """Sampled stacks in the collapsed format, for flamegraph.pl or speedscope"""
+    require_debug_endpoints()
+    return profiler.collapsed()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
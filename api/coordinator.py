@@ -0,0 +1,227 @@
+"""Scatter-gather search over the shards of a sharded index.
+
+    python -m api.coordinator --shards http://127.0.0.1:9001,http://127.0.0.1:9002
+    python -m api.coordinator --local index/sharded      # one local process per shard
+
+A query is sent to every shard in parallel twice: first for the shards'
+statistics of the query terms, which are summed into collection-wide ones,
+then for each shard's top-k scored with them (see shard.py). The local
+top-k lists are merged with a heap. A shard that fails or misses its
+timeout in any round is left out and the response is marked partial.
+
+``prefix*`` terms are expanded once for the whole collection, in a round
+before the others: each shard's completions of a prefix are merged by their
+summed document frequency, and the top terms are sent along with the query,
+so every shard scores and counts the same terms.
+"""
+from fastapi import FastAPI, HTTPException
+from typing import Dict, Iterable, List, Optional, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from index.src.query import MAX_EXPANSIONS
+from index.src.shards import shard_dirs
+from index.src.stats import CollectionStatistics
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from itertools import islice
+import argparse
+import asyncio
+import heapq
+import httpx
+import logging
+import subprocess
+import time
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def merge_expansions(parts: Iterable[Dict[str, List]], limit: int = MAX_EXPANSIONS) -> Dict[str, List[str]]:
+    """Top terms of each prefix by summed document frequency, from the shards' (word, term, doc freq) completions"""
+    doc_freqs: Dict[str, Dict[str, int]] = {}
+    words: Dict[str, Dict[str, str]] = {}
+    for part in parts:
+        for prefix, candidates in part.items():
+            prefix_freqs = doc_freqs.setdefault(prefix, {})
+            prefix_words = words.setdefault(prefix, {})
+            for word, term, doc_freq in candidates:
+                prefix_freqs[term] = prefix_freqs.get(term, 0) + doc_freq
+                current = prefix_words.get(term)
+                # Ranked by the term's shortest word, as CompletionIndex does
+                if current is None or (len(word), word) < (len(current), current):
+                    prefix_words[term] = word
+    return {
+        prefix: heapq.nsmallest(limit, prefix_freqs, key=lambda term: (-prefix_freqs[term], words[prefix][term]))
+        for prefix, prefix_freqs in doc_freqs.items()
+    }
+
+
+class ScatterGatherCoordinator:
+    def __init__(self, shard_urls: List[str], timeout: float = 2.0):
+        self.shard_urls = [url.rstrip('/') for url in shard_urls]
+        self.timeout = timeout
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        limits = httpx.Limits(max_keepalive_connections=4 * len(self.shard_urls))
+        self.client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _call(self, shard: int, method: str, path: str, payload: Optional[Dict] = None) -> Tuple[int, Optional[Dict], Optional[str]]:
+        """(shard, response, error) of one request, never raising"""
+        try:
+            response = await asyncio.wait_for(
+                self.client.request(method, f"{self.shard_urls[shard]}{path}", json=payload),
+                self.timeout
+            )
+            response.raise_for_status()
+            return shard, response.json(), None
+        except asyncio.TimeoutError:
+            return shard, None, f"timed out after {self.timeout}s"
+        except Exception as e:
+            return shard, None, str(e) or type(e).__name__
+
+    async def _scatter(self, shards: List[int], method: str, path: str,
+                       payload: Optional[Dict] = None) -> Tuple[Dict[int, Dict], Dict[int, str]]:
+        responses, errors = {}, {}
+        for shard, response, error in await asyncio.gather(*(self._call(shard, method, path, payload) for shard in shards)):
+            if error is None:
+                responses[shard] = response
+            else:
+                logger.warning(f"Shard {self.shard_urls[shard]} failed: {error}")
+                errors[shard] = error
+        return responses, errors
+
+    async def search(self, query: str, limit: int = 10) -> Dict:
+        shards = list(range(len(self.shard_urls)))
+        errors: Dict[int, str] = {}
+        expansions = None
+        if '*' in query:
+            candidates, errors = await self._scatter(shards, 'POST', '/shard/expand', {"query": query})
+            expansions = merge_expansions(response['expansions'] for response in candidates.values())
+            shards = sorted(candidates)
+
+        stats, stats_errors = await self._scatter(shards, 'POST', '/shard/stats',
+                                                  {"query": query, "expansions": expansions})
+        errors.update(stats_errors)
+        collection = CollectionStatistics.merge(
+            CollectionStatistics(**response['statistics']) for response in stats.values()
+        )
+
+        searched, search_errors = await self._scatter(
+            sorted(stats), 'POST', '/shard/search',
+            {"query": query, "limit": limit, "collection": asdict(collection), "expansions": expansions}
+        )
+        errors.update(search_errors)
+
+        # Each shard's results are sorted, so a k-way merge finds the global top-k
+        ranked = [
+            [dict(result, shard=shard) for result in response['results']]
+            for shard, response in sorted(searched.items())
+        ]
+        results = list(islice(heapq.merge(*ranked, key=lambda result: (-result['score'], result['shard'], result['doc_id'])), limit))
+        return {
+            "results": results,
+            "partial": bool(errors),
+            "shards": {
+                "total": len(self.shard_urls),
+                "succeeded": len(searched),
+                "failed": {self.shard_urls[shard]: error for shard, error in sorted(errors.items())}
+            }
+        }
+
+    async def info(self) -> Dict:
+        responses, errors = await self._scatter(list(range(len(self.shard_urls))), 'GET', '/shard/info')
+        return {
+            "doc_count": sum(response['doc_count'] for response in responses.values()),
+            "shards": {self.shard_urls[shard]: response for shard, response in sorted(responses.items())},
+            "failed": {self.shard_urls[shard]: error for shard, error in sorted(errors.items())}
+        }
+
+
+def launch_local_shards(root: str, base_port: int = 9001, host: str = '127.0.0.1',
+                        startup_timeout: float = 30.0) -> Tuple[List[subprocess.Popen], List[str]]:
+    """Starts a shard server process for every shard under ``root``, returns them and their URLs"""
+    processes, urls = [], []
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for i, path in enumerate(shard_dirs(root)):
+        port = base_port + i
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'api.shard', '--index-dir', path, '--host', host, '--port', str(port)],
+            cwd=project_dir
+        ))
+        urls.append(f"http://{host}:{port}")
+
+    deadline = time.monotonic() + startup_timeout
+    for url in urls:
+        while True:
+            try:
+                httpx.get(f"{url}/shard/info", timeout=1.0).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    for process in processes:
+                        process.terminate()
+                    raise RuntimeError(f"Shard at {url} did not start")
+                time.sleep(0.1)
+    return processes, urls
+
+
+coordinator = ScatterGatherCoordinator(
+    [url for url in os.environ.get('SYLPH_SHARD_URLS', '').split(',') if url],
+    timeout=float(os.environ.get('SYLPH_SHARD_TIMEOUT', 2.0))
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await coordinator.start()
+    yield
+    await coordinator.close()
+
+
+app = FastAPI(title="Sylph Search Coordinator", lifespan=lifespan)
+
+
+@app.get("/search/")
+async def search(query: str, limit: Optional[int] = 10):
+    response = await coordinator.search(query, limit)
+    if not response["shards"]["succeeded"]:
+        raise HTTPException(status_code=503, detail=response["shards"]["failed"])
+    return dict(query=query, results_count=len(response["results"]), **response)
+
+
+@app.get("/stats/")
+async def get_stats():
+    info = await coordinator.info()
+    return {"total_pages_crawled": info["doc_count"], "shards": info["shards"], "failed": info["failed"]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve search over a sharded index")
+    shards = parser.add_mutually_exclusive_group(required=True)
+    shards.add_argument('--shards', help="Comma-separated shard server URLs")
+    shards.add_argument('--local', metavar='ROOT', help="Sharded index root, served by local shard processes")
+    parser.add_argument('--base-port', type=int, default=9001)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--timeout', type=float, default=2.0, help="Per-shard timeout in seconds")
+    args = parser.parse_args()
+
+    processes = []
+    if args.local:
+        processes, urls = launch_local_shards(args.local, args.base_port)
+    else:
+        urls = args.shards.split(',')
+    coordinator.shard_urls = [url.rstrip('/') for url in urls]
+    coordinator.timeout = args.timeout
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,299 @@
+"""Background crawl jobs.
+
+Each job runs ``scrapy crawl`` in its own process, started with asyncio so
+the API's event loop keeps serving searches while it runs. The crawler's
+IndexingPipeline writes segments into the shared index directory, and every
+job writes its items and log to its own files, so jobs never clobber each
+other's output. At most ``max_running`` crawls run at once in a process;
+further jobs wait in a bounded queue.
+
+Job state is also saved next to the output as ``<job_id>.json``, so when
+several API workers share the jobs directory (see serve.py) any of them can
+report on a job, although only the one running it can cancel it.
+
+Item files leave out the page text, which is stored once, compressed, in
+the index's document store.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from index.src.metrics import archive
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (COMPLETED, FAILED, CANCELLED)
+
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+ITEM_FIELDS = 'url,title,meta_description,meta_keywords,headers'
+# Scrapy's closing stats dump, at the end of the log: {'name': value, ...}
+_STAT = re.compile(r"^[{ ]'([\w/]+)': (\d+)[,}]?$", re.MULTILINE)
+_STATS_TAIL = 16 * 1024
+_COUNTS = {
+    'response_received_count': 'pages_fetched',
+    'item_scraped_count': 'items_crawled',
+    'dedup/duplicates': 'near_duplicates_skipped',
+    'frontier/duplicates': 'duplicate_urls_skipped',
+}
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class CrawlJob:
+    id: str
+    urls: List[str]
+    output_path: str
+    log_path: str
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    return_code: Optional[int] = None
+    error: Optional[str] = None
+    process: Optional[asyncio.subprocess.Process] = field(default=None, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def items_crawled(self) -> int:
+        try:
+            with open(self.output_path, 'rb') as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def counts(self) -> Dict[str, int]:
+        """Page counts from the crawler's closing stats, empty until it has finished"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(self.log_path) - _STATS_TAIL))
+                tail = f.read().decode('utf-8', errors='ignore')
+        except FileNotFoundError:
+            return {}
+        counts = {name: 0 for name in _COUNTS.values()} if 'Dumping Scrapy stats' in tail else {}
+        for key, value in _STAT.findall(tail):
+            if key in _COUNTS:
+                counts[_COUNTS[key]] = int(value)
+        return counts
+
+    def iter_items(self) -> Iterator[Dict]:
+        try:
+            with open(self.output_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def to_record(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "urls": self.urls,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "return_code": self.return_code,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict, jobs_dir: str) -> 'CrawlJob':
+        return cls(
+            id=record['job_id'],
+            urls=record['urls'],
+            output_path=os.path.join(jobs_dir, f"{record['job_id']}.jsonl"),
+            log_path=os.path.join(jobs_dir, f"{record['job_id']}.log"),
+            status=record['status'],
+            created_at=record['created_at'],
+            started_at=record['started_at'],
+            finished_at=record['finished_at'],
+            return_code=record['return_code'],
+            error=record['error']
+        )
+
+    def to_dict(self) -> Dict:
+        end = self.finished_at or time.time()
+        return dict(
+            self.to_record(),
+            items_crawled=self.items_crawled(),
+            counts=self.counts() if self.status in FINISHED else {},
+            elapsed_seconds=end - self.started_at if self.started_at else 0.0
+        )
+
+
+class CrawlJobManager:
+    def __init__(self, jobs_dir: str, index_dir: str, max_running: int = 2, max_queued: int = 16,
+                 max_history: int = 100, on_complete: Optional[Callable[[CrawlJob], Awaitable[None]]] = None,
+                 command: Optional[List[str]] = None, metrics_dir: Optional[str] = None):
+        self.jobs_dir = jobs_dir
+        self.index_dir = index_dir
+        # Crawls write their stage timings here for the API's /metrics
+        self.metrics_dir = metrics_dir
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.on_complete = on_complete
+        # Run through the current interpreter so the crawl uses the API's environment
+        self.command = command or [sys.executable, '-m', 'scrapy', 'crawl', 'sylph_spider']
+        self.jobs: 'OrderedDict[str, CrawlJob]' = OrderedDict()
+        self._slots = asyncio.Semaphore(max_running)
+
+    def _record_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job: CrawlJob) -> None:
+        path = self._record_path(job.id)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job.to_record(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error saving crawl job {job.id}: {str(e)}")
+
+    def _load(self, job_id: str) -> Optional[CrawlJob]:
+        try:
+            with open(self._record_path(job_id), 'r', encoding='utf-8') as f:
+                return CrawlJob.from_record(json.load(f), self.jobs_dir)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get(self, job_id: str) -> Optional[CrawlJob]:
+        """A job of this process, or one another worker saved to the jobs directory"""
+        job = self.jobs.get(job_id)
+        if job is None and _JOB_ID.match(job_id):
+            job = self._load(job_id)
+        return job
+
+    def all_jobs(self) -> List[CrawlJob]:
+        """Every job in the jobs directory, oldest first"""
+        jobs = {}
+        if os.path.isdir(self.jobs_dir):
+            for filename in os.listdir(self.jobs_dir):
+                job_id, ext = os.path.splitext(filename)
+                if ext == '.json' and _JOB_ID.match(job_id):
+                    job = self._load(job_id)
+                    if job is not None:
+                        jobs[job_id] = job
+        jobs.update(self.jobs)
+        return sorted(jobs.values(), key=lambda job: job.created_at)
+
+    def queued(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == QUEUED)
+
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == RUNNING)
+
+    def submit(self, urls: List[str]) -> CrawlJob:
+        if self.queued() >= self.max_queued:
+            raise QueueFullError(f"{self.max_queued} crawl jobs already queued")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        job = CrawlJob(
+            id=job_id,
+            urls=urls,
+            output_path=os.path.join(self.jobs_dir, f"{job_id}.jsonl"),
+            log_path=os.path.join(self.jobs_dir, f"{job_id}.log")
+        )
+        self.jobs[job_id] = job
+        self._save(job)
+        self._prune()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    async def _run(self, job: CrawlJob) -> None:
+        try:
+            async with self._slots:
+                if job.status != QUEUED:
+                    return
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._save(job)
+                settings = ['-s', f'SYLPH_METRICS_DIR={self.metrics_dir}'] if self.metrics_dir else []
+                with open(job.log_path, 'wb') as log:
+                    job.process = await asyncio.create_subprocess_exec(
+                        *self.command,
+                        '-a', f"start_urls={','.join(job.urls)}",
+                        '-s', f'SYLPH_INDEX_DIR={self.index_dir}',
+                        '-s', f'FEED_EXPORT_FIELDS={ITEM_FIELDS}',
+                        *settings,
+                        '-O', job.output_path,
+                        cwd=PROJECT_DIR,
+                        stdout=log,
+                        stderr=asyncio.subprocess.STDOUT
+                    )
+                    job.return_code = await job.process.wait()
+                if self.metrics_dir:
+                    # Normally done by the crawl as it closes, not if it was killed
+                    archive(self.metrics_dir, job.process.pid)
+
+                if job.status == CANCELLED:
+                    return
+                if job.return_code == 0:
+                    job.status = COMPLETED
+                else:
+                    job.status = FAILED
+                    job.error = f"Crawler exited with code {job.return_code}, see {job.log_path}"
+                logger.info(f"Crawl job {job.id} {job.status} with {job.items_crawled()} items")
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            raise
+        except Exception as e:
+            logger.error(f"Crawl job {job.id} failed: {str(e)}")
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = job.finished_at or time.time()
+            job.process = None
+            self._save(job)
+            if job.status in (COMPLETED, FAILED) and self.on_complete is not None:
+                try:
+                    await self.on_complete(job)
+                except Exception as e:
+                    logger.error(f"Error after crawl job {job.id}: {str(e)}")
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        job.status = CANCELLED
+        job.finished_at = time.time()
+        if job.process is not None and job.process.returncode is None:
+            # SIGTERM lets scrapy close the spider, which flushes the indexed pages
+            job.process.terminate()
+        self._save(job)
+        return True
+
+    async def shutdown(self, cancel: bool = True) -> None:
+        """Cancels running and queued jobs, or waits for them to finish"""
+        if cancel:
+            for job_id in list(self.jobs):
+                self.cancel(job_id)
+        tasks = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _prune(self) -> None:
+        finished = [job for job in self.jobs.values() if job.status in FINISHED]
+        for job in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job.id]
+            for path in (job.output_path, job.log_path, self._record_path(job.id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
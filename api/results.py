@@ -0,0 +1,28 @@
+from typing import Dict, List
+from index.src.indexer import InvertedIndex
+from index.src.metrics import timed
+from ranking.src.scoring import DocumentScore
+
+
+def render_results(index: InvertedIndex, scored_results: List[DocumentScore]) -> List[Dict]:
+    """Search results as returned by the API, with snippets from the document store"""
+    results = []
+    for doc_score in scored_results:
+        with timed('render.document'):
+            doc = index.get_document(doc_score.doc_id)
+        with timed('render.snippet'):
+            snippet = index.snippet(doc_score.doc_id, doc_score.positions)
+
+        results.append({
+            'url': doc.url,
+            'title': doc.title,
+            'description': doc.meta_description,
+            'snippet': snippet.text if snippet else doc.meta_description,
+            'highlights': snippet.highlights if snippet else [],
+            'score': doc_score.score,
+            'matches': {
+                'title': doc_score.title_match,
+                'description': doc_score.description_match
+            }
+        })
+    return results
@@ -0,0 +1,191 @@
+"""Serve the API from several worker processes sharing one index snapshot.
+
+    python -m api.serve --workers 4 --port 8000
+
+Scoring is CPU-bound Python, so a single process saturates one core. Here the
+parent opens the index, builds the statistics, scorer and completions once,
+then forks the workers onto one listening socket. Segments and document
+stores are mmap'd, so their pages are shared through the page cache, and the
+structures built before forking are shared copy-on-write; ``gc.freeze()``
+keeps the collector from touching, and so copying, them in every worker.
+Resident memory therefore stays roughly flat as workers are added.
+
+Workers refresh in place, as a single process would, so the segments a
+crawler flushes every few seconds show up without restarting anything. Each
+worker then builds its own statistics for the new generation, and that
+sharing is lost until a merge: when one replaces segments, the parent opens
+and warms the merged snapshot, forks a fresh set of workers and only then
+asks the old ones to finish their requests and exit. SIGHUP does the same on
+demand. The socket is never left without a worker.
+
+Without ``SYLPH_METRICS_DIR``, workers share their metrics through a
+temporary directory that lasts as long as the server, so /metrics adds up
+every worker whichever one answers.
+"""
+from typing import List
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+import uvicorn
+import api.app as app_module
+from index.src.metrics import archive
+
+logger = logging.getLogger(__name__)
+
+
+def warm_snapshot() -> None:
+    """Builds everything a query would otherwise build lazily in each worker"""
+    app_module.search_engine._current_scorer()
+    app_module.index.completions()
+    # Let the previous snapshot's objects be collected before freezing the new one
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def refresh_snapshot(force: bool = False) -> bool:
+    """Refreshes the parent's snapshot, returns whether workers should be replaced by forks of it"""
+    index = app_module.index
+    previous = {segment.name for segment in index.segments}
+    if not index.refresh(force=force):
+        return False
+    # Flushes only add segments; a merge removes its sources
+    if force or previous - {segment.name for segment in index.segments}:
+        warm_snapshot()
+        return True
+    return False
+
+
+WORKER_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD)
+
+
+def spawn_worker(sock: socket.socket, log_level: str) -> int:
+    # Blocked across the fork: a signal reaching the child before its handlers are reset
+    # would run the parent's handler there and be lost
+    signal.pthread_sigmask(signal.SIG_BLOCK, WORKER_SIGNALS)
+    pid = os.fork()
+    if pid:
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, WORKER_SIGNALS)
+        return pid
+    status = 0
+    try:
+        for signum in WORKER_SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, WORKER_SIGNALS)
+        app_module.FORKED_WORKER = True
+        config = uvicorn.Config(app_module.app, log_level=log_level)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        logger.error(f"Worker {os.getpid()} failed: {str(e)}")
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def retire(pids: List[int]) -> None:
+    for pid in pids:
+        try:
+            # uvicorn stops accepting, finishes in-flight requests, then exits
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def serve(host: str, port: int, workers: int, poll_interval: float, log_level: str) -> None:
+    temporary_metrics_dir = None
+    if app_module.metrics_dir is None:
+        temporary_metrics_dir = tempfile.mkdtemp(prefix='sylph-metrics-')
+        app_module.metrics_dir = app_module.crawl_jobs.metrics_dir = temporary_metrics_dir
+    app_module.REGISTRY.attach(app_module.metrics_dir)
+    app_module.open_index()
+    warm_snapshot()
+    logger.info(f"Serving generation {app_module.index._manifest_generation} with {workers} workers")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    stopping = False
+    reload_requested = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    def request_reload(signum, frame):
+        nonlocal reload_requested
+        reload_requested = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, request_reload)
+
+    current = {spawn_worker(sock, log_level) for _ in range(workers)}
+    retiring = set()
+    try:
+        while not stopping:
+            time.sleep(poll_interval)
+
+            # Reap exited workers and replace current ones that died
+            while True:
+                try:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                # A worker that did not shut down cleanly leaves its metrics file behind
+                archive(app_module.metrics_dir, pid)
+                retiring.discard(pid)
+                if pid in current and not stopping:
+                    logger.warning(f"Worker {pid} exited, starting a replacement")
+                    current.discard(pid)
+                    current.add(spawn_worker(sock, log_level))
+
+            try:
+                replace = refresh_snapshot(force=reload_requested)
+            except Exception as e:
+                logger.error(f"Error loading a new snapshot, keeping the current one: {str(e)}")
+                continue
+            reload_requested = False
+            if replace:
+                previous = current
+                current = {spawn_worker(sock, log_level) for _ in range(workers)}
+                retire(list(previous))
+                retiring |= previous
+                logger.info(f"Swapped to generation {app_module.index._manifest_generation}")
+    finally:
+        retire(list(current | retiring))
+        for pid in current | retiring:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            archive(app_module.metrics_dir, pid)
+        sock.close()
+        app_module.index.close()
+        app_module.REGISTRY.retire()
+        if temporary_metrics_dir is not None:
+            shutil.rmtree(temporary_metrics_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the search API from pre-forked workers")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help="Seconds between checks for a merged index generation")
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+    serve(args.host, args.port, args.workers, args.poll_interval, args.log_level)
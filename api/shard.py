@@ -0,0 +1,121 @@
+"""One shard of a sharded index, queried by the coordinator (coordinator.py).
+
+    python -m api.shard --index-dir index/sharded/shard_000 --port 9001
+
+Sharded search takes two round trips. ``/shard/stats`` returns the shard's
+part of the collection statistics for a query. ``/shard/search`` then
+scores the query's local top-k with the collection-wide statistics the
+coordinator summed up, so scores are comparable across shards. A query with
+``prefix*`` terms takes a third, first: ``/shard/expand`` returns the
+shard's completions of each prefix, from which the coordinator picks the
+terms every shard then uses.
+"""
+from fastapi import FastAPI
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.results import render_results
+from index.src.indexer import InvertedIndex
+from index.src.search import SearchEngine
+from index.src.stats import CollectionStatistics
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+import argparse
+import logging
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+index_dir = os.environ.get('SYLPH_SHARD_DIR', '')
+REFRESH_INTERVAL = 1.0
+
+index = InvertedIndex()
+search_engine = SearchEngine(index)
+
+
+class ExpandRequest(BaseModel):
+    query: str
+
+
+class StatsRequest(BaseModel):
+    query: str
+    # Terms of each prefix* in the query, chosen for the whole collection
+    expansions: Optional[Dict[str, List[str]]] = None
+
+
+class CollectionStatisticsModel(BaseModel):
+    total_docs: int
+    total_tokens: int
+    field_tokens: Dict[str, int] = Field(default_factory=dict)
+    doc_freq: Dict[str, int] = Field(default_factory=dict)
+
+
+class ShardSearchRequest(BaseModel):
+    query: str
+    limit: int = 10
+    collection: Optional[CollectionStatisticsModel] = None
+    expansions: Optional[Dict[str, List[str]]] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        if index.directory is None:
+            index.open(index_dir)
+            logger.info(f"Opened shard with {index.doc_count} documents from {index_dir}")
+    except Exception as e:
+        logger.error(f"Error during startup: {e}")
+
+    yield
+
+    index.close()
+
+
+app = FastAPI(title="Sylph Shard", lifespan=lifespan)
+
+
+@app.get("/shard/info")
+async def info():
+    index.refresh(min_interval=REFRESH_INTERVAL)
+    return {"index_dir": index_dir, "doc_count": index.doc_count, "version": index.version}
+
+
+@app.post("/shard/expand")
+async def expand(request: ExpandRequest):
+    index.refresh(min_interval=REFRESH_INTERVAL)
+    return {"version": index.version, "expansions": search_engine.prefix_candidates(request.query)}
+
+
+@app.post("/shard/stats")
+async def stats(request: StatsRequest):
+    index.refresh(min_interval=REFRESH_INTERVAL)
+    collection = search_engine.collection_statistics(request.query, request.expansions)
+    return {"version": index.version, "statistics": asdict(collection)}
+
+
+@app.post("/shard/search")
+async def search(request: ShardSearchRequest):
+    index.refresh(min_interval=REFRESH_INTERVAL)
+    collection = CollectionStatistics(**request.collection.model_dump()) if request.collection else None
+    scored_results = search_engine.search(request.query, request.limit, collection, expansions=request.expansions)
+    return {
+        "version": index.version,
+        "results": [
+            dict(result, doc_id=doc_score.doc_id)
+            for doc_score, result in zip(scored_results, render_results(index, scored_results))
+        ]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve one shard of a sharded index")
+    parser.add_argument('--index-dir', required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--log-level', default='warning')
+    args = parser.parse_args()
+
+    index_dir = args.index_dir
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
@@ -0,0 +1,48 @@
+"""Indexing throughput: sequential add_document vs the multiprocess bulk pipeline.
+
+    python benchmarks/bench_bulk_index.py [output.jsonl] [copies]
+
+The crawl output is replicated ``copies`` times (with distinct URLs) to get
+a corpus large enough for the process pool to amortise its startup.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+from index.src.bulk import bulk_index, iter_jsonl
+from index.src.indexer import InvertedIndex
+
+
+def corpus(path: str, copies: int):
+    items = list(iter_jsonl(path))
+    for copy in range(copies):
+        for item in items:
+            yield dict(item, url=f"{item['url']}#copy{copy}")
+
+
+def main(path: str, copies: int) -> None:
+    num_docs = sum(1 for _ in corpus(path, copies))
+    print(f"{num_docs} documents")
+    print(f"{'mode':<16}{'seconds':>10}{'docs/sec':>12}")
+
+    index = InvertedIndex()
+    start = time.perf_counter()
+    for item in corpus(path, copies):
+        index.add_document(url=item['url'], title=item['title'],
+                           meta_description=item['meta_description'], text=item['text'])
+    elapsed = time.perf_counter() - start
+    print(f"{'add_document':<16}{elapsed:>10.2f}{num_docs / elapsed:>12.1f}")
+
+    worker_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    for workers in worker_counts:
+        index = InvertedIndex()
+        start = time.perf_counter()
+        bulk_index(index, corpus(path, copies), workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"{f'bulk x{workers}':<16}{elapsed:>10.2f}{num_docs / elapsed:>12.1f}")
+
+
+if __name__ == '__main__':
+    default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'output.jsonl')
+    main(sys.argv[1] if len(sys.argv) > 1 else default_path,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -0,0 +1,127 @@
+"""Near-duplicate detection: accuracy, lookup cost and indexing savings.
+
+    python benchmarks/bench_dedup.py [pages] [threshold]
+
+A synthetic crawl of ``pages`` pages mixes distinct articles with the
+copies a same-domain crawl picks up: print views (the same text), tag and
+pagination pages (shared boilerplate around a few changed paragraphs).
+Reports precision and recall of the LSH lookup against exact shingle
+Jaccard similarity, the lookup time as the collection grows, and the
+documents, index size and time saved by indexing with deduplication.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import random
+import shutil
+import tempfile
+import time
+from index.src.bulk import bulk_index
+from index.src.dedup import NearDuplicateIndex, shingles
+from index.src.indexer import InvertedIndex
+
+
+def synthetic_crawl(pages: int, seed: int = 0):
+    rng = random.Random(seed)
+    # Alphabetic, numbered words are dropped by preprocessing
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9))) for _ in range(5000)]
+    boilerplate = ' '.join(rng.choice(vocabulary) for _ in range(60))
+
+    def paragraph(n=60):
+        return ' '.join(rng.choice(vocabulary) for _ in range(n))
+
+    items, originals = [], []
+    while len(items) < pages:
+        kind = rng.random()
+        if kind < 0.6 or not originals:
+            text = f"{boilerplate} {' '.join(paragraph() for _ in range(rng.randint(3, 8)))}"
+            originals.append(text)
+        elif kind < 0.75:
+            # Print view
+            text = rng.choice(originals)
+        else:
+            # Tag or pagination page: the same page with a small part changed
+            words = rng.choice(originals).split()
+            start = rng.randrange(len(words))
+            words[start:start + max(2, len(words) // 40)] = paragraph(max(2, len(words) // 40)).split()
+            text = ' '.join(words)
+        items.append({'url': f"https://example.com/page/{len(items)}", 'title': '', 'text': text})
+    return items
+
+
+def jaccard(a, b) -> float:
+    a, b = set(a.tolist()), set(b.tolist())
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def accuracy(items, threshold: float, sample: int = 1500) -> None:
+    items = items[:sample]
+    detector = NearDuplicateIndex(threshold=threshold)
+    found = {}
+    for item in items:
+        original = detector.check(item['url'], item['text'])
+        if original is not None:
+            found[item['url']] = original
+
+    # Brute force: a page is a true duplicate if any earlier page reaches the threshold
+    sets = [shingles(item['text']) for item in items]
+    truth = set()
+    for i in range(len(items)):
+        if any(jaccard(sets[i], sets[j]) >= threshold for j in range(i)):
+            truth.add(items[i]['url'])
+    true_positives = len(truth & set(found))
+    precision = true_positives / len(found) if found else 1.0
+    recall = true_positives / len(truth) if truth else 1.0
+    print(f"accuracy on {len(items)} pages at {threshold}: {len(truth)} true near-duplicates, "
+          f"{len(found)} found, precision {precision:.3f}, recall {recall:.3f}")
+
+
+def lookup_cost(items, threshold: float) -> None:
+    detector = NearDuplicateIndex(threshold=threshold)
+    checkpoints = {len(items) // 8, len(items) // 4, len(items) // 2, len(items)}
+    start = time.perf_counter()
+    window_start, window_count = start, 0
+    for i, item in enumerate(items, 1):
+        detector.check(item['url'], item['text'])
+        window_count += 1
+        if i in checkpoints:
+            now = time.perf_counter()
+            print(f"  {i:>7} pages: {(now - window_start) / window_count * 1e3:.3f} ms per lookup")
+            window_start, window_count = now, 0
+    print(f"  {detector.report()}")
+
+
+def index_size(index_dir: str) -> int:
+    return sum(os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir))
+
+
+def savings(items, threshold: float) -> None:
+    root = tempfile.mkdtemp()
+    try:
+        results = {}
+        for name, dedup in (('without dedup', None), ('with dedup', NearDuplicateIndex(threshold=threshold))):
+            index_dir = os.path.join(root, name.replace(' ', '_'))
+            index = InvertedIndex()
+            index.open(index_dir)
+            start = time.perf_counter()
+            added = bulk_index(index, items, workers=1, dedup=dedup)
+            index.flush()
+            seconds = time.perf_counter() - start
+            results[name] = (added, index_size(index_dir), seconds)
+            index.close()
+            print(f"{name}: {added} documents, {index_size(index_dir) / 1e6:.1f} MB on disk, {seconds:.1f}s")
+        (base_docs, base_bytes, base_seconds), (docs, size, seconds) = results['without dedup'], results['with dedup']
+        print(f"saved {1 - docs / base_docs:.1%} of documents, {1 - size / base_bytes:.1%} of index size, "
+              f"{1 - seconds / base_seconds:.1%} of indexing time")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else 0.85
+    items = synthetic_crawl(pages)
+    accuracy(items, threshold)
+    print("lookup cost:")
+    lookup_cost(items, threshold)
+    savings(items[:min(pages, 5000)], threshold)
@@ -0,0 +1,117 @@
+"""Page extraction throughput: CSS selector passes against the single-pass walker.
+
+    python benchmarks/bench_extract.py [fixtures] [processes]
+
+``fixtures`` is a directory of saved pages: ``*.html`` files, or a Scrapy
+HTTP cache (``.scrapy/httpcache``) whose ``response_body`` files are used.
+Without one, synthetic pages with navigation, scripts, comments and nested
+markup are generated. Every page is also checked to extract the same item
+both ways.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import random
+import time
+from scrapy.http import HtmlResponse
+from crawler.extract import ExtractorPool, extract
+
+
+def load_fixtures(root: str):
+    pages = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.endswith(('.html', '.htm')) or name == 'response_body':
+                with open(os.path.join(directory, name), 'rb') as f:
+                    pages.append(f.read())
+    return pages
+
+
+def synthetic_pages(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"word{i}" for i in range(2000)]
+
+    def sentence(n):
+        return ' '.join(rng.choice(words) for _ in range(n))
+
+    pages = []
+    for i in range(count):
+        nav = ''.join(f'<li><a href="/section/{j}">{sentence(2)}</a></li>' for j in range(30))
+        sections = []
+        for j in range(rng.randint(5, 15)):
+            paragraphs = ''.join(
+                f"<p>{sentence(rng.randint(20, 60))} <a href=\"/page/{rng.randrange(10_000)}\">{sentence(3)}</a> "
+                f"<em>{sentence(4)}</em> {sentence(10)}<!-- note --> {sentence(5)}</p>"
+                for _ in range(rng.randint(2, 6))
+            )
+            level = rng.randint(2, 4)
+            sections.append(f"<div class=\"section\"><h{level}>{sentence(5)}</h{level}>"
+                            f"<div><div>{paragraphs}</div></div><script>var x{j} = {{}};</script></div>")
+        pages.append((
+            f"<!DOCTYPE html><html><head><title> Page {i} {sentence(4)} </title>"
+            f"<meta name=\"description\" content=\"{sentence(15)}\"><meta name=\"keywords\" content=\"{sentence(5)}\">"
+            f"<style>body {{ color: black; }}</style><script>window.data = [1, 2, 3];</script></head>"
+            f"<body><nav><ul>{nav}</ul></nav><main><h1>{sentence(6)}</h1>{''.join(sections)}</main>"
+            f"<footer><p>{sentence(12)}</p></footer></body></html>"
+        ).encode('utf-8'))
+    return pages
+
+
+def selector_extract(response):
+    """What SylphSpider.parse extracted with CSS selectors"""
+    return {
+        'title': response.css('title::text').get('').strip(),
+        'text': ' '.join([
+            text.strip() for text in response.css('body *:not(script):not(style)::text').getall()
+            if text.strip() and not text.strip().startswith(('<', '[', '{'))
+        ]),
+        'meta_description': response.css('meta[name="description"]::attr(content)').get(''),
+        'meta_keywords': response.css('meta[name="keywords"]::attr(content)').get(''),
+        'headers': [h.strip() for h in response.css('h1::text, h2::text, h3::text').getall() if h.strip()],
+        'links': response.css('a::attr(href)').getall(),
+    }
+
+
+def walker_extract(response):
+    page = extract(response.selector.root)
+    return {
+        'title': page.title,
+        'text': page.text,
+        'meta_description': page.meta_description,
+        'meta_keywords': page.meta_keywords,
+        'headers': page.headers,
+        'links': page.links,
+    }
+
+
+def responses(pages):
+    return [HtmlResponse(url=f"https://example.com/page/{i}", body=body, encoding='utf-8') for i, body in enumerate(pages)]
+
+
+def timed(name, pages, run, size_mb):
+    start = time.perf_counter()
+    results = run()
+    seconds = time.perf_counter() - start
+    print(f"{name}: {len(pages) / seconds:,.0f} pages/s, {size_mb / seconds:.1f} MB/s")
+    return results
+
+
+if __name__ == '__main__':
+    fixtures = sys.argv[1] if len(sys.argv) > 1 else None
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    pages = load_fixtures(fixtures) if fixtures else synthetic_pages(500)
+    size_mb = sum(len(page) for page in pages) / 1e6
+    print(f"{len(pages)} pages, {size_mb:.1f} MB")
+
+    expected = timed("css selectors", pages, lambda: [selector_extract(r) for r in responses(pages)], size_mb)
+    actual = timed("single-pass walker", pages, lambda: [walker_extract(r) for r in responses(pages)], size_mb)
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    print(f"mismatching pages: {len(mismatches)}" + (f" (first: {mismatches[0]})" if mismatches else ""))
+
+    pool = ExtractorPool(processes)
+    pool.start()
+    texts = [response.text for response in responses(pages)]
+    [future.result() for future in [pool.submit(texts[0]) for _ in range(processes)]]  # warm up the workers
+    timed(f"walker in {processes} processes", pages,
+          lambda: [future.result() for future in [pool.submit(text) for text in texts]], size_mb)
+    pool.shutdown()
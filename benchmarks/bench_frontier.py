@@ -0,0 +1,156 @@
+"""Crawl frontier throughput, memory and duplicate ratio.
+
+    python benchmarks/bench_frontier.py [urls] [pages]
+
+First times the Frontier alone on ``urls`` synthetic URLs, a third of them
+duplicates in another spelling, and measures the Bloom filter's memory and
+false positive rate. Then crawls a local mock site of ``pages`` pages, whose
+links spell the same pages in different ways (fragments, parameter order,
+tracking parameters, trailing slashes), once with Scrapy's default scheduler
+and once with the frontier, and reports pages/sec and the duplicate ratio:
+the share of fetches that were a URL already fetched. The mock site serves
+``?lang=en&view=full`` as the same page, but that is a distinct URL to a
+crawler, so it counts as a page of its own here.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from crawler.frontier import BloomFilter, Frontier, canonicalize
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def spellings(path: str, rng: random.Random) -> str:
+    """One of the many URLs the same page is linked by"""
+    variant = rng.randrange(6)
+    if variant == 1:
+        return f"{path}#section-{rng.randrange(5)}"
+    if variant == 2:
+        return f"{path}/"
+    if variant == 3:
+        return f"{path}?utm_source=feed&utm_medium=rss"
+    if variant == 4:
+        return f"{path}?lang=en&view=full" if rng.random() < 0.5 else f"{path}?view=full&lang=en"
+    if variant == 5:
+        return path.replace('/page/', '/./page/')
+    return path
+
+
+def bench_frontier(num_urls: int) -> None:
+    rng = random.Random(0)
+    unique = num_urls * 2 // 3
+    urls = [f"https://host{i % 200}.example.com/page/{i}" for i in range(unique)]
+    urls += [spellings(rng.choice(urls), rng) for _ in range(num_urls - unique)]
+    rng.shuffle(urls)
+
+    frontier = Frontier(seen=BloomFilter(capacity=num_urls, error_rate=0.001), min_delay=0.0)
+    start = time.perf_counter()
+    added = sum(frontier.add(url) for url in urls)
+    add_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    popped = 0
+    while frontier.pop() is not None:
+        popped += 1
+    pop_seconds = time.perf_counter() - start
+
+    probes = 100_000
+    false_positives = sum(f"https://unseen.example.org/{i}" in frontier.seen for i in range(probes))
+    canonical_set_bytes = sum(sys.getsizeof(canonicalize(url)) for url in urls[:10_000]) * len(urls) / 10_000
+    print(f"frontier: {num_urls} URLs, {added} queued, {frontier.duplicates} duplicates "
+          f"({num_urls - unique} spelled differently)")
+    print(f"  add {num_urls / add_seconds:,.0f} URLs/s, pop {popped / pop_seconds:,.0f} URLs/s")
+    print(f"  seen set {frontier.seen.memory_bytes / 1e6:.2f} MB "
+          f"(a set of the canonical strings: ~{canonical_set_bytes / 1e6:.0f} MB), "
+          f"false positives {false_positives / probes:.4%}")
+
+
+class MockSite:
+    """Local site whose pages link to each other under many spellings"""
+
+    def __init__(self, pages: int, links: int = 4):
+        self.pages = pages
+        self.links = links
+        self.fetches = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = re.match(r'^/+(?:\./)?page/(\d+)', self.path)
+                if not match or int(match.group(1)) >= site.pages:
+                    self.send_error(404)
+                    return
+                page = int(match.group(1))
+                params = tuple(sorted(
+                    (key, value) for key, value in parse_qsl(urlsplit(self.path).query) if not key.startswith('utm_')
+                ))
+                site.fetches.append((page, params))
+                rng = random.Random(page)
+                targets = [(page * 7 + 1 + k * 13) % site.pages for k in range(site.links)] + [(page + 1) % site.pages]
+                anchors = ''.join(f'<a href="{spellings(f"/page/{target}", rng)}">page {target}</a> ' for target in targets)
+                body = (f"<html><head><title>Page {page}</title></head>"
+                        f"<body><p>Mock page {page} for the frontier benchmark.</p>{anchors}</body></html>").encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def crawl(site: MockSite, scheduler: str, depth: int) -> None:
+    site.fetches.clear()
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'items.jsonl')
+        settings = {
+            'SCHEDULER': scheduler,
+            'ITEM_PIPELINES': '{}',
+            'HTTPCACHE_ENABLED': 'False',
+            'DOWNLOAD_DELAY': '0',
+            'SYLPH_POLITENESS_MIN_DELAY': '0',
+            'DEPTH_LIMIT': str(depth),
+            'CONCURRENT_REQUESTS': '16',
+            'CONCURRENT_REQUESTS_PER_DOMAIN': '16',
+            'LOG_LEVEL': 'WARNING',
+        }
+        args = [sys.executable, '-m', 'scrapy', 'crawl', 'sylph_spider', '-a', f"start_urls={site.url}/page/0", '-O', output]
+        for key, value in settings.items():
+            args += ['-s', f"{key}={value}"]
+        start = time.perf_counter()
+        subprocess.run(args, cwd=PROJECT_DIR, check=True)
+        seconds = time.perf_counter() - start
+        with open(output, 'r', encoding='utf-8') as f:
+            items = [json.loads(line) for line in f if line.strip()]
+
+    fetched = len(site.fetches)
+    unique = len(set(site.fetches))
+    name = scheduler.rsplit('.', 1)[-1]
+    print(f"{name}: {fetched} fetches of {unique} pages, {len(items)} items, "
+          f"duplicate ratio {1 - unique / max(fetched, 1):.1%}, "
+          f"{fetched / seconds:.1f} fetches/s, {unique / seconds:.1f} new pages/s "
+          f"({seconds:.1f}s including Scrapy startup)")
+
+
+if __name__ == '__main__':
+    num_urls = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    bench_frontier(num_urls)
+
+    site = MockSite(pages)
+    for scheduler in ('scrapy.core.scheduler.Scheduler', 'crawler.scheduler.FrontierScheduler'):
+        crawl(site, scheduler, depth=8)
+    site.server.shutdown()
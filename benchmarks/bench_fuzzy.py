@@ -0,0 +1,97 @@
+"""Fuzzy term lookup: Levenshtein automaton over the sorted vocabulary against a full scan.
+
+    python benchmarks/bench_fuzzy.py [sizes] [queries]
+
+``sizes`` is a comma separated list of vocabulary sizes (default
+10000,100000,1000000). Queries are vocabulary words with one or two random
+edits. For each size and distance, reports the automaton's time per lookup,
+how many lookups fit the default 50 ms budget, and the full scan's time on
+a few of the queries, checking both find the same terms.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import random
+import time
+from index.src.fuzzy import FuzzyIndex, levenshtein
+from index.src.stats import IndexStatistics
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+BUDGET = 0.05
+
+
+def synthetic_vocabulary(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    # Lengths around those of stemmed English terms, with some shared prefixes
+    words = set()
+    roots = [''.join(rng.choice(LETTERS) for _ in range(rng.randint(2, 5))) for _ in range(max(1, size // 20))]
+    while len(words) < size:
+        if rng.random() < 0.5:
+            word = rng.choice(roots) + ''.join(rng.choice(LETTERS) for _ in range(rng.randint(1, 6)))
+        else:
+            word = ''.join(rng.choice(LETTERS) for _ in range(rng.randint(3, 12)))
+        words.add(word)
+    return {word: rng.randint(1, 1000) for word in words}
+
+
+def misspell(word: str, edits: int, rng: random.Random) -> str:
+    for _ in range(edits):
+        i = rng.randrange(len(word) + 1)
+        kind = rng.random()
+        if kind < 0.33 and len(word) > 1:
+            word = word[:i] + word[i + 1:]
+        elif kind < 0.66:
+            word = word[:i] + rng.choice(LETTERS) + word[i:]
+        else:
+            word = word[:i] + rng.choice(LETTERS) + word[i + 1:]
+    return word
+
+
+def full_scan(terms, word: str, max_distance: int):
+    found = {}
+    for term in terms:
+        if abs(len(term) - len(word)) <= max_distance:
+            distance = levenshtein(word, term)
+            if distance <= max_distance:
+                found[term] = distance
+    return found
+
+
+def run(size: int, queries: int, scans: int = 5) -> None:
+    doc_freq = synthetic_vocabulary(size)
+    statistics = IndexStatistics(generation=0, total_docs=size, total_tokens=0, doc_freq=doc_freq)
+    start = time.perf_counter()
+    fuzzy = FuzzyIndex(statistics)
+    print(f"{size:,} terms (sorted in {time.perf_counter() - start:.2f}s)")
+
+    rng = random.Random(1)
+    words = rng.sample(sorted(doc_freq), queries)
+    for max_distance in (1, 2):
+        lookups = [misspell(word, rng.randint(1, max_distance), rng) for word in words]
+        times, results, within_budget = [], [], 0
+        for word in lookups:
+            start = time.perf_counter()
+            found, finished = fuzzy.matches(word, max_distance, start + BUDGET)
+            times.append(time.perf_counter() - start)
+            results.append(found)
+            within_budget += finished
+        times.sort()
+        print(f"  k={max_distance} automaton: {sum(times) / len(times) * 1e3:.2f} ms mean, "
+              f"{times[len(times) // 2] * 1e3:.2f} ms median, {times[-1] * 1e3:.2f} ms max, "
+              f"{within_budget}/{len(lookups)} within {BUDGET * 1e3:.0f} ms, "
+              f"{sum(map(len, results)) / len(results):.1f} matches per lookup")
+
+        sample = lookups[:scans]
+        exact = [fuzzy.matches(word, max_distance)[0] for word in sample]
+        start = time.perf_counter()
+        scanned = [full_scan(fuzzy._terms, word, max_distance) for word in sample]
+        seconds = (time.perf_counter() - start) / len(sample)
+        mismatches = sum(a != b for a, b in zip(exact, scanned))
+        print(f"  k={max_distance} full scan: {seconds * 1e3:.1f} ms per lookup, {mismatches} mismatching results")
+
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10_000, 100_000, 1_000_000]
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    for size in sizes:
+        run(size, queries)
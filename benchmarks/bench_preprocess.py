@@ -0,0 +1,95 @@
+"""Preprocessing throughput and fast tokenizer agreement with word_tokenize.
+
+    python benchmarks/bench_preprocess.py [output.jsonl] [sample]
+
+Agreement is measured on the tokens preprocessing keeps (lowercased,
+alphabetic) over ``sample`` documents, and needs the NLTK punkt_tab data.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import json
+import time
+from collections import Counter
+from nltk.stem import PorterStemmer
+from index.src.preprocessor import TextPreprocessor, fast_tokenize, load_tokenizer
+
+
+def load_texts(path: str):
+    texts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                texts.extend([item.get('title', ''), item.get('meta_description', ''), item.get('text', '')])
+    return texts
+
+
+def words(tokens):
+    return [token for token in tokens if token.isalpha()]
+
+
+def agreement(texts) -> None:
+    try:
+        word_tokenize = load_tokenizer('nltk')
+        word_tokenize("warm up.")
+    except LookupError as e:
+        print(f"skipping agreement, NLTK data missing: {str(e).strip().splitlines()[0]}")
+        return
+
+    exact = matched = expected = produced = 0
+    differences = Counter()
+    for text in texts:
+        text = text.lower()
+        reference = Counter(words(word_tokenize(text)))
+        fast = Counter(words(fast_tokenize(text)))
+        exact += reference == fast
+        matched += sum((reference & fast).values())
+        expected += sum(reference.values())
+        produced += sum(fast.values())
+        differences.update({f"-{token}": n for token, n in (reference - fast).items()})
+        differences.update({f"+{token}": n for token, n in (fast - reference).items()})
+
+    print(f"texts identical   {exact / len(texts):.2%}")
+    print(f"token recall      {matched / max(expected, 1):.2%}")
+    print(f"token precision   {matched / max(produced, 1):.2%}")
+    print(f"top differences   {', '.join(f'{token} x{n}' for token, n in differences.most_common(10))}")
+
+
+class _UncachedPreprocessor(TextPreprocessor):
+    """Preprocessing as it was before the stem cache"""
+
+    def __init__(self, tokenizer: str):
+        super().__init__(tokenizer=tokenizer)
+        self.stem = PorterStemmer().stem
+
+
+def throughput(texts) -> None:
+    num_tokens = sum(len(tokens) for tokens in TextPreprocessor(tokenizer='fast').preprocess_many(texts))
+    print(f"\n{len(texts)} fields, {num_tokens} tokens after preprocessing")
+    print(f"{'mode':<24}{'seconds':>10}{'tokens/sec':>14}")
+
+    modes = [
+        ('nltk uncached', lambda: _UncachedPreprocessor('nltk')),
+        ('nltk cached', lambda: TextPreprocessor(tokenizer='nltk')),
+        ('fast uncached', lambda: _UncachedPreprocessor('fast')),
+        ('fast cached', lambda: TextPreprocessor(tokenizer='fast')),
+    ]
+    for name, make in modes:
+        try:
+            preprocessor = make()
+            start = time.perf_counter()
+            preprocessor.preprocess_many(texts)
+            elapsed = time.perf_counter() - start
+        except LookupError:
+            print(f"{name:<24}{'no NLTK data':>24}")
+            continue
+        print(f"{name:<24}{elapsed:>10.2f}{num_tokens / elapsed:>14.0f}")
+
+
+if __name__ == '__main__':
+    default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'output.jsonl')
+    texts = load_texts(sys.argv[1] if len(sys.argv) > 1 else default_path)
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    agreement(texts[:sample])
+    throughput(texts)
@@ -0,0 +1,70 @@
+"""Memory and latency comparison of the Trie reference and TermDictionary.
+
+    python benchmarks/bench_termdict.py [output.jsonl]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gc
+import json
+import random
+import re
+import time
+import tracemalloc
+from index.src.trie import Trie
+from index.src.termdict import TermDictionary
+
+TOKEN_RE = re.compile(r"[a-z]+")
+
+
+def load_corpus(path: str):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                yield item['url'], TOKEN_RE.findall(f"{item['title']} {item['text']}".lower())
+
+
+def build(dictionary_class, corpus):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    dictionary = dictionary_class()
+    for doc_id, tokens in corpus:
+        for position, token in enumerate(tokens):
+            dictionary.insert(token, doc_id, position)
+    elapsed = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dictionary, elapsed, memory
+
+
+def time_per_call(fn, args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best / len(args) * 1e6
+
+
+def main(path: str) -> None:
+    corpus = list(load_corpus(path))
+    vocabulary = sorted({token for _, tokens in corpus for token in tokens})
+    rng = random.Random(42)
+    lookups = rng.choices(vocabulary, k=2000)
+    prefixes = [term[:3] for term in rng.choices(vocabulary, k=200)]
+    print(f"{len(corpus)} documents, {len(vocabulary)} distinct terms")
+    print(f"{'backend':<16}{'build s':>10}{'memory KiB':>14}{'search us':>12}{'prefix us':>12}")
+
+    for dictionary_class in (Trie, TermDictionary):
+        dictionary, elapsed, memory = build(dictionary_class, corpus)
+        search_us = time_per_call(dictionary.search, lookups)
+        prefix_us = time_per_call(dictionary.starts_with, prefixes)
+        print(f"{dictionary_class.__name__:<16}{elapsed:>10.3f}{memory / 1024:>14.0f}{search_us:>12.2f}{prefix_us:>12.2f}")
+
+
+if __name__ == '__main__':
+    default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api', 'output.jsonl')
+    main(sys.argv[1] if len(sys.argv) > 1 else default_path)
@@ -0,0 +1,99 @@
+"""Exhaustive scoring vs WAND top-k latency for 1-5 term queries.
+
+TF-IDF is timed exhaustively and with WAND; BM25 and BM25F are timed with
+their vectorised batch scoring and per-document exhaustive scoring.
+
+    python benchmarks/bench_topk.py [num_docs] [k]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import random
+import time
+from index.src.indexer import InvertedIndex
+from index.src.search import SearchEngine
+from ranking.src.scoring import BM25FScorer, BM25Scorer, TFIDFScorer
+
+
+def synthetic_index(num_docs: int, vocab_size: int = 20000, doc_length: int = 200, seed: int = 7) -> InvertedIndex:
+    """Zipf-distributed documents inserted straight into the term dictionary"""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(vocab_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocab_size)]
+    index = InvertedIndex()
+    for n in range(num_docs):
+        tokens = rng.choices(vocabulary, weights=weights, k=doc_length)
+        doc_id = index.documents.add(f"https://example.com/{n}", tokens[0], "", " ".join(tokens), doc_length)
+        for position, token in enumerate(tokens):
+            index.terms.insert(token, doc_id, position)
+    index.generation += 1
+    return index
+
+
+class _PassthroughPreprocessor:
+    def preprocess(self, text: str):
+        return text.split()
+
+
+def main(num_docs: int, k: int) -> None:
+    index = synthetic_index(num_docs)
+    engine = SearchEngine(index, TFIDFScorer)
+    engine.preprocessor = _PassthroughPreprocessor()
+    batch_engines = {}
+    for scorer_class in (BM25Scorer, BM25FScorer):
+        batch_engines[scorer_class.__name__] = SearchEngine(index, scorer_class)
+        batch_engines[scorer_class.__name__].preprocessor = _PassthroughPreprocessor()
+
+    rng = random.Random(11)
+    queries_by_terms = {}
+    print(f"{num_docs} documents, k={k}")
+    print(f"{'terms':>6}{'exhaustive ms':>16}{'wand ms':>10}{'speedup':>10}{'scored %':>10}")
+    for num_terms in range(1, 6):
+        queries = [" ".join(f"term{rng.randint(0, 2000)}" for _ in range(num_terms)) for _ in range(50)]
+
+        start = time.perf_counter()
+        expected = [engine.search_exhaustive(query, k) for query in queries]
+        exhaustive = (time.perf_counter() - start) / len(queries)
+
+        start = time.perf_counter()
+        actual = [engine.search(query, k) for query in queries]
+        wand = (time.perf_counter() - start) / len(queries)
+
+        for want, got in zip(expected, actual):
+            assert [(d.doc_id, d.score) for d in want] == [(d.doc_id, d.score) for d in got]
+
+        scored = candidates = 0
+        score_document = engine._score_document
+        def counting_score(*args):
+            nonlocal scored
+            scored += 1
+            return score_document(*args)
+        engine._score_document = counting_score
+        for query in queries:
+            postings = engine._lookup(query.split())
+            candidates += len(set().union(*(p.doc_ids for p in postings.values()))) if postings else 0
+            engine.search(query, k)
+        engine._score_document = score_document
+
+        print(f"{num_terms:>6}{exhaustive * 1e3:>16.2f}{wand * 1e3:>10.2f}"
+              f"{exhaustive / wand:>10.1f}{100.0 * scored / max(1, candidates):>10.1f}")
+        queries_by_terms[num_terms] = queries
+
+    print(f"\n{'terms':>6}{'scorer':>14}{'per-doc ms':>13}{'batch ms':>11}{'speedup':>10}")
+    for num_terms, queries in queries_by_terms.items():
+        for name, batch_engine in batch_engines.items():
+            start = time.perf_counter()
+            for query in queries:
+                batch_engine.search_exhaustive(query, k)
+            per_doc = (time.perf_counter() - start) / len(queries)
+
+            start = time.perf_counter()
+            for query in queries:
+                batch_engine.search(query, k)
+            batch = (time.perf_counter() - start) / len(queries)
+            print(f"{num_terms:>6}{name:>14}{per_doc * 1e3:>13.2f}{batch * 1e3:>11.2f}{per_doc / batch:>10.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10)
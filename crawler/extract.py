@@ -0,0 +1,131 @@
+"""Single-pass HTML extraction.
+
+One ``lxml.etree.iterwalk`` over the parsed page collects what the spider
+used to get from six CSS selector passes: the visible text of the body
+(text nodes of elements other than script and style), the title, the
+description and keywords meta tags, h1-h3 text and link targets. The
+output matches the selectors'.
+
+Parsing and walking can be moved off the reactor thread into a process pool
+(``SYLPH_EXTRACT_PROCESSES``), since at high concurrency they are the
+crawler's CPU bottleneck.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+from lxml import etree, html
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+_SKIPPED = {'script', 'style'}
+_HEADINGS = {'h1', 'h2', 'h3'}
+_NOT_TEXT = ('<', '[', '{')
+
+
+@dataclass
+class Extraction:
+    title: str = ''
+    text: str = ''
+    meta_description: str = ''
+    meta_keywords: str = ''
+    headers: List[str] = field(default_factory=list)
+    links: List[str] = field(default_factory=list)
+
+
+def parse_html(text: str):
+    """Root element of a page, parsed the way Scrapy's selectors parse it"""
+    parser = html.HTMLParser(recover=True, encoding='utf-8', huge_tree=True)
+    return etree.fromstring(text.replace('\x00', '').encode('utf-8') or b'<html/>', parser=parser)
+
+
+def extract(root) -> Extraction:
+    """Walks the tree once, collecting text, title, meta, headings and links"""
+    result = Extraction()
+    if root is None:
+        return result
+    title = None
+    meta = {}
+    texts, headers, links = [], [], []
+    # (collects body text, is a heading) for every open element
+    stack = []
+    body_depth = 0
+
+    def add_text(text, parent):
+        if parent[0]:
+            stripped = text.strip()
+            if stripped and not stripped.startswith(_NOT_TEXT):
+                texts.append(stripped)
+        if parent[1]:
+            stripped = text.strip()
+            if stripped:
+                headers.append(stripped)
+
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event == 'start':
+            tag = element.tag
+            if not isinstance(tag, str):
+                stack.append((False, False))
+                continue
+            if tag == 'body':
+                body_depth += 1
+                state = (False, False)
+            else:
+                state = (body_depth > 0 and tag not in _SKIPPED, tag in _HEADINGS)
+                if tag == 'title':
+                    if title is None and element.text:
+                        title = element.text
+                elif tag == 'meta':
+                    name = element.get('name')
+                    if name in ('description', 'keywords') and name not in meta and element.get('content') is not None:
+                        meta[name] = element.get('content')
+                elif tag == 'a':
+                    href = element.get('href')
+                    if href is not None:
+                        links.append(href)
+            stack.append(state)
+            if element.text:
+                add_text(element.text, state)
+        elif event == 'end':
+            stack.pop()
+            if element.tag == 'body':
+                body_depth -= 1
+            if element.tail and stack:
+                add_text(element.tail, stack[-1])
+        elif element.tail and stack:
+            # Comments and processing instructions: only their tail is page text
+            add_text(element.tail, stack[-1])
+
+    result.title = (title or '').strip()
+    result.text = ' '.join(texts)
+    result.meta_description = meta.get('description', '')
+    result.meta_keywords = meta.get('keywords', '')
+    result.headers = headers
+    result.links = links
+    return result
+
+
+def extract_html(text: str) -> Extraction:
+    return extract(parse_html(text))
+
+
+class ExtractorPool:
+    """Process pool running parse_html + extract on page text"""
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        # forkserver: forking the crawler itself would copy the reactor's threads and locks
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('forkserver'))
+        logger.info(f"Extracting pages in {self.processes} processes")
+
+    def submit(self, text: str):
+        return self.executor.submit(extract_html, text)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,232 @@
+"""Crawl frontier: URL canonicalisation, a memory-bounded seen set and polite scheduling.
+
+URLs are deduplicated on their canonical form, so fragments, query
+parameter order, tracking parameters, default ports, dot segments and
+trailing slashes no longer make one page look like several. Seen URLs go
+into a Bloom filter, whose size is fixed by the expected URL count and
+false positive rate instead of growing with the crawl: ten million URLs at
+a 0.1% error rate take about 18 MB.
+
+Requests wait in one priority queue per host. A host becomes eligible again
+``delay`` seconds after its last request, and among eligible hosts the one
+with the best pending request goes first (higher priority, then lower
+depth). Each host's delay adapts to its response latency like Scrapy's
+AutoThrottle, and doubles on 429 and 503 responses.
+"""
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from w3lib.url import canonicalize_url
+import heapq
+import itertools
+import logging
+import math
+import os
+import re
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+_TRACKING_PARAMS = re.compile(r'^(?:utm_\w+|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|_ga|_hsenc|_hsmi)$', re.IGNORECASE)
+_BLOOM_HEADER = struct.Struct('<8sQII')
+_BLOOM_MAGIC = b'SYLPHBLM'
+
+
+def _remove_dot_segments(path: str) -> str:
+    segments: List[str] = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(segments) > 1:
+                segments.pop()
+        elif segment != '.':
+            segments.append(segment)
+    if path.endswith(('/.', '/..')):
+        segments.append('')
+    return '/'.join(segments)
+
+
+def canonicalize(url: str) -> str:
+    """Canonical form of an http(s) URL, used as its identity in the frontier"""
+    # Percent-encoding normalised and the fragment dropped
+    parts = urlsplit(canonicalize_url(url.strip()))
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port is None or port == _DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+
+    path = re.sub(r'/{2,}', '/', _remove_dot_segments(parts.path)) or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/') or '/'
+
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(key)
+    ))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+class BloomFilter:
+    """Fixed-size set membership with false positives at about ``error_rate`` when holding ``capacity`` keys"""
+
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = blake2b(key.encode('utf-8'), digest_size=16).digest()
+        # Double hashing: k positions from two independent 64-bit hashes
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> bool:
+        """Adds a key, returns whether it was (probably) not there yet"""
+        bits = self.bits
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def save(self, filepath: str) -> None:
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_BLOOM_HEADER.pack(_BLOOM_MAGIC, self.num_bits, self.num_hashes, self.count))
+            f.write(self.bits)
+        os.replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'BloomFilter':
+        with open(filepath, 'rb') as f:
+            magic, num_bits, num_hashes, count = _BLOOM_HEADER.unpack(f.read(_BLOOM_HEADER.size))
+            if magic != _BLOOM_MAGIC:
+                raise ValueError(f"{filepath} is not a Sylph Bloom filter")
+            bloom = cls.__new__(cls)
+            bloom.num_bits = num_bits
+            bloom.num_hashes = num_hashes
+            bloom.count = count
+            bloom.bits = bytearray(f.read())
+        bloom.capacity = round(num_bits * math.log(2) / num_hashes)
+        bloom.error_rate = 0.5 ** num_hashes
+        if len(bloom.bits) != (num_bits + 7) // 8:
+            raise ValueError(f"Truncated Bloom filter {filepath}")
+        return bloom
+
+
+@dataclass
+class HostQueue:
+    delay: float
+    queue: List[Tuple[int, int, int, Any]] = field(default_factory=list)
+    next_allowed: float = 0.0
+
+
+class Frontier:
+    def __init__(self, seen: Optional[BloomFilter] = None, min_delay: float = 1.0, max_delay: float = 60.0,
+                 target_concurrency: float = 1.0, clock=time.monotonic):
+        self.seen = seen if seen is not None else BloomFilter()
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.target_concurrency = target_concurrency
+        self.clock = clock
+        self.hosts: Dict[str, HostQueue] = {}
+        # Hosts with pending requests are in exactly one of these heaps
+        self._waiting: List[Tuple[float, str]] = []
+        self._eligible: List[Tuple[int, int, int, str]] = []
+        self._sequence = itertools.count()
+        self._size = 0
+        self.enqueued = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, url: str, item: Any = None, priority: int = 0, depth: int = 0, dont_filter: bool = False) -> bool:
+        """Queues ``item`` (the URL itself by default) unless its canonical URL was seen before"""
+        canonical = canonicalize(url)
+        if not self.seen.add(canonical) and not dont_filter:
+            self.duplicates += 1
+            return False
+
+        host = host_of(canonical)
+        queue = self.hosts.get(host)
+        if queue is None:
+            queue = self.hosts[host] = HostQueue(delay=self.min_delay)
+        if not queue.queue:
+            heapq.heappush(self._waiting, (max(queue.next_allowed, self.clock()), host))
+        heapq.heappush(queue.queue, (-priority, depth, next(self._sequence), url if item is None else item))
+        self._size += 1
+        self.enqueued += 1
+        return True
+
+    def _promote(self, now: float) -> None:
+        while self._waiting and self._waiting[0][0] <= now:
+            _, host = heapq.heappop(self._waiting)
+            negative_priority, depth, sequence, _ = self.hosts[host].queue[0]
+            heapq.heappush(self._eligible, (negative_priority, depth, sequence, host))
+
+    def pop(self) -> Optional[Any]:
+        """The best request of any host that may be fetched now, None if every host must wait"""
+        now = self.clock()
+        self._promote(now)
+        if not self._eligible:
+            return None
+        host = heapq.heappop(self._eligible)[3]
+        queue = self.hosts[host]
+        item = heapq.heappop(queue.queue)[3]
+        self._size -= 1
+        queue.next_allowed = now + queue.delay
+        if queue.queue:
+            heapq.heappush(self._waiting, (queue.next_allowed, host))
+        return item
+
+    def next_ready_in(self) -> Optional[float]:
+        """Seconds until a host becomes eligible, None when nothing is queued"""
+        if self._eligible:
+            return 0.0
+        if not self._waiting:
+            return None
+        return max(0.0, self._waiting[0][0] - self.clock())
+
+    def record_response(self, url: str, latency: Optional[float], status: int) -> None:
+        """Adapts a host's delay to how fast, and how willingly, it answers"""
+        queue = self.hosts.get(host_of(canonicalize(url)))
+        if queue is None:
+            return
+        if status in (429, 503):
+            queue.delay = min(self.max_delay, max(queue.delay, self.min_delay) * 2)
+        elif latency is not None:
+            target = latency / self.target_concurrency
+            delay = (queue.delay + target) / 2
+            # Errors are often fast, they must not speed the crawl up
+            if status >= 400:
+                delay = max(delay, queue.delay)
+            queue.delay = min(self.max_delay, max(self.min_delay, delay))
@@ -0,0 +1,122 @@
+import logging
+import os
+import time
+from typing import Optional
+from index.src.dedup import NearDuplicateIndex
+from index.src.indexer import InvertedIndex
+from index.src.merge import IndexMerger
+from index.src.metrics import REGISTRY, timed
+from index.src.shards import ShardedIndexWriter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'index', 'data')
+
+
+class IndexingPipeline:
+    """Indexes crawled pages as they arrive
+
+    Pages are buffered in memory and flushed as a small segment every
+    ``SYLPH_INDEX_FLUSH_ITEMS`` pages or ``SYLPH_INDEX_FLUSH_SECONDS`` seconds,
+    whichever comes first, so a running search API sees them within seconds.
+    Segments are compacted in a background thread as they accumulate. With
+    ``SYLPH_INDEX_SHARDS`` above one, the index directory is the root of a
+    sharded index and pages are routed to shards by URL. With
+    ``SYLPH_DEDUP_ENABLED``, near-duplicates of indexed pages (at
+    ``SYLPH_DEDUP_THRESHOLD`` estimated similarity) are not indexed. Stage
+    timings go to ``SYLPH_METRICS_DIR``, when set, for the API's /metrics.
+    """
+
+    def __init__(self, index_dir: str, flush_items: int, flush_seconds: float, num_shards: int = 1,
+                 dedup_threshold: Optional[float] = None, stats=None, metrics_dir: Optional[str] = None):
+        self.index_dir = index_dir
+        self.flush_items = flush_items
+        self.flush_seconds = flush_seconds
+        self.num_shards = num_shards
+        self.dedup_threshold = dedup_threshold
+        self.stats = stats
+        self.metrics_dir = metrics_dir
+        self.index = InvertedIndex()
+        self.dedup: Optional[NearDuplicateIndex] = None
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            index_dir=settings.get('SYLPH_INDEX_DIR') or DEFAULT_INDEX_DIR,
+            flush_items=settings.getint('SYLPH_INDEX_FLUSH_ITEMS', 50),
+            flush_seconds=settings.getfloat('SYLPH_INDEX_FLUSH_SECONDS', 5.0),
+            num_shards=settings.getint('SYLPH_INDEX_SHARDS', 1),
+            dedup_threshold=settings.getfloat('SYLPH_DEDUP_THRESHOLD', 0.85) if settings.getbool('SYLPH_DEDUP_ENABLED', True) else None,
+            stats=crawler.stats,
+            metrics_dir=settings.get('SYLPH_METRICS_DIR')
+        )
+
+    def open_spider(self, spider):
+        if self.metrics_dir:
+            REGISTRY.attach(self.metrics_dir)
+        if self.num_shards > 1:
+            self.index = ShardedIndexWriter(self.index_dir, self.num_shards)
+            self.merger = None
+        else:
+            self.index.open(self.index_dir)
+            self.merger = IndexMerger(self.index.directory, self.index.merge_policy)
+        if self.dedup_threshold is not None:
+            self.dedup = NearDuplicateIndex.open(self.index_dir, threshold=self.dedup_threshold)
+        logger.info(f"Indexing crawled pages into {self.index_dir}")
+
+    def is_indexed(self, url: str) -> bool:
+        index = self.index.shard_of(url) if isinstance(self.index, ShardedIndexWriter) else self.index
+        return index.get_document_by_url(url) is not None
+
+    def process_item(self, item, spider):
+        try:
+            if self.dedup is not None:
+                with timed('crawl.dedup'):
+                    original = self.dedup.check(item['url'], item.get('text', ''), live=self.is_indexed)
+                if self.stats is not None:
+                    self.stats.inc_value('dedup/checked', spider=spider)
+                if original is not None:
+                    if self.stats is not None:
+                        self.stats.inc_value('dedup/duplicates', spider=spider)
+                        self.stats.inc_value('dedup/bytes_skipped', len(item.get('text', '').encode('utf-8')), spider=spider)
+                    # A page that turned into a copy of another must not stay searchable in its old form
+                    self.index.delete_document(item['url'])
+                    return item
+
+            with timed('crawl.index'):
+                doc_id = self.index.add_document(
+                    url=item['url'],
+                    text=item.get('text', ''),
+                    title=item.get('title', ''),
+                    meta_description=item.get('meta_description', '')
+                )
+            if doc_id is not None:
+                self.pending += 1
+            if self.pending >= self.flush_items or time.monotonic() - self.last_flush >= self.flush_seconds:
+                self.flush()
+        except Exception as e:
+            logger.error(f"Error indexing {item.get('url')}: {str(e)}")
+        return item
+
+    def flush(self):
+        with timed('crawl.flush'):
+            if self.merger is None:
+                self.index.merge_in_background(self.index.flush())
+            elif self.index.flush():
+                self.merger.merge_in_background()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def close_spider(self, spider):
+        try:
+            self.flush()
+            if self.dedup is not None:
+                self.dedup.save()
+                logger.info(f"Near-duplicate detection: {self.dedup.report()}")
+            (self.merger or self.index).wait()
+        finally:
+            self.index.close()
+            REGISTRY.retire()
@@ -0,0 +1,95 @@
+import logging
+import os
+from typing import Optional
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.utils.job import job_dir
+from .frontier import BloomFilter, Frontier
+
+logger = logging.getLogger(__name__)
+
+
+class FrontierScheduler(BaseScheduler):
+    """Scrapy scheduler backed by the crawl Frontier
+
+    Replaces the fingerprint dupefilter and memory queues. The Bloom filter
+    of seen URLs is saved in ``JOBDIR`` when one is set, so a resumed crawl
+    skips pages it already fetched; pending requests are not persisted.
+    """
+
+    def __init__(self, crawler, frontier: Frontier, jobdir: Optional[str] = None):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.frontier = frontier
+        self.jobdir = jobdir
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        min_delay = settings.getfloat('SYLPH_POLITENESS_MIN_DELAY', settings.getfloat('DOWNLOAD_DELAY', 1.0))
+        frontier = Frontier(
+            seen=BloomFilter(
+                capacity=settings.getint('SYLPH_FRONTIER_CAPACITY', 10_000_000),
+                error_rate=settings.getfloat('SYLPH_FRONTIER_ERROR_RATE', 0.001)
+            ),
+            min_delay=min_delay,
+            max_delay=settings.getfloat('SYLPH_POLITENESS_MAX_DELAY', 60.0),
+            target_concurrency=settings.getfloat('SYLPH_POLITENESS_TARGET_CONCURRENCY', 1.0)
+        )
+        scheduler = cls(crawler, frontier, job_dir(settings))
+        crawler.signals.connect(scheduler.response_received, signal=signals.response_received)
+        return scheduler
+
+    def _seen_path(self) -> str:
+        return os.path.join(self.jobdir, 'frontier.bloom')
+
+    def open(self, spider):
+        self.spider = spider
+        if self.jobdir and os.path.exists(self._seen_path()):
+            try:
+                self.frontier.seen = BloomFilter.load(self._seen_path())
+                logger.info(f"Resuming with {len(self.frontier.seen)} seen URLs from {self._seen_path()}")
+            except Exception as e:
+                logger.error(f"Error loading seen URLs, starting afresh: {str(e)}")
+        return None
+
+    def close(self, reason):
+        if self.jobdir:
+            self.frontier.seen.save(self._seen_path())
+        self.stats.set_value('frontier/hosts', len(self.frontier.hosts), spider=self.spider)
+        self.stats.set_value('frontier/seen_bytes', self.frontier.seen.memory_bytes, spider=self.spider)
+        return None
+
+    def has_pending_requests(self) -> bool:
+        return len(self.frontier) > 0
+
+    def __len__(self) -> int:
+        return len(self.frontier)
+
+    def enqueue_request(self, request) -> bool:
+        added = self.frontier.add(
+            request.url, request,
+            priority=request.priority,
+            depth=request.meta.get('depth', 0),
+            dont_filter=request.dont_filter
+        )
+        self.stats.inc_value('frontier/enqueued' if added else 'frontier/duplicates', spider=self.spider)
+        return added
+
+    def next_request(self):
+        request = self.frontier.pop()
+        if request is not None:
+            self.stats.inc_value('frontier/dequeued', spider=self.spider)
+            return request
+
+        wait = self.frontier.next_ready_in()
+        if wait is not None:
+            # Every pending host is waiting out its delay; ask the engine back when one is ready
+            slot = getattr(self.crawler.engine, 'slot', None)
+            if slot is not None:
+                slot.nextcall.schedule(wait)
+        return None
+
+    def response_received(self, response, request, spider):
+        self.frontier.record_response(request.url, request.meta.get('download_latency'), response.status)
@@ -12,12 +12,29 @@ DOWNLOAD_DELAY = 1
 RANDOMIZE_DOWNLOAD_DELAY = True
 
 COOKIES_ENABLED = False
-ITEM_PIPELINES = {}
+ITEM_PIPELINES = {
+    'crawler.pipelines.IndexingPipeline': 300,
+}
+SYLPH_INDEX_FLUSH_ITEMS = 50
+SYLPH_INDEX_FLUSH_SECONDS = 5
+# Above 1, SYLPH_INDEX_DIR is the root of a sharded index (see index/src/shards.py)
+SYLPH_INDEX_SHARDS = 1
+# Pages this similar to an indexed one are not indexed (see index/src/dedup.py)
+SYLPH_DEDUP_ENABLED = True
+SYLPH_DEDUP_THRESHOLD = 0.85
 
 DEPTH_LIMIT = 2  # Adjust this value to control how deep the crawler goes
 DEPTH_PRIORITY = 1
-SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleLifoDiskQueue'
-SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.LifoMemoryQueue'
+
+# Canonical URL dedup, per-host politeness and priority ordering (see crawler/frontier.py)
+SCHEDULER = 'crawler.scheduler.FrontierScheduler'
+SYLPH_FRONTIER_CAPACITY = 10_000_000
+SYLPH_FRONTIER_ERROR_RATE = 0.001
+SYLPH_POLITENESS_MAX_DELAY = 60
+# Above 0, pages are parsed in this many worker processes (see crawler/extract.py)
+SYLPH_EXTRACT_PROCESSES = 0
+# Stage timings are shared here with the API's /metrics when set (see index/src/metrics.py)
+SYLPH_METRICS_DIR = None
 
 
 HTTPCACHE_ENABLED = True
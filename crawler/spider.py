@@ -1,7 +1,12 @@
 import scrapy
+from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.defer import Deferred
 from urllib.parse import urlparse
-from typing import Any, Generator
+from typing import Any, AsyncGenerator, Optional
 import logging
+from index.src.metrics import timed
+from .extract import Extraction, ExtractorPool, extract
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +28,49 @@ class SylphSpider(scrapy.Spider):
         if allowed_domains:
             self.allowed_domains = allowed_domains.split(',')
         else:
-            self.allowed_domains = [urlparse(url).netloc for url in self.start_urls]
+            # Hostnames only, the offsite filter ignores entries with a port
+            self.allowed_domains = [urlparse(url).hostname for url in self.start_urls]
+        self.extract_pool: Optional[ExtractorPool] = None
 
-    def parse(self, response: scrapy.http.Response) -> Generator[dict[str, Any], None,None]:
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(SylphSpider, cls).from_crawler(crawler, *args, **kwargs)
+        processes = crawler.settings.getint('SYLPH_EXTRACT_PROCESSES', 0)
+        if processes > 0:
+            spider.extract_pool = ExtractorPool(processes)
+            crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    def spider_closed(self, spider):
+        if self.extract_pool is not None:
+            self.extract_pool.shutdown()
+
+    async def extract(self, response: scrapy.http.Response) -> Extraction:
+        with timed('crawl.extract'):
+            return await self._extract(response)
+
+    async def _extract(self, response: scrapy.http.Response) -> Extraction:
+        if self.extract_pool is None:
+            return extract(response.selector.root)
+        if self.extract_pool.executor is None:
+            self.extract_pool.start()
+
+        # Imported here, the reactor must not be installed before Scrapy picks one
+        from twisted.internet import reactor
+        deferred = Deferred()
+
+        def resolve(future):
+            # Runs in the pool's management thread
+            error = future.exception()
+            if error is not None:
+                reactor.callFromThread(deferred.errback, error)
+            else:
+                reactor.callFromThread(deferred.callback, future.result())
+
+        self.extract_pool.submit(response.text).add_done_callback(resolve)
+        return await maybe_deferred_to_future(deferred)
+
+    async def parse(self, response: scrapy.http.Response) -> AsyncGenerator[dict[str, Any], None]:
         try:
             content_type = response.headers.get('Content-Type', b'').decode('utf-8').lower()
             if not ('text/html' in content_type or 'application/xhtml+xml' in content_type):
@@ -36,24 +81,19 @@ class SylphSpider(scrapy.Spider):
                 logger.warning(f"Skipping URL {response.url} due to status code {response.status}")
                 return
 
-            visible_text = ' '.join([
-                text.strip() for text in response.css('body *:not(script):not(style)::text').getall()
-                if text.strip() and not text.strip().startswith(('<', '[', '{'))  
-            ])
+            page = await self.extract(response)
+            visible_text = page.text
 
             if not visible_text:
                 logger.warning(f"No visible text content found at {response.url}")
                 return 
             content = {
                 'url': response.url,
-                'title': response.css('title::text').get('').strip(),
+                'title': page.title,
                 'text' : visible_text,
-                'meta_description': response.css('meta[name="description"]::attr(content)').get(''),
-                'meta_keywords': response.css('meta[name="keywords"]::attr(content)').get(''),
-                'headers' :[
-                    h.strip() for h in response.css('h1::text, h2::text, h3::text').getall()
-                    if h.strip()
-                ]
+                'meta_description': page.meta_description,
+                'meta_keywords': page.meta_keywords,
+                'headers': page.headers
             }
             # content = {
             #     'url': response.url,
@@ -62,14 +102,14 @@ class SylphSpider(scrapy.Spider):
             #     'meta_description': response.css('meta[name="description"]::attr(content)').get(''),
             #     'meta_keywords': response.css('meta[name="keywords"]::attr(content)').get('')
             # }
-            logger.info(f"Extracted {len(visible_text)} characters of text from {response.url}")
+            logger.debug(f"Extracted {len(visible_text)} characters of text from {response.url}")
             yield content
             
             current_depth = response.meta.get('depth', 0)
             if current_depth < self.settings.getint('DEPTH_LIMIT', 2):
                 base_domain = urlparse(response.url).netloc
                 
-                for link in response.css('a::attr(href)').getall():
+                for link in page.links:
                     try:
                         absolute_url = response.urljoin(link)
                         parsed_url = urlparse(absolute_url)
@@ -0,0 +1,207 @@
+"""Multiprocess bulk indexing of crawl output.
+
+Crawl items are streamed in batches from a JSON-lines file, or from the
+document stores of an existing index to re-index it. Each batch is
+tokenised and stemmed in a worker process, which returns a partial in-memory
+segment (document records plus a TermDictionary with batch-local doc IDs).
+Partials are merged into the InvertedIndex in batch order, so doc IDs are
+the same as when indexing the file sequentially.
+"""
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import json
+import logging
+import os
+from .dedup import NearDuplicateIndex
+from .directory import MANIFEST
+from .docstore import DocumentRecord
+from .indexer import InvertedIndex, tokenize_fields
+from .preprocessor import TextPreprocessor
+from .shards import ShardedIndexWriter, shard_dirs, shard_for
+from .termdict import TermDictionary
+
+logger = logging.getLogger(__name__)
+
+_preprocessor: Optional[TextPreprocessor] = None
+
+
+@dataclass
+class PartialSegment:
+    documents: List[DocumentRecord]
+    texts: List[str]
+    terms: TermDictionary
+    offsets: List[array]
+    word_forms: Dict[str, str]
+
+
+def _init_worker() -> None:
+    global _preprocessor
+    _preprocessor = TextPreprocessor()
+
+
+def index_batch(items: List[Dict], preprocessor: Optional[TextPreprocessor] = None) -> PartialSegment:
+    preprocessor = preprocessor or _preprocessor
+    partial = PartialSegment(documents=[], texts=[], terms=TermDictionary(), offsets=[], word_forms={})
+    for item in items:
+        title = item.get('title', '')
+        meta_description = item.get('meta_description', '')
+        text = item.get('text', '')
+        tokens, title_count, description_count, offsets, words = tokenize_fields(
+            preprocessor, title, meta_description, text)
+        if not tokens:
+            logger.warning(f"No tokens extracted from document {item.get('url')}")
+            continue
+
+        doc_id = len(partial.documents)
+        partial.documents.append(DocumentRecord(
+            item['url'], title, meta_description, 0, 0, len(tokens), title_count, description_count, len(offsets)
+        ))
+        partial.texts.append(text)
+        partial.offsets.append(offsets)
+        for position, token in enumerate(tokens):
+            partial.terms.insert(token, doc_id, position)
+        partial.word_forms.update(zip(words, tokens))
+    return partial
+
+
+def iter_jsonl(filepath: str) -> Iterator[Dict]:
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_index(index_dir: str) -> Iterator[Dict]:
+    """Live documents of an index, or of every shard of a sharded index, as crawl items"""
+    paths = [index_dir] if os.path.exists(os.path.join(index_dir, MANIFEST)) else shard_dirs(index_dir)
+    for path in paths:
+        index = InvertedIndex()
+        index.open(path)
+        try:
+            for segment in index.segments:
+                for local_id, (record, text) in enumerate(segment.documents.iter_texts()):
+                    if local_id not in segment.deleted:
+                        yield {'url': record.url, 'title': record.title,
+                               'meta_description': record.meta_description, 'text': text}
+        finally:
+            index.close()
+
+
+def iter_input(path: str) -> Iterator[Dict]:
+    return iter_index(path) if os.path.isdir(path) else iter_jsonl(path)
+
+
+def _batches(items: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def without_duplicates(items: Iterable[Dict], dedup: NearDuplicateIndex, indexed: Callable[[str], bool]) -> Iterator[Dict]:
+    """Items that are not near-duplicates of an indexed page or of an earlier item"""
+    # Earlier items may still be in a worker, not in the index yet
+    passed = set()
+
+    def live(url: str) -> bool:
+        return url in passed or indexed(url)
+
+    for item in items:
+        if dedup.check(item['url'], item.get('text', ''), live=live) is None:
+            passed.add(item['url'])
+            yield item
+
+
+def bulk_index(index: InvertedIndex,
+               items: Iterable[Dict],
+               workers: Optional[int] = None,
+               batch_size: int = 64,
+               dedup: Optional[NearDuplicateIndex] = None) -> int:
+    """Index crawl items with a process pool, returns the number of documents added"""
+    workers = workers or os.cpu_count() or 1
+    added = 0
+    if dedup is not None:
+        items = without_duplicates(items, dedup, lambda url: index.get_document_by_url(url) is not None)
+
+    if workers == 1:
+        for batch in _batches(items, batch_size):
+            partial = index_batch(batch, index.preprocessor)
+            added += index.add_partial(partial.documents, partial.texts, partial.terms, partial.offsets,
+                                       partial.word_forms)
+        return added
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # Bounded number of batches in flight keeps memory flat on large crawls
+        pending = deque()
+        for batch in _batches(items, batch_size):
+            pending.append(executor.submit(index_batch, batch))
+            if len(pending) >= workers * 2:
+                partial = pending.popleft().result()
+                added += index.add_partial(partial.documents, partial.texts, partial.terms, partial.offsets,
+                                           partial.word_forms)
+        while pending:
+            partial = pending.popleft().result()
+            added += index.add_partial(partial.documents, partial.texts, partial.terms, partial.offsets,
+                                       partial.word_forms)
+
+    logger.info(f"Bulk indexed {added} documents with {workers} workers")
+    return added
+
+
+def bulk_index_file(index: InvertedIndex, filepath: str, workers: Optional[int] = None, batch_size: int = 64,
+                    dedup: Optional[NearDuplicateIndex] = None) -> int:
+    return bulk_index(index, iter_input(filepath), workers=workers, batch_size=batch_size, dedup=dedup)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk index a crawl output file")
+    parser.add_argument('input', help="JSON-lines crawl output, or an index directory to re-index")
+    parser.add_argument('output', help="Index directory to add a segment to")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--shards', type=int, default=1,
+                        help="Write a sharded index with this many shards, routed by URL")
+    parser.add_argument('--dedup', type=float, default=None, metavar='THRESHOLD',
+                        help="Skip near-duplicates of indexed pages at this estimated similarity, e.g. 0.85")
+    args = parser.parse_args()
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error("re-index into a different directory than the input")
+
+    dedup = NearDuplicateIndex.open(args.output, threshold=args.dedup) if args.dedup is not None else None
+    if args.shards > 1:
+        writer = ShardedIndexWriter(args.output, args.shards)
+        kept = None
+        if dedup is not None:
+            # One pass in file order, near-duplicates can be in different shards
+            indexed = lambda url: writer.shard_of(url).get_document_by_url(url) is not None
+            kept = {item['url'] for item in without_duplicates(iter_input(args.input), dedup, indexed)}
+        count = 0
+        for shard, index in enumerate(writer.shards):
+            items = (
+                item for item in iter_input(args.input)
+                if shard_for(item['url'], args.shards) == shard and (kept is None or item['url'] in kept)
+            )
+            count += bulk_index(index, items, workers=args.workers, batch_size=args.batch_size)
+            index.flush()
+            index.merge()
+        writer.close()
+        print(f"Indexed {count} documents into {args.shards} shards under {args.output}")
+    else:
+        index = InvertedIndex()
+        index.open(args.output)
+        count = bulk_index_file(index, args.input, workers=args.workers, batch_size=args.batch_size, dedup=dedup)
+        index.save_index(args.output)
+        index.merge()
+        print(f"Indexed {count} documents into {args.output}")
+    if dedup is not None:
+        dedup.save()
+        print(f"Near-duplicates: {dedup.report()}")
@@ -0,0 +1,137 @@
+"""Search result caching.
+
+Results are cached per index version (see ``InvertedIndex.version``) and
+normalised query, so any change to the searchable documents makes old
+entries unreachable: the in-process LRU drops them on the first lookup
+with a new version, and Redis lets them expire through their TTL. Redis
+is shared by every API worker, whose versions agree when they serve the
+same index directory generation.
+"""
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+import json
+import logging
+import threading
+import time
+from ranking.src.scoring import DocumentScore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    errors: int = 0
+    invalidations: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return dict(asdict(self), hit_rate=self.hits / lookups if lookups else 0.0)
+
+
+class LRUCache:
+    """In-process cache bounded by entry count and entry age"""
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache:
+    """Cache shared between processes through Redis
+
+    Takes any client with redis-py's ``get`` and ``set(..., ex=)``, so tests
+    can pass an in-memory fake instead of a server connection.
+    """
+
+    def __init__(self, client, ttl: int = 60, prefix: str = 'sylph:search:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> 'RedisCache':
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key: str) -> Optional[List[DocumentScore]]:
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return [DocumentScore(**result) for result in json.loads(raw)]
+
+    def set(self, key: str, value: List[DocumentScore]) -> None:
+        results = [dict(asdict(result), positions=list(result.positions)) for result in value]
+        self.client.set(self.prefix + key, json.dumps(results), ex=self.ttl)
+
+    def invalidate(self) -> None:
+        # Keys carry the index version; entries of older versions expire on their own
+        pass
+
+
+class ResultCache:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LRUCache()
+        self.stats = CacheStats()
+        self.version: Optional[str] = None
+
+    @staticmethod
+    def key(version: str, scorer: str, query: str, limit: int) -> str:
+        return f"{version}|{scorer}|{limit}|{query}"
+
+    def get(self, version: str, key: str) -> Optional[List[DocumentScore]]:
+        if version != self.version:
+            self.version = version
+            self.backend.invalidate()
+            self.stats.invalidations += 1
+        try:
+            results = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {str(e)}")
+            self.stats.errors += 1
+            results = None
+        if results is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return results
+
+    def put(self, key: str, results: List[DocumentScore]) -> None:
+        try:
+            self.backend.set(key, results)
+        except Exception as e:
+            logger.warning(f"Result cache store failed: {str(e)}")
+            self.stats.errors += 1
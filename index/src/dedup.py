@@ -0,0 +1,197 @@
+"""Near-duplicate detection with MinHash and banded LSH.
+
+A page is fingerprinted by a MinHash signature of its word 5-gram shingles:
+``num_perm`` minimum hash values whose agreement rate between two pages
+estimates the Jaccard similarity of their shingle sets. The signature is
+cut into ``bands`` bands, and each band is a key into a hash table, so a
+lookup only compares against pages sharing at least one band instead of
+the whole collection. Candidates are kept when their estimated similarity
+reaches ``threshold``.
+
+With 128 hash values in 16 bands of 8, pages at 0.85 similarity become
+candidates 99% of the time and pages at 0.5 under 7% of the time.
+
+Signatures are saved in the index directory (``near_duplicates.mh``), so
+later crawls and bulk runs are deduplicated against what is already there.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import os
+import re
+import struct
+import zlib
+import numpy as np
+from .directory import IndexDirectory
+
+logger = logging.getLogger(__name__)
+
+SIGNATURES_FILE = 'near_duplicates.mh'
+# Shingles hashed at a time: 4 MB of uint64 with 128 hash functions
+SIGNATURE_CHUNK = 4096
+_HEADER = struct.Struct('<8sIIQ')
+_MAGIC = b'SYLPHMH1'
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_SHIFT = np.uint64(32)
+_WORD = re.compile(r'\w+')
+
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """32-bit hashes of the distinct word ``size``-grams of a text"""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.uint64, count=len(words))
+    # Polynomial hash of every window of ``size`` word hashes, wrapping at 64 bits
+    count = max(1, len(words) - size + 1)
+    grams = hashes[:count].copy()
+    for k in range(1, min(size, len(words))):
+        grams = grams * _MULTIPLIER + hashes[k:k + count]
+    return np.unique((grams ^ (grams >> _SHIFT)) & np.uint64(0xFFFFFFFF))
+
+
+class NearDuplicateIndex:
+    def __init__(self, num_perm: int = 128, bands: int = 16, threshold: float = 0.85, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        # Multiply-add-shift hashing of 32-bit keys: the top half of a * key + b (mod 2^64)
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(0, 1 << 64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.randint(0, 1 << 64, size=num_perm, dtype=np.uint64)
+        self.index_dir: Optional[str] = None
+
+        self.urls: List[Optional[str]] = []
+        self.signatures: List[np.ndarray] = []
+        self.ids: Dict[str, int] = {}
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+
+        self.checked = 0
+        self.duplicates = 0
+        self.bytes_skipped = 0
+        self.duplicate_of: Dict[str, str] = {}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        hashes = shingles(text)
+        if not len(hashes):
+            return None
+        # In chunks, a num_perm x shingles matrix for a whole large page would take tens of MB
+        minimum = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(hashes), SIGNATURE_CHUNK):
+            chunk = hashes[start:start + SIGNATURE_CHUNK]
+            permuted = (self._a[:, None] * chunk[None, :] + self._b[:, None]) >> _SHIFT
+            np.minimum(minimum, permuted.min(axis=1), out=minimum)
+        return minimum.astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find(self, signature: np.ndarray, exclude_url: Optional[str] = None,
+             live: Optional[Callable[[str], bool]] = None) -> Optional[Tuple[str, float]]:
+        """Most similar indexed page at or above the threshold, as (url, estimated similarity)"""
+        candidates = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        best = None
+        for doc in candidates:
+            url = self.urls[doc]
+            if url is None or url == exclude_url:
+                continue
+            similarity = float(np.count_nonzero(self.signatures[doc] == signature)) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[1]) and (live is None or live(url)):
+                best = (url, similarity)
+        return best
+
+    def add(self, url: str, signature: np.ndarray) -> None:
+        previous = self.ids.get(url)
+        if previous is not None:
+            # Bucket entries of the old version are skipped from now on
+            self.urls[previous] = None
+        doc = len(self.urls)
+        self.urls.append(url)
+        self.signatures.append(signature)
+        self.ids[url] = doc
+        for band, key in enumerate(self._band_keys(signature)):
+            self.buckets[band].setdefault(key, []).append(doc)
+
+    def check(self, url: str, text: str, live: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """URL of an indexed near-duplicate of this page, else records the page and returns None
+
+        ``live`` tells whether an indexed URL is still in the index, so pages
+        whose original was deleted since are not skipped.
+        """
+        self.checked += 1
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        match = self.find(signature, exclude_url=url, live=live)
+        if match is not None:
+            self.duplicates += 1
+            self.bytes_skipped += len(text.encode('utf-8'))
+            self.duplicate_of[url] = match[0]
+            logger.debug(f"{url} is a near-duplicate of {match[0]} ({match[1]:.2f})")
+            return match[0]
+        self.add(url, signature)
+        return None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def report(self) -> str:
+        ratio = self.duplicates / self.checked if self.checked else 0.0
+        return (f"{self.duplicates} of {self.checked} pages were near-duplicates ({ratio:.1%}), "
+                f"{self.bytes_skipped / 1e6:.1f} MB of text not indexed")
+
+    @classmethod
+    def open(cls, index_dir: str, **kwargs) -> 'NearDuplicateIndex':
+        """Detector for an index directory, with the signatures saved there"""
+        detector = cls(**kwargs)
+        detector.index_dir = index_dir
+        path = os.path.join(index_dir, SIGNATURES_FILE)
+        if os.path.exists(path):
+            try:
+                for url, signature in detector._read(path):
+                    detector.add(url, signature)
+                logger.info(f"Loaded {len(detector)} page signatures from {path}")
+            except Exception as e:
+                logger.error(f"Error loading page signatures, starting afresh: {str(e)}")
+        return detector
+
+    def _read(self, path: str) -> List[Tuple[str, np.ndarray]]:
+        with open(path, 'rb') as f:
+            magic, num_perm, bands, count = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a Sylph signature file")
+            if (num_perm, bands) != (self.num_perm, self.bands):
+                raise ValueError(f"{path} has {num_perm} hashes in {bands} bands, not {self.num_perm} in {self.bands}")
+            signatures = np.frombuffer(f.read(count * num_perm * 4), dtype=np.uint32).reshape(count, num_perm)
+            urls = f.read().decode('utf-8').split('\n') if count else []
+        if len(urls) != count:
+            raise ValueError(f"Truncated signature file {path}")
+        return list(zip(urls, signatures))
+
+    def save(self) -> None:
+        """Writes the signatures back, keeping pages other writers saved in the meantime"""
+        if self.index_dir is None:
+            raise ValueError("Detector is not attached to an index directory, use NearDuplicateIndex.open()")
+        directory = IndexDirectory(self.index_dir)
+        path = os.path.join(self.index_dir, SIGNATURES_FILE)
+        with directory.lock():
+            if os.path.exists(path):
+                known = set(self.ids)
+                for url, signature in self._read(path):
+                    if url not in known:
+                        self.add(url, signature)
+
+            live = [doc for doc, url in enumerate(self.urls) if url is not None]
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(_MAGIC, self.num_perm, self.bands, len(live)))
+                for doc in live:
+                    f.write(self.signatures[doc].tobytes())
+                f.write('\n'.join(self.urls[doc] for doc in live).encode('utf-8'))
+            os.replace(tmp_path, path)
+        logger.info(f"Saved {len(live)} page signatures to {path}")
@@ -0,0 +1,126 @@
+"""On-disk layout of a multi-segment index directory.
+
+    manifest.json       generation counter, next segment number and the live segments
+    <name>.seg          postings of one immutable segment (see segment.py)
+    <name>.docs         its document store (see docstore.py)
+    <name>.del          optional sorted u32 array of its deleted local doc IDs
+    near_duplicates.mh  optional MinHash signatures of indexed pages (see dedup.py)
+
+Segments never change once written; deletes only rewrite the small ``.del``
+sidecar. Writers in different processes (the API and the crawler's item
+pipeline) serialise manifest updates through an exclusive ``flock`` on
+``write.lock``, and always replace files atomically, so readers can pick
+up a new generation at any time without locking.
+"""
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, List, Set
+import fcntl
+import json
+import os
+
+MANIFEST = 'manifest.json'
+LOCK = 'write.lock'
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class SegmentInfo:
+    name: str
+    doc_count: int
+
+
+@dataclass
+class Manifest:
+    generation: int = 0
+    next_segment: int = 1
+    segments: List[SegmentInfo] = field(default_factory=list)
+
+    def new_segment_name(self) -> str:
+        name = f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+        return name
+
+
+class IndexDirectory:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def file(self, name: str, suffix: str) -> str:
+        return os.path.join(self.path, f"{name}{suffix}")
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, MANIFEST))
+
+    def manifest_mtime(self) -> float:
+        try:
+            return os.stat(os.path.join(self.path, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        with open(os.path.join(self.path, LOCK), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_manifest(self) -> Manifest:
+        path = os.path.join(self.path, MANIFEST)
+        if not os.path.exists(path):
+            return Manifest()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {data.get('version')} in {path}")
+        return Manifest(
+            generation=data['generation'],
+            next_segment=data['next_segment'],
+            segments=[SegmentInfo(**segment) for segment in data['segments']]
+        )
+
+    def write_manifest(self, manifest: Manifest) -> None:
+        path = os.path.join(self.path, MANIFEST)
+        data = {
+            'version': MANIFEST_VERSION,
+            'generation': manifest.generation,
+            'next_segment': manifest.next_segment,
+            'segments': [{'name': s.name, 'doc_count': s.doc_count} for s in manifest.segments]
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def read_deletes(self, name: str) -> Set[int]:
+        path = self.file(name, '.del')
+        if not os.path.exists(path):
+            return set()
+        deleted = array('I')
+        with open(path, 'rb') as f:
+            deleted.frombytes(f.read())
+        return set(deleted)
+
+    def delete_count(self, name: str) -> int:
+        try:
+            return os.stat(self.file(name, '.del')).st_size // array('I').itemsize
+        except FileNotFoundError:
+            return 0
+
+    def write_deletes(self, name: str, deleted: Set[int]) -> None:
+        path = self.file(name, '.del')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            array('I', sorted(deleted)).tofile(f)
+        os.replace(tmp_path, path)
+
+    def remove_segment_files(self, name: str) -> None:
+        for suffix in ('.seg', '.docs', '.sug', '.del'):
+            try:
+                os.remove(self.file(name, suffix))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,274 @@
+"""Document store mapping dense integer doc IDs to metadata and text.
+
+On-disk layout (little-endian):
+
+    header      magic, version, doc count, block index offset
+    records     per doc: varint-prefixed UTF-8 url, title, meta description,
+                then varint text offset, text length, token count, the
+                title and description token counts and the offset count
+    blocks      block count and total text stream length, then per block
+                its stream offset, file offset and compressed length,
+                followed by the zlib-compressed blocks
+
+The text stream holds, per doc, its UTF-8 text addressed by (offset,
+length), followed by offset count uint32 byte offsets of its body tokens.
+It is cut into blocks of about ``BLOCK_SIZE`` bytes at document boundaries
+and each block is compressed on its own, so reading a document decompresses
+one block; recently used blocks are cached.
+
+Metadata is decoded into memory on load; the blocks stay mmap'd. Token
+counts are used for length normalisation, per field for BM25F, and the token
+offsets for snippets. A document's tokens are its title, description and
+body tokens in that order.
+"""
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import mmap
+import os
+import struct
+import threading
+import zlib
+from .postings import decode_varint, encode_varint
+
+MAGIC = b'SYLPHDOC'
+VERSION = 5
+BLOCK_SIZE = 32 * 1024
+CACHED_BLOCKS = 16
+
+_HEADER = struct.Struct('<8sHHIQ')
+_OFFSET = struct.Struct('<I')
+_BLOCKS = struct.Struct('<IQ')
+_BLOCK = struct.Struct('<QQI')
+
+
+@dataclass
+class DocumentRecord:
+    url: str
+    title: str
+    meta_description: str
+    offset: int
+    length: int
+    token_count: int = 0
+    title_token_count: int = 0
+    description_token_count: int = 0
+    # Byte offsets of the body tokens stored after the text, 0 without
+    offset_count: int = 0
+
+    @property
+    def body_token_count(self) -> int:
+        return self.token_count - self.title_token_count - self.description_token_count
+
+
+def docstore_path(segment_path: str) -> str:
+    return f"{os.path.splitext(segment_path)[0]}.docs"
+
+
+def _encode_str(value: str, out: bytearray) -> None:
+    data = value.encode('utf-8')
+    encode_varint(len(data), out)
+    out += data
+
+
+def _decode_str(buf, pos: int):
+    length, pos = decode_varint(buf, pos)
+    return bytes(buf[pos:pos + length]).decode('utf-8'), pos + length
+
+
+class DocumentStore:
+    def __init__(self):
+        self.records: List[DocumentRecord] = []
+        self.url_to_id: Dict[str, int] = {}
+        self.token_counts = array('I')
+        self.title_token_counts = array('I')
+        self.description_token_counts = array('I')
+        self.total_tokens = 0
+        self._file = None
+        self._mm: Optional[mmap.mmap] = None
+        self._text_base = 0
+        self._buffer = bytearray()
+        # Loaded stores: stream offset, file offset and length of every block
+        self._block_starts = array('Q')
+        self._block_offsets = array('Q')
+        self._block_lengths = array('I')
+        self._blocks: OrderedDict = OrderedDict()
+        self._blocks_lock = threading.Lock()
+
+    def add(self, url: str, title: str = "", meta_description: str = "", text: str = "",
+            token_count: int = 0, title_token_count: int = 0, description_token_count: int = 0,
+            offsets: Sequence[int] = ()) -> int:
+        """Adds a document; ``offsets`` are the UTF-8 byte offsets of its body tokens in ``text``"""
+        doc_id = len(self.records)
+        data = text.encode('utf-8')
+        offset = self._text_base + len(self._buffer)
+        self._buffer += data
+        self._buffer += struct.pack(f'<{len(offsets)}I', *offsets)
+        self._append(DocumentRecord(url, title, meta_description, offset, len(data),
+                                    token_count, title_token_count, description_token_count, len(offsets)))
+        return doc_id
+
+    def _append(self, record: DocumentRecord) -> None:
+        self.url_to_id[record.url] = len(self.records)
+        self.records.append(record)
+        self.token_counts.append(record.token_count)
+        self.title_token_counts.append(record.title_token_count)
+        self.description_token_counts.append(record.description_token_count)
+        self.total_tokens += record.token_count
+
+    def get(self, doc_id: int) -> DocumentRecord:
+        return self.records[doc_id]
+
+    def text(self, doc_id: int) -> str:
+        record = self.records[doc_id]
+        return self._read(record.offset, record.length).decode('utf-8', errors='ignore')
+
+    def text_slice(self, doc_id: int, start: int, end: int) -> str:
+        """Text between two byte offsets"""
+        record = self.records[doc_id]
+        start = max(0, min(start, record.length))
+        end = max(start, min(end, record.length))
+        return self._read(record.offset + start, end - start).decode('utf-8', errors='ignore')
+
+    def token_offset(self, doc_id: int, position: int) -> int:
+        """Byte offset in the text where body token ``position`` starts"""
+        record = self.records[doc_id]
+        return _OFFSET.unpack(self._read(record.offset + record.length + position * _OFFSET.size, _OFFSET.size))[0]
+
+    def token_offsets(self, doc_id: int, positions: Optional[Iterable[int]] = None) -> List[int]:
+        """Byte offsets of the given body token positions, of all body tokens by default"""
+        if positions is None:
+            record = self.records[doc_id]
+            return list(struct.unpack(f'<{record.offset_count}I', self._read(record.offset + record.length,
+                                                                            record.offset_count * _OFFSET.size)))
+        return [self.token_offset(doc_id, position) for position in positions]
+
+    def iter_texts(self) -> Iterator[Tuple[DocumentRecord, str]]:
+        """Every document with its text, in doc ID order, decompressing each block once"""
+        for doc_id, record in enumerate(self.records):
+            yield record, self.text(doc_id)
+
+    def _block(self, i: int) -> bytes:
+        with self._blocks_lock:
+            block = self._blocks.get(i)
+            if block is not None:
+                self._blocks.move_to_end(i)
+                return block
+        offset = self._block_offsets[i]
+        block = zlib.decompress(self._mm[offset:offset + self._block_lengths[i]])
+        with self._blocks_lock:
+            self._blocks[i] = block
+            if len(self._blocks) > CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        return block
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if offset >= self._text_base:
+            start = offset - self._text_base
+            return bytes(self._buffer[start:start + length])
+        # Documents never straddle blocks
+        i = bisect_right(self._block_starts, offset) - 1
+        start = offset - self._block_starts[i]
+        return self._block(i)[start:start + length]
+
+    def _compressed_blocks(self) -> Iterator[Tuple[int, bytes]]:
+        """(stream offset, compressed data) of the text stream cut at document boundaries"""
+        block = bytearray()
+        block_start = 0
+        for record in self.records:
+            end = record.offset + record.length + record.offset_count * _OFFSET.size
+            if block and end - block_start > BLOCK_SIZE:
+                yield block_start, zlib.compress(bytes(block))
+                block = bytearray()
+                block_start = record.offset
+            block += self._read(record.offset, end - record.offset)
+        if block:
+            yield block_start, zlib.compress(bytes(block))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[DocumentRecord]:
+        return iter(self.records)
+
+    def save(self, filepath: str) -> None:
+        records = bytearray()
+        for record in self.records:
+            _encode_str(record.url, records)
+            _encode_str(record.title, records)
+            _encode_str(record.meta_description, records)
+            encode_varint(record.offset, records)
+            encode_varint(record.length, records)
+            encode_varint(record.token_count, records)
+            encode_varint(record.title_token_count, records)
+            encode_varint(record.description_token_count, records)
+            encode_varint(record.offset_count, records)
+
+        blocks = list(self._compressed_blocks())
+        text_length = self._text_base + len(self._buffer)
+        block_index = _HEADER.size + len(records)
+        offset = block_index + _BLOCKS.size + len(blocks) * _BLOCK.size
+
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, len(self.records), block_index))
+            f.write(records)
+            f.write(_BLOCKS.pack(len(blocks), text_length))
+            for start, data in blocks:
+                f.write(_BLOCK.pack(start, offset, len(data)))
+                offset += len(data)
+            for _, data in blocks:
+                f.write(data)
+        os.replace(tmp_path, filepath)
+
+    def load(self, filepath: str) -> None:
+        self.close()
+        self._file = open(filepath, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, doc_count, text_start = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{filepath} is not a Sylph document store")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported document store version {version} in {filepath}")
+
+        self.records = []
+        self.url_to_id = {}
+        self.token_counts = array('I')
+        self.title_token_counts = array('I')
+        self.description_token_counts = array('I')
+        self.total_tokens = 0
+        pos = _HEADER.size
+        for _ in range(doc_count):
+            url, pos = _decode_str(self._mm, pos)
+            title, pos = _decode_str(self._mm, pos)
+            meta_description, pos = _decode_str(self._mm, pos)
+            offset, pos = decode_varint(self._mm, pos)
+            length, pos = decode_varint(self._mm, pos)
+            token_count, pos = decode_varint(self._mm, pos)
+            title_token_count, pos = decode_varint(self._mm, pos)
+            description_token_count, pos = decode_varint(self._mm, pos)
+            offset_count, pos = decode_varint(self._mm, pos)
+            self._append(DocumentRecord(url, title, meta_description, offset, length,
+                                        token_count, title_token_count, description_token_count, offset_count))
+
+        self._buffer = bytearray()
+        block_count, self._text_base = _BLOCKS.unpack_from(self._mm, text_start)
+        for i in range(block_count):
+            start, offset, length = _BLOCK.unpack_from(self._mm, text_start + _BLOCKS.size + i * _BLOCK.size)
+            self._block_starts.append(start)
+            self._block_offsets.append(offset)
+            self._block_lengths.append(length)
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+            self._file = None
+        self._block_starts = array('Q')
+        self._block_offsets = array('Q')
+        self._block_lengths = array('I')
+        self._blocks.clear()
@@ -0,0 +1,167 @@
+"""Typo-tolerant term lookup: a Levenshtein automaton run over the sorted vocabulary.
+
+The automaton for a word and a maximum distance ``k`` is the classic
+dynamic programming row: its state after reading a string holds the edit
+distance from every prefix of the word to that string, capped at ``k + 1``.
+A state matches when the distance to the whole word is at most ``k``, and
+can still lead to a match while any entry is. Capped rows make the
+automaton finite, so a lookup builds it into a DFA as it goes and most
+steps are a dictionary lookup instead of a row computation.
+
+The sorted vocabulary is walked as an implicit trie: consecutive terms
+share their common prefix's states, so each prefix is read once, and as
+soon as a prefix's state can no longer match, every term starting with it
+is skipped with a binary search. A character that is not in the word
+moves the automaton no closer to a match than any other, so after a dead
+branch the walk seeks straight to the next branch starting with one of the
+word's characters that is still live. Only the branches of the term trie
+the automaton can reach are visited, instead of every term.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+import heapq
+import logging
+import time
+from .stats import IndexStatistics
+
+logger = logging.getLogger(__name__)
+
+_LAST_CHAR = '\U0010ffff'
+_DEAD = -1
+
+
+class LevenshteinAutomaton:
+    def __init__(self, word: str, max_distance: int):
+        self.word = word
+        self.max_distance = max_distance
+
+    def start(self) -> Tuple[int, ...]:
+        cap = self.max_distance + 1
+        return tuple(min(i, cap) for i in range(len(self.word) + 1))
+
+    def step(self, state: Sequence[int], char: str) -> Tuple[int, ...]:
+        word = self.word
+        cap = self.max_distance + 1
+        row = [min(state[0] + 1, cap)]
+        for i in range(len(word)):
+            cost = 0 if word[i] == char else 1
+            row.append(min(row[i] + 1, state[i + 1] + 1, state[i] + cost, cap))
+        return tuple(row)
+
+    def is_match(self, state: Sequence[int]) -> bool:
+        return state[-1] <= self.max_distance
+
+    def can_match(self, state: Sequence[int]) -> bool:
+        return min(state) <= self.max_distance
+
+
+def levenshtein(a: str, b: str) -> int:
+    automaton = LevenshteinAutomaton(a, len(a) + len(b))
+    state = automaton.start()
+    for char in b:
+        state = automaton.step(state, char)
+    return state[-1]
+
+
+def auto_distance(word: str, max_distance: int) -> int:
+    """Edits allowed for a word: none up to 2 characters, 1 up to 5, then ``max_distance``"""
+    if len(word) <= 2:
+        return 0
+    return min(max_distance, 1 if len(word) <= 5 else 2)
+
+
+class FuzzyIndex:
+    """Bounded edit distance lookup over one statistics snapshot's vocabulary"""
+
+    def __init__(self, statistics: IndexStatistics):
+        self.statistics = statistics
+        self.doc_freq = statistics.doc_freq
+        self._terms = sorted(self.doc_freq)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def matches(self, word: str, max_distance: int, deadline: Optional[float] = None) -> Tuple[Dict[str, int], bool]:
+        """Every term within ``max_distance`` edits of ``word`` with its distance, and whether the
+        lookup finished before ``deadline`` (a ``time.perf_counter`` value), else the matches so far
+        """
+        automaton = LevenshteinAutomaton(word, max_distance)
+        # The DFA built so far: rows by state number, their transitions and distances when accepting
+        rows = [automaton.start()]
+        numbers = {rows[0]: 0}
+        transitions: List[Dict[str, int]] = [{}]
+        distances = [rows[0][-1] if automaton.is_match(rows[0]) else None]
+
+        def advance(state: int, char: str) -> int:
+            row = automaton.step(rows[state], char)
+            if not automaton.can_match(row):
+                target = _DEAD
+            else:
+                target = numbers.get(row)
+                if target is None:
+                    target = numbers[row] = len(rows)
+                    rows.append(row)
+                    transitions.append({})
+                    distances.append(row[-1] if automaton.is_match(row) else None)
+            transitions[state][char] = target
+            return target
+
+        alphabet = sorted(set(word))
+        terms = self._terms
+        found: Dict[str, int] = {}
+        # states[i] is the state after reading the first i characters of ``previous``
+        states = [0]
+        previous = ''
+        i = 0
+        visited = 0
+        while i < len(terms):
+            visited += 1
+            if deadline is not None and not visited & 255 and time.perf_counter() > deadline:
+                return found, False
+            term = terms[i]
+            common = 0
+            limit = min(len(term), len(previous), len(states) - 1)
+            while common < limit and term[common] == previous[common]:
+                common += 1
+            del states[common + 1:]
+            previous = term
+
+            dead = None
+            for depth in range(common, len(term)):
+                char = term[depth]
+                state = transitions[states[depth]].get(char)
+                if state is None:
+                    state = advance(states[depth], char)
+                if state == _DEAD:
+                    dead = depth + 1
+                    break
+                states.append(state)
+            if dead is None:
+                distance = distances[states[-1]]
+                if distance is not None:
+                    found[term] = distance
+                i += 1
+            else:
+                # No term starting with term[:dead] can match, nor with any other character in its
+                # place unless it is in the word, so seek to the next of those that is still live
+                prefix, state = term[:dead - 1], states[dead - 1]
+                target = prefix + _LAST_CHAR
+                for char in alphabet[bisect_right(alphabet, term[dead - 1]):]:
+                    following = transitions[state].get(char)
+                    if following is None:
+                        following = advance(state, char)
+                    if following != _DEAD:
+                        target = prefix + char
+                        break
+                i = bisect_left(terms, target, i + 1)
+        return found, True
+
+    def lookup(self, word: str, max_distance: int, limit: int = 20,
+               deadline: Optional[float] = None) -> Tuple[List[Tuple[str, int]], bool]:
+        """Up to ``limit`` (term, distance) pairs, closest first, then most frequent, and whether
+        the lookup finished before ``deadline``
+        """
+        found, finished = self.matches(word, max_distance, deadline)
+        if not finished:
+            logger.debug(f"Fuzzy lookup of {word!r} ran out of time with {len(found)} matches")
+        return heapq.nsmallest(limit, found.items(), key=lambda item: (item[1], -self.doc_freq[item[0]], item[0])), finished
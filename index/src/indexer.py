@@ -1,79 +1,546 @@
-from collections import defaultdict
-from typing import Dict, List, Set
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Type
+from .directory import IndexDirectory, Manifest, SegmentInfo
+from .docstore import DocumentRecord, DocumentStore, docstore_path
+from .fuzzy import FuzzyIndex
+from .metrics import timed
+from .merge import IndexMerger, LogMergePolicy
+from .postings import PostingList
 from .preprocessor import TextPreprocessor
-from .trie import Trie, TrieNode
-import json
-import os
+from .segment import SegmentReader, is_segment, write_segment
+from .snippets import Snippet, make_snippet
+from .stats import DocumentFrequencies, IndexStatistics
+from .suggest import CompletionIndex, WordList, load_word_list, suggestions_path
+from .termdict import TermDictionary
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+
+def tokenize_fields(preprocessor: TextPreprocessor, title: str, meta_description: str,
+                    text: str) -> Tuple[List[str], int, int, array, List[str]]:
+    """Tokens of the title, description and body in that order, the title and description
+    counts, the byte offsets of the body tokens in ``text``, and every token's unstemmed word
+
+    Fields are tokenised separately so positions map back to their field.
+    """
+    words: List[str] = []
+    title_tokens, description_tokens = preprocessor.preprocess_many([title, meta_description], words)
+    body_tokens, offsets = preprocessor.preprocess_with_offsets(text, words)
+    tokens = title_tokens + description_tokens + body_tokens
+    return tokens, len(title_tokens), len(description_tokens), offsets, words
+
+
+def as_posting_list(postings) -> PostingList:
+    # The Trie reference backend keeps dict postings
+    if isinstance(postings, PostingList):
+        return postings
+    return PostingList.from_items(list(postings.items()))
+
+
+class MemorySegment:
+    """Documents added since the last flush, with segment-local doc IDs"""
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.documents = DocumentStore()
+        self.deleted: Set[int] = set()
+        # Unstemmed word -> term, for completions
+        self.word_forms: Dict[str, str] = {}
+
+    def search(self, term: str) -> PostingList:
+        return as_posting_list(self.terms.search(term))
+
+    def doc_freq(self, term: str) -> int:
+        # Kept up to date as documents are added, read at lookup time
+        return len(self.terms.search(term))
+
+    def vocabulary(self) -> Iterator[str]:
+        return iter(sorted(term for term, _ in self.terms.items()))
+
+    def word_list(self) -> WordList:
+        # Changes with every document, so built per statistics snapshot
+        return WordList.build(self.word_forms, self.doc_freq)
+
+
+class DiskSegment:
+    """An immutable, mmap'd segment with its document store and deletes"""
+
+    def __init__(self, name: str, segment_path: str):
+        self.name = name
+        self.path = segment_path
+        self.reader = SegmentReader(segment_path)
+        self.documents = DocumentStore()
+        try:
+            self.documents.load(docstore_path(segment_path))
+        except Exception:
+            self.reader.close()
+            raise
+        self.deleted: Set[int] = set()
+        self._word_list: Optional[WordList] = None
+
+    def search(self, term: str) -> PostingList:
+        return self.reader.search(term)
+
+    def doc_freq(self, term: str) -> int:
+        return self.reader.doc_freq(term)
+
+    def vocabulary(self) -> Iterator[str]:
+        return self.reader.terms()
+
+    def word_list(self) -> WordList:
+        if self._word_list is None:
+            self._word_list = load_word_list(self.path, self.reader)
+        return self._word_list
+
+    def close(self) -> None:
+        self.reader.close()
+        self.documents.close()
+
+
 class InvertedIndex:
-    def __init__(self):
-        self.trie = Trie()
+    """Multi-segment inverted index
+
+    New documents go into an in-memory segment; ``flush`` writes it out as an
+    immutable on-disk segment and records it in the index directory's
+    manifest. Doc IDs are global for one generation: each segment's local IDs
+    are offset by the number of documents in the segments before it.
+    Re-adding a URL deletes its previous version, wherever it lives.
+    """
+
+    def __init__(self, dictionary_class: Type = TermDictionary):
+        self.dictionary_class = dictionary_class
+        self.merge_policy = LogMergePolicy()
         self.preprocessor = TextPreprocessor()
-        self.doc_count = 0
+        self.directory: Optional[IndexDirectory] = None
+        self.segments: List[DiskSegment] = []
+        self.buffer = MemorySegment(dictionary_class())
+        self.generation = 0
+        self._bases = [0]
+        self._pending_deletes: Set[str] = set()
+        self._manifest_generation = -1
+        self._manifest_mtime = 0
+        self._last_refresh = 0.0
+        self._statistics: Optional[IndexStatistics] = None
+        # Totals and per-document lengths of the on-disk segments, summed once per refresh
+        self._segment_totals: Optional[Tuple[int, int, array, array, array]] = None
+        self._completions: Optional[CompletionIndex] = None
+        self._fuzzy: Optional[FuzzyIndex] = None
+
+    @property
+    def terms(self):
+        return self.buffer.terms
+
+    @property
+    def documents(self) -> DocumentStore:
+        return self.buffer.documents
+
+    @property
+    def doc_count(self) -> int:
+        return sum(len(segment.documents) - len(segment.deleted) for segment in self._all_segments())
 
-    def add_document(self, doc_id: str, text:str, title:str = "") -> None:
-        full_text = f"{title} {text}"
-        tokens = self.preprocessor.preprocess(text)
+    @property
+    def version(self) -> str:
+        """Identifies what searches see; equal across processes serving the same flushed generation"""
+        if self.directory is not None and not len(self.documents) and not self.buffer.deleted and not self._pending_deletes:
+            return f"{os.path.abspath(self.directory.path)}@{self._manifest_generation}"
+        return f"{os.getpid()}.{id(self)}@{self.generation}"
+
+    def _all_segments(self) -> list:
+        return self.segments + [self.buffer]
+
+    def _rebase(self) -> None:
+        bases = [0]
+        for segment in self.segments:
+            bases.append(bases[-1] + len(segment.documents))
+        self._bases = bases
+        self._segment_totals = None
+        self.generation += 1
+
+    def add_document(self, url: str, text: str, title: str = "", meta_description: str = "") -> Optional[int]:
+        with timed('index.tokenize'):
+            tokens, title_count, description_count, offsets, words = tokenize_fields(
+                self.preprocessor, title, meta_description, text)
 
         if not tokens:
-            print(f"Warning: No tokens extracted from document {doc_id}")
-            return
-        
-        for position, token in enumerate(tokens):
-            if token:
-                self.trie.insert(token, doc_id, position)
+            logger.warning(f"No tokens extracted from document {url}")
+            return None
+
+        with timed('index.add'):
+            self._delete_url(url)
+            local_id = self.documents.add(url, title, meta_description, text,
+                                          token_count=len(tokens),
+                                          title_token_count=title_count,
+                                          description_token_count=description_count,
+                                          offsets=offsets)
+            for position, token in enumerate(tokens):
+                if token:
+                    self.terms.insert(token, local_id, position)
+            self.buffer.word_forms.update(zip(words, tokens))
+
+        self.generation += 1
+        logger.debug(f"Indexed document {url}")
+        return self._bases[-1] + local_id
+
+    def add_partial(self, documents: List[DocumentRecord], texts: List[str], terms: TermDictionary,
+                    offsets: Optional[List[array]] = None, word_forms: Optional[Dict[str, str]] = None) -> int:
+        """Merge documents indexed elsewhere, whose postings use doc IDs 0..len(documents) - 1"""
+        doc_base = len(self.documents)
+        for i, (record, text) in enumerate(zip(documents, texts)):
+            self._delete_url(record.url)
+            self.documents.add(record.url, record.title, record.meta_description, text,
+                               token_count=record.token_count,
+                               title_token_count=record.title_token_count,
+                               description_token_count=record.description_token_count,
+                               offsets=offsets[i] if offsets is not None else ())
+
+        for term, postings in terms.items():
+            self.terms.add_postings(term, postings, doc_base)
+        if word_forms:
+            self.buffer.word_forms.update(word_forms)
+
+        self.generation += 1
+        return len(documents)
+
+    def delete_document(self, url: str) -> bool:
+        """Delete the live version of a URL, persisted on the next flush"""
+        if not self._delete_url(url):
+            return False
+        self.generation += 1
+        return True
+
+    def _delete_url(self, url: str) -> bool:
+        found = False
+        for segment in self._all_segments():
+            local_id = segment.documents.url_to_id.get(url)
+            if local_id is not None and local_id not in segment.deleted:
+                segment.deleted.add(local_id)
+                found = True
+                if segment is not self.buffer:
+                    self._pending_deletes.add(url)
+        return found
 
-        self.doc_count += 1
-        logger.info(f"Indexed document {doc_id}")
+    def _disk_totals(self) -> Tuple[int, int, array, array, array]:
+        totals = self._segment_totals
+        if totals is None:
+            doc_lengths = array('I')
+            title_lengths = array('I')
+            description_lengths = array('I')
+            total_docs = total_tokens = 0
+            for segment in self.segments:
+                doc_lengths.extend(segment.documents.token_counts)
+                title_lengths.extend(segment.documents.title_token_counts)
+                description_lengths.extend(segment.documents.description_token_counts)
+                total_docs += len(segment.documents)
+                total_tokens += segment.documents.total_tokens
+            totals = self._segment_totals = (total_docs, total_tokens, doc_lengths, title_lengths, description_lengths)
+        return totals
 
-    def save_index(self, filepath:str) -> None:
+    def statistics(self) -> IndexStatistics:
+        """Snapshot of the corpus statistics, rebuilt only when the index changes
+
+        The on-disk segments' totals are summed once per refresh and the
+        buffer's added on top. Document frequencies are looked up per term in
+        each segment's term index and the buffer's dictionary, never collected
+        for the whole vocabulary. Like doc frequencies, the totals include
+        deleted documents until their segment is rewritten, which keeps both
+        consistent with each other.
+        """
+        statistics = self._statistics
+        if statistics is not None and statistics.generation == self.generation:
+            return statistics
+
+        total_docs, total_tokens, doc_lengths, title_lengths, description_lengths = self._disk_totals()
+        buffered = self.buffer.documents
+        statistics = IndexStatistics(
+            generation=self.generation,
+            total_docs=total_docs + len(buffered),
+            total_tokens=total_tokens + buffered.total_tokens,
+            doc_freq=DocumentFrequencies(self._all_segments()),
+            doc_lengths=doc_lengths + buffered.token_counts,
+            title_lengths=title_lengths + buffered.title_token_counts,
+            description_lengths=description_lengths + buffered.description_token_counts
+        )
+        self._statistics = statistics
+        return statistics
+
+    def completions(self) -> CompletionIndex:
+        """Prefix completions for the current statistics snapshot
+
+        On-disk segments' word lists are written with them and loaded once;
+        only the buffer's is rebuilt when the index changes.
+        """
+        completions = self._completions
+        statistics = self.statistics()
+        if completions is None or completions.statistics is not statistics:
+            completions = self._completions = CompletionIndex(
+                statistics, [segment.word_list() for segment in self._all_segments()])
+        return completions
+
+    def expand_prefix(self, prefix: str, limit: int = 20) -> List[str]:
+        """Terms of the most frequent words starting with a prefix, at most ``limit``"""
+        return [term for _, term, _ in self.completions().complete(prefix, limit)]
+
+    def fuzzy(self) -> FuzzyIndex:
+        """Edit distance lookup for the current statistics snapshot, rebuilt only when the index changes"""
+        fuzzy = self._fuzzy
+        statistics = self.statistics()
+        if fuzzy is None or fuzzy.statistics is not statistics:
+            fuzzy = self._fuzzy = FuzzyIndex(statistics)
+        return fuzzy
+
+    def expand_fuzzy(self, term: str, max_distance: int, limit: int = 20,
+                     deadline: Optional[float] = None) -> Tuple[List[str], bool]:
+        """Terms within ``max_distance`` edits of a term, closest and most frequent first, and
+        whether they were all looked at before ``deadline``
+        """
+        matches, finished = self.fuzzy().lookup(term, max_distance, limit, deadline)
+        return [match for match, _ in matches], finished
+
+    def _locate(self, doc_id: int):
+        i = bisect_right(self._bases, doc_id) - 1
+        segment = self._all_segments()[i]
+        return segment, doc_id - self._bases[i]
+
+    def get_document(self, doc_id: int) -> DocumentRecord:
+        segment, local_id = self._locate(doc_id)
+        return segment.documents.get(local_id)
+
+    def document_text(self, doc_id: int) -> str:
+        segment, local_id = self._locate(doc_id)
+        return segment.documents.text(local_id)
+
+    def snippet(self, doc_id: int, positions: List[int], max_bytes: int = 300) -> Optional[Snippet]:
+        """Snippet of a document's text around the hits at ``positions``"""
+        segment, local_id = self._locate(doc_id)
+        return make_snippet(segment.documents, local_id, positions, max_bytes)
+
+    def _locate_url(self, url: str):
+        """(segment, local ID) of the live version of a URL, or None"""
+        for segment in reversed(self._all_segments()):
+            local_id = segment.documents.url_to_id.get(url)
+            if local_id is not None and local_id not in segment.deleted:
+                return segment, local_id
+        return None
+
+    def get_document_by_url(self, url: str) -> Optional[DocumentRecord]:
+        located = self._locate_url(url)
+        return located[0].documents.get(located[1]) if located is not None else None
+
+    def text_by_url(self, url: str) -> Optional[str]:
+        located = self._locate_url(url)
+        return located[0].documents.text(located[1]) if located is not None else None
+
+    def iter_documents(self) -> Iterator[Tuple[int, DocumentRecord]]:
+        """Live documents with their global doc IDs"""
+        for segment, base in zip(self._all_segments(), self._bases):
+            for local_id, record in enumerate(segment.documents):
+                if local_id not in segment.deleted:
+                    yield base + local_id, record
+
+    def lookup(self, token: str) -> PostingList:
+        """Live postings for a token across all segments, with global doc IDs
+
+        The result may be the in-memory segment's own list and must not be modified.
+        """
+        parts = []
+        for segment, base in zip(self._all_segments(), self._bases):
+            postings = segment.search(token)
+            if len(postings):
+                if segment.deleted:
+                    postings = postings.without(segment.deleted)
+                parts.append((postings, base))
+
+        if len(parts) == 1 and parts[0][1] == 0:
+            return parts[0][0]
+        merged = PostingList()
+        for postings, base in parts:
+            merged.extend(postings, base)
+        return merged
+
+    def open(self, index_dir: str) -> None:
+        """Attach to an index directory, adopting a single-file ``index.seg`` from older layouts"""
+        self.close()
+        self.directory = IndexDirectory(index_dir)
+        if not self.directory.exists():
+            with self.directory.lock():
+                if not self.directory.exists():
+                    manifest = Manifest()
+                    legacy = self.directory.file('index', '.seg')
+                    if os.path.exists(legacy) and os.path.exists(docstore_path(legacy)):
+                        reader = SegmentReader(legacy)
+                        manifest.segments.append(SegmentInfo('index', reader.doc_count))
+                        reader.close()
+                    self.directory.write_manifest(manifest)
+        self.refresh(force=True)
+
+    def refresh(self, force: bool = False, min_interval: float = 0.0) -> bool:
+        """Pick up segments and deletes written by other processes, returns whether anything changed"""
+        if self.directory is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_refresh < min_interval:
+            return False
+        self._last_refresh = now
+
+        mtime = self.directory.manifest_mtime()
+        if not force and mtime == self._manifest_mtime:
+            return False
+        for attempt in range(3):
+            manifest = self.directory.read_manifest()
+            self._manifest_mtime = mtime
+            if not force and manifest.generation == self._manifest_generation:
+                return False
+            try:
+                with timed('index.refresh'):
+                    segments = self._open_segments(manifest)
+                break
+            except FileNotFoundError:
+                # A merge committed after the manifest was read and removed its sources
+                if attempt == 2:
+                    raise
+                mtime = self.directory.manifest_mtime()
+
+        self.segments = segments
+        self._manifest_generation = manifest.generation
+        self._rebase()
+        # Re-apply deletes made here that are not on disk yet, to on-disk segments only:
+        # the buffer may hold the URL's new version
+        for url in self._pending_deletes:
+            for segment in self.segments:
+                local_id = segment.documents.url_to_id.get(url)
+                if local_id is not None:
+                    segment.deleted.add(local_id)
+        logger.info(f"Refreshed index to manifest generation {manifest.generation} ({len(segments)} segments)")
+        return True
+
+    def _open_segments(self, manifest: Manifest) -> List[DiskSegment]:
+        """Segments of a manifest, reusing open ones and closing those no longer listed"""
+        open_segments = {segment.name: segment for segment in self.segments}
+        opened = []
+        segments = []
         try:
-            index_data = self._serialize_trie(self.trie.root)
+            for info in manifest.segments:
+                segment = open_segments.pop(info.name, None)
+                if segment is None:
+                    segment = DiskSegment(info.name, self.directory.file(info.name, '.seg'))
+                    opened.append(segment)
+                segments.append(segment)
+        except Exception:
+            for segment in opened:
+                segment.close()
+            raise
 
-            with open(filepath, 'w', encoding="utf-8") as f:
-                json.dump(index_data, f, indent=2, ensure_ascii=False)
+        for segment in segments:
+            segment.deleted = self.directory.read_deletes(segment.name)
+        for segment in open_segments.values():
+            segment.close()
+        return segments
 
-            logger.info(f"Saved index with {len(index_data)} tokens to {filepath}")
+    def flush(self) -> Optional[str]:
+        """Write the in-memory segment and pending deletes, returns the new segment's name"""
+        if self.directory is None:
+            raise ValueError("Index is not attached to a directory, call open() or save_index() first")
+        if not len(self.documents) and not self._pending_deletes:
+            return None
 
-        except Exception as e:
-            logger.error(f"Error saving index: {str(e)}")
-            raise 
+        name = None
+        with self.directory.lock(), timed('index.flush'):
+            self.refresh()
+            manifest = self.directory.read_manifest()
+            urls = set(self._pending_deletes)
+
+            if len(self.documents):
+                name = manifest.new_segment_name()
+                segment_path = self.directory.file(name, '.seg')
+                write_segment(
+                    segment_path,
+                    ((term, as_posting_list(postings)) for term, postings in self.terms.items()),
+                    len(self.documents)
+                )
+                self.documents.save(docstore_path(segment_path))
+                self.buffer.word_list().save(suggestions_path(segment_path))
+                if self.buffer.deleted:
+                    self.directory.write_deletes(name, self.buffer.deleted)
+                # Newer versions replace older ones, including those flushed by other writers
+                urls.update(self.documents.url_to_id)
+
+            for segment in self.segments:
+                deleted = {segment.documents.url_to_id.get(url) for url in urls} - {None}
+                on_disk = self.directory.read_deletes(segment.name)
+                if not deleted <= on_disk:
+                    self.directory.write_deletes(segment.name, on_disk | deleted)
+
+            if name is not None:
+                manifest.segments.append(SegmentInfo(name, len(self.documents)))
+            manifest.generation += 1
+            self.directory.write_manifest(manifest)
+
+            self._pending_deletes.clear()
+            self.buffer = MemorySegment(self.dictionary_class())
+            self.refresh(force=True)
 
-    def load_index(self, filepath:str) -> None:
+        logger.info(f"Flushed segment {name} to {self.directory.path}")
+        return name
+
+    def merge(self) -> int:
+        """Compact segments according to the merge policy, returns the number of merges"""
+        if self.directory is None:
+            raise ValueError("Index is not attached to a directory, call open() or save_index() first")
+        merged = IndexMerger(self.directory, self.merge_policy).merge()
+        if merged:
+            self.refresh(force=True)
+        return merged
+
+    def save_index(self, index_dir: str) -> None:
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                index_data = json.load(f)
+            if self.directory is None or os.path.abspath(self.directory.path) != os.path.abspath(index_dir):
+                buffer = self.buffer
+                self.open(index_dir)
+                self.buffer = buffer
+                self._rebase()
+            self.flush()
+            logger.info(f"Saved index with {self.doc_count} documents to {index_dir}")
 
-            self.trie = Trie()
-            self._deserialize_trie(index_data)
+        except Exception as e:
+            logger.error(f"Error saving index: {str(e)}")
+            raise
 
-            logger.info(f"Loaded index with {len(self.trie)} tokens from {filepath}")
+    def load_index(self, path: str) -> None:
+        try:
+            if os.path.isdir(path):
+                self.open(path)
+            elif is_segment(path):
+                # A single pre-manifest segment, opened read-only
+                self.close()
+                self.segments = [DiskSegment(os.path.splitext(os.path.basename(path))[0], path)]
+                self._rebase()
+            else:
+                raise ValueError(
+                    f"{path} is not an index directory or binary segment, "
+                    "convert it with `python -m index.src.segment <index.json> <index.seg>`"
+                )
+            logger.info(f"Loaded index with {len(self.segments)} segments and {self.doc_count} documents from {path}")
         except Exception as e:
             logger.error(f"Error loading index: {str(e)}")
             raise
 
-    def _serialize_trie(self, node, prefix="") -> Dict:
-        result = {
-            "is_end": node.is_end,
-            "documents": dict(node.documents),
-            "children": {}
-        }
-
-        for char, child in node.children.items():
-            result["children"][char] = self._serialize_trie(child, prefix + char)
-
-        return result
-    
-    def _deserialize_trie(self, data: Dict, node=None) -> None:
-        if not node:
-            node = self.trie.root
-
-        node.is_end = data["is_end"]
-        node.documents = defaultdict(list, data["documents"])
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.directory = None
+        self._manifest_generation = -1
+        self._manifest_mtime = 0
+        self._rebase()
 
-        for char, child_data in data["children"].items():
-            node.children[char] = TrieNode()
-            self._deserialize_trie(child_data, node.children[char])
\ No newline at end of file
+    def __len__(self) -> int:
+        """Tokens indexed across live documents, the same unit for the buffer and on-disk segments"""
+        total = 0
+        for segment in self._all_segments():
+            token_counts = segment.documents.token_counts
+            total += segment.documents.total_tokens - sum(token_counts[local_id] for local_id in segment.deleted)
+        return total
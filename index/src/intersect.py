@@ -0,0 +1,151 @@
+"""Sorted-list intersection for multi-term and positional queries.
+
+Every intersection is driven by the shortest list, and the others are
+advanced with galloping (exponential) search. The cost is therefore roughly
+the rarest list's length times the log of the gaps skipped, not the sum of
+all list lengths. Positional checks only look at documents that survive
+the doc-level intersection.
+"""
+from array import array
+from bisect import bisect_left
+from heapq import heapify, heappop, heappush
+from typing import List, Sequence, Tuple
+from .postings import PostingList
+
+
+def gallop(values: Sequence[int], target: int, lo: int = 0) -> int:
+    """First index at or after ``lo`` whose value is >= target"""
+    n = len(values)
+    if lo >= n or values[lo] >= target:
+        return lo
+    step = 1
+    hi = lo + 1
+    while hi < n and values[hi] < target:
+        lo = hi
+        step *= 2
+        hi = lo + step
+    return bisect_left(values, target, lo + 1, min(hi, n))
+
+
+def intersect_sorted(lists: List[Sequence[int]]) -> array:
+    """Values present in every sorted list, intersecting the shortest lists first"""
+    if not lists:
+        return array('I')
+    lists = sorted(lists, key=len)
+    result = array('I', lists[0])
+    for other in lists[1:]:
+        if not result:
+            break
+        matches = array('I')
+        cursor = 0
+        for value in result:
+            cursor = gallop(other, value, cursor)
+            if cursor == len(other):
+                break
+            if other[cursor] == value:
+                matches.append(value)
+        result = matches
+    return result
+
+
+def difference_sorted(values: Sequence[int], excluded: Sequence[int]) -> array:
+    result = array('I')
+    cursor = 0
+    for value in values:
+        cursor = gallop(excluded, value, cursor)
+        if cursor == len(excluded) or excluded[cursor] != value:
+            result.append(value)
+    return result
+
+
+def union_sorted(lists: List[Sequence[int]]) -> array:
+    return array('I', sorted(set().union(*lists)))
+
+
+def intersect_doc_ids(postings: List[PostingList]) -> List[Tuple[int, List[int]]]:
+    """Doc IDs present in every posting list, with the doc's index in each list"""
+    if not postings or not all(len(results) for results in postings):
+        return []
+    order = sorted(range(len(postings)), key=lambda i: len(postings[i]))
+    driver, others = order[0], order[1:]
+    cursors = [0] * len(postings)
+    matches = []
+    for j, doc_id in enumerate(postings[driver].doc_ids):
+        indexes = [0] * len(postings)
+        indexes[driver] = j
+        for i in others:
+            doc_ids = postings[i].doc_ids
+            cursor = cursors[i] = gallop(doc_ids, doc_id, cursors[i])
+            if cursor == len(doc_ids):
+                return matches
+            if doc_ids[cursor] != doc_id:
+                break
+            indexes[i] = cursor
+        else:
+            matches.append((doc_id, indexes))
+    return matches
+
+
+def restrict(postings: PostingList, doc_ids: Sequence[int]) -> PostingList:
+    """Postings of the given sorted doc IDs only"""
+    indexes = []
+    if len(doc_ids) < len(postings):
+        cursor = 0
+        for doc_id in doc_ids:
+            cursor = gallop(postings.doc_ids, doc_id, cursor)
+            if cursor == len(postings):
+                break
+            if postings.doc_ids[cursor] == doc_id:
+                indexes.append(cursor)
+    else:
+        cursor = 0
+        for i, doc_id in enumerate(postings.doc_ids):
+            cursor = gallop(doc_ids, doc_id, cursor)
+            if cursor == len(doc_ids):
+                break
+            if doc_ids[cursor] == doc_id:
+                indexes.append(i)
+    # Positions stay undecoded unless the scorer reads them
+    return postings.subset(indexes)
+
+
+def phrase_starts(positions: List[Sequence[int]]) -> array:
+    """Positions where ``positions[i]`` contains start + i for every i"""
+    starts = array('I')
+    if not all(len(p) for p in positions):
+        return starts
+    driver = min(range(len(positions)), key=lambda i: len(positions[i]))
+    cursors = [0] * len(positions)
+    for position in positions[driver]:
+        start = position - driver
+        if start < 0:
+            continue
+        for i, candidates in enumerate(positions):
+            if i == driver:
+                continue
+            cursor = cursors[i] = gallop(candidates, start + i, cursors[i])
+            if cursor == len(candidates):
+                return starts
+            if candidates[cursor] != start + i:
+                break
+        else:
+            starts.append(start)
+    return starts
+
+
+def min_window_span(positions: List[Sequence[int]]) -> int:
+    """Smallest max - min over windows holding one position from every list, -1 if a list is empty"""
+    if not all(len(p) for p in positions):
+        return -1
+    heap = [(p[0], i, 0) for i, p in enumerate(positions)]
+    heapify(heap)
+    hi = max(p[0] for p in positions)
+    best = hi - heap[0][0]
+    while True:
+        lo, i, j = heappop(heap)
+        best = min(best, hi - lo)
+        if best == len(positions) - 1 or j + 1 == len(positions[i]):
+            return best
+        position = positions[i][j + 1]
+        hi = max(hi, position)
+        heappush(heap, (position, i, j + 1))
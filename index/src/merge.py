@@ -0,0 +1,242 @@
+"""Log-structured merging of index segments.
+
+Flushes add small segments, so without compaction the number of segments a
+query fans out to grows with the corpus. ``LogMergePolicy`` groups adjacent
+segments by size level (log base ``merge_factor`` of their live doc count)
+and merges ``merge_factor`` segments of the same level into one of the next
+level, so every document is rewritten O(log N) times in total and the
+segment count stays logarithmic. Segments with many deleted documents are
+rewritten on their own to purge them.
+
+Merges read immutable segments without holding the directory lock and
+commit under it: deletes that arrived in the meantime are carried over to
+the merged segment, and the merge is abandoned if another writer already
+merged one of its sources.
+"""
+from array import array
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator, List, Optional, Set, Tuple
+import heapq
+import logging
+import math
+import threading
+from .directory import IndexDirectory, SegmentInfo
+from .docstore import DocumentStore, docstore_path
+from .metrics import timed
+from .postings import PostingList
+from .segment import SegmentReader, write_segment
+from .suggest import WordList, load_word_list, suggestions_path
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LogMergePolicy:
+    merge_factor: int = 10
+    # Segments below this many live docs all count as the lowest level
+    min_merge_docs: int = 1000
+    # Larger segments are only rewritten to purge deletes
+    max_merge_docs: int = 5_000_000
+    # Fraction of deleted docs that gets a segment rewritten on its own
+    max_deleted_ratio: float = 0.3
+
+    def _level(self, live_docs: int) -> int:
+        return int(math.log(max(live_docs, self.min_merge_docs) / self.min_merge_docs, self.merge_factor))
+
+    def find_merges(self, segments: List[Tuple[SegmentInfo, int]]) -> List[List[str]]:
+        """Groups of adjacent segment names to merge, given each segment and its delete count"""
+        merges = []
+        run: List[str] = []
+        run_level = None
+        for info, deleted in segments:
+            live_docs = info.doc_count - deleted
+            level = self._level(live_docs) if live_docs < self.max_merge_docs else None
+            if level != run_level:
+                run, run_level = [], level
+            if level is not None:
+                run.append(info.name)
+                if len(run) == self.merge_factor:
+                    merges.append(run)
+                    run, run_level = [], None
+
+        merging = {name for merge in merges for name in merge}
+        for info, deleted in segments:
+            if info.name not in merging and info.doc_count and deleted / info.doc_count >= self.max_deleted_ratio:
+                merges.append([info.name])
+        return merges
+
+
+def _doc_maps(stores: List[DocumentStore], deletes: List[Set[int]]) -> List[array]:
+    """New doc ID of every source document, -1 for deleted ones"""
+    doc_maps = []
+    next_id = 0
+    for store, deleted in zip(stores, deletes):
+        doc_map = array('i')
+        for local_id in range(len(store)):
+            if local_id in deleted:
+                doc_map.append(-1)
+            else:
+                doc_map.append(next_id)
+                next_id += 1
+        doc_maps.append(doc_map)
+    return doc_maps
+
+
+def _tagged(reader: SegmentReader, i: int) -> Iterator[Tuple[str, int, PostingList]]:
+    for term, postings in reader.items():
+        yield term, i, postings
+
+
+def _merged_postings(readers: List[SegmentReader], doc_maps: List[array]) -> Iterator[Tuple[str, PostingList]]:
+    streams = [_tagged(reader, i) for i, reader in enumerate(readers)]
+    for term, group in groupby(heapq.merge(*streams, key=itemgetter(0, 1)), key=itemgetter(0)):
+        merged = PostingList()
+        for _, i, postings in group:
+            doc_map = doc_maps[i]
+            for j, doc_id in enumerate(postings.doc_ids):
+                new_id = doc_map[doc_id]
+                if new_id >= 0:
+                    merged.append(new_id, postings.positions_at(j))
+        if len(merged):
+            yield term, merged
+
+
+class IndexMerger:
+    def __init__(self, directory: IndexDirectory, policy: Optional[LogMergePolicy] = None):
+        self.directory = directory
+        self.policy = policy or LogMergePolicy()
+        self._thread: Optional[threading.Thread] = None
+
+    def find_merges(self) -> List[List[str]]:
+        manifest = self.directory.read_manifest()
+        return self.policy.find_merges([
+            (info, self.directory.delete_count(info.name)) for info in manifest.segments
+        ])
+
+    def merge(self) -> int:
+        """Run merges until the policy is satisfied, returns the number of merges committed"""
+        committed = 0
+        while True:
+            merges = self.find_merges()
+            if not merges:
+                return committed
+            progress = False
+            for names in merges:
+                with timed('index.merge'):
+                    merged = self.merge_segments(names)
+                if merged:
+                    committed += 1
+                    progress = True
+            if not progress:
+                return committed
+
+    def _reserve_name(self) -> str:
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            name = manifest.new_segment_name()
+            self.directory.write_manifest(manifest)
+        return name
+
+    def merge_segments(self, names: List[str]) -> bool:
+        """Merge the named segments into a new one, returns False if the merge was abandoned"""
+        target = self._reserve_name()
+        readers, stores, deletes = [], [], []
+        word_forms = {}
+        try:
+            for name in names:
+                segment_path = self.directory.file(name, '.seg')
+                readers.append(SegmentReader(segment_path))
+                word_list = load_word_list(segment_path, readers[-1])
+                word_forms.update(zip(word_list.words, word_list.terms))
+                store = DocumentStore()
+                store.load(docstore_path(segment_path))
+                stores.append(store)
+                deletes.append(self.directory.read_deletes(name))
+
+            doc_maps = _doc_maps(stores, deletes)
+            merged_store = DocumentStore()
+            for store, doc_map in zip(stores, doc_maps):
+                for local_id, record in enumerate(store):
+                    if doc_map[local_id] >= 0:
+                        merged_store.add(record.url, record.title, record.meta_description, store.text(local_id),
+                                         token_count=record.token_count,
+                                         title_token_count=record.title_token_count,
+                                         description_token_count=record.description_token_count,
+                                         offsets=store.token_offsets(local_id))
+
+            target_path = self.directory.file(target, '.seg')
+            write_segment(target_path, _merged_postings(readers, doc_maps), len(merged_store))
+            merged_store.save(docstore_path(target_path))
+            # Words whose term was only in purged documents drop out
+            merged_reader = SegmentReader(target_path)
+            try:
+                WordList.build(word_forms, merged_reader.doc_freq).save(suggestions_path(target_path))
+            finally:
+                merged_reader.close()
+        except Exception as e:
+            logger.error(f"Error merging segments {names}: {str(e)}")
+            self.directory.remove_segment_files(target)
+            raise
+        finally:
+            for reader in readers:
+                reader.close()
+            for store in stores:
+                store.close()
+
+        if not self._commit(names, target, len(merged_store), doc_maps, deletes):
+            self.directory.remove_segment_files(target)
+            logger.info(f"Abandoned merge of {names}, the segments were merged elsewhere")
+            return False
+
+        for name in names:
+            self.directory.remove_segment_files(name)
+        if not len(merged_store):
+            self.directory.remove_segment_files(target)
+        logger.info(f"Merged {len(names)} segments into {target} ({len(merged_store)} documents)")
+        return True
+
+    def _commit(self, names: List[str], target: str, doc_count: int,
+                doc_maps: List[array], purged: List[Set[int]]) -> bool:
+        with self.directory.lock():
+            manifest = self.directory.read_manifest()
+            current = [info.name for info in manifest.segments]
+            if not all(name in current for name in names):
+                return False
+
+            # Deletes written by other writers while this merge was running
+            deleted = set()
+            for name, doc_map, before in zip(names, doc_maps, purged):
+                for local_id in self.directory.read_deletes(name) - before:
+                    deleted.add(doc_map[local_id])
+            if deleted:
+                self.directory.write_deletes(target, deleted)
+
+            position = current.index(names[0])
+            segments = [info for info in manifest.segments if info.name not in names]
+            if doc_count:
+                segments.insert(position, SegmentInfo(target, doc_count))
+            manifest.segments = segments
+            manifest.generation += 1
+            self.directory.write_manifest(manifest)
+        return True
+
+    def merge_in_background(self) -> bool:
+        """Start merging in a daemon thread unless a merge is already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._thread = threading.Thread(target=self._merge_logged, name='sylph-merge', daemon=True)
+        self._thread.start()
+        return True
+
+    def _merge_logged(self) -> None:
+        try:
+            self.merge()
+        except Exception as e:
+            logger.error(f"Background merge failed: {str(e)}")
+
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,363 @@
+"""Stage timing histograms in the Prometheus text format, and per-request traces.
+
+Code paths time themselves with ``timed(stage)``:
+
+    with timed('search.lookup'):
+        postings = self._lookup(tokens)
+
+Every timing goes into the ``sylph_stage_seconds`` histogram under its
+stage label; stages nest, so ``search.score`` includes ``search.metadata``.
+Inside ``tracing()``, timings are also added up per stage for that request.
+A timing costs a couple of microseconds, cheaper than the log line per
+document it replaces.
+
+Each process has its own registry. The API workers forked by api/serve.py
+and the crawl processes started for jobs each write theirs to a shared
+directory (``SYLPH_METRICS_DIR``) every few seconds, and ``render()``
+adds up every file there, so a scrape sees all of them wherever it lands.
+When a process exits, its file is folded into ``_archived.json``, by the
+process itself or by whoever reaps it (``archive()``), so counts stay
+cumulative and the directory does not grow with every worker restart. A
+process also archives a leftover file with its pid before writing its own,
+so a reused pid never replaces a dead process's counts.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import atexit
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from 100 µs to 10 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DUMP_INTERVAL = 5.0
+ARCHIVE_FILE = '_archived.json'
+LOCK_FILE = 'metrics.lock'
+
+
+class Histogram:
+    """Observations counted into fixed buckets, per combination of label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> [count in each bucket and above the last, sum]
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'kind': self.kind, 'help': self.help, 'labels': self.labels, 'buckets': self.buckets,
+                    'series': [[list(values), list(series)] for values, series in self.series.items()]}
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'kind': self.kind, 'help': self.help, 'labels': self.labels,
+                    'series': [[list(values), value] for values, value in self.series.items()]}
+
+
+def _merge(into: Dict, snapshot: Dict) -> None:
+    for name, metric in snapshot.items():
+        merged = into.get(name)
+        if merged is None:
+            into[name] = merged = dict(metric, series={})
+        elif metric['kind'] != merged['kind'] or tuple(metric.get('buckets', ())) != tuple(merged.get('buckets', ())):
+            logger.warning(f"Skipping metric {name} with a different definition")
+            continue
+        for values, series in metric['series']:
+            key = tuple(values)
+            current = merged['series'].get(key)
+            if metric['kind'] == 'histogram':
+                merged['series'][key] = series if current is None else [a + b for a, b in zip(current, series)]
+            else:
+                merged['series'][key] = series + (current or 0)
+
+
+def _label_text(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_metrics(metrics: Dict) -> str:
+    """Merged snapshots in the Prometheus text exposition format"""
+    lines = []
+    for name in sorted(metrics):
+        metric = metrics[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        labels = metric['labels']
+        for values in sorted(metric['series']):
+            series = metric['series'][values]
+            if metric['kind'] == 'counter':
+                lines.append(f"{name}{_label_text(labels, values)} {_number(series)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(metric['buckets']) + [math.inf], series):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{name}_bucket{_label_text(labels, values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels, values)} {_number(series[-1])}")
+            lines.append(f"{name}_count{_label_text(labels, values)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def _as_snapshot(merged: Dict) -> Dict:
+    """Merged metrics back in the form snapshots are written in"""
+    return {name: dict(metric, series=[[list(values), series] for values, series in metric['series'].items()])
+            for name, metric in merged.items()}
+
+
+def _write(path: str, snapshot: Dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _locked(directory: str, exclusive: bool = True) -> Iterator[None]:
+    """Keeps a scrape from reading a process's file and the archive it is being folded into"""
+    with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def archive(directory: str, pid: int) -> None:
+    """Folds the metrics file of an exited process into the archived totals and removes it"""
+    path = os.path.join(directory, f"{pid}.json")
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    with _locked(directory):
+        if not os.path.exists(path):
+            return
+        merged: Dict = {}
+        try:
+            if os.path.exists(archive_path):
+                with open(archive_path) as f:
+                    _merge(merged, json.load(f))
+            with open(path) as f:
+                _merge(merged, json.load(f))
+            _write(archive_path, _as_snapshot(merged))
+        except (OSError, ValueError) as e:
+            logger.error(f"Error archiving metrics of process {pid}: {str(e)}")
+        os.remove(path)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.directory: Optional[str] = None
+        self._lock = threading.Lock()
+        self._dump_lock = threading.Lock()
+        self._dumper: Optional[threading.Thread] = None
+        self._at_exit = False
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def clear(self) -> None:
+        """Drops every observation, as a forked process must: its parent reports those
+
+        Locks are replaced too, another thread may have held them at the fork.
+        """
+        for metric in self.metrics.values():
+            metric.series = {}
+            metric._lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._dump_lock = threading.Lock()
+        self._dumper = None
+
+    def attach(self, directory: str, interval: float = DUMP_INTERVAL) -> None:
+        """Shares this process's metrics through a directory, rewriting them every ``interval`` seconds"""
+        os.makedirs(directory, exist_ok=True)
+        # Left by an earlier process that had this pid and was never reaped
+        archive(directory, os.getpid())
+        self.directory = directory
+        if not self._at_exit:
+            atexit.register(self.retire)
+            self._at_exit = True
+        if self._dumper is None and interval > 0:
+            self._dumper = threading.Thread(target=self._dump_loop, args=(interval,), name='metrics-dump', daemon=True)
+            self._dumper.start()
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def _dump_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.dump()
+
+    def dump(self) -> None:
+        with self._dump_lock:
+            if self.directory is None:
+                return
+            path = self._path()
+            try:
+                _write(path, self.snapshot())
+            except Exception as e:
+                logger.error(f"Error writing metrics to {path}: {str(e)}")
+
+    def retire(self) -> None:
+        """Moves this process's metrics into the archived totals, as it exits"""
+        with self._dump_lock:
+            directory = self.directory
+            if directory is None:
+                return
+            self.directory = None
+            try:
+                _write(os.path.join(directory, f"{os.getpid()}.json"), self.snapshot())
+                archive(directory, os.getpid())
+            except Exception as e:
+                logger.error(f"Error archiving metrics in {directory}: {str(e)}")
+
+    def render(self) -> str:
+        """Every process's metrics in the Prometheus text format, this one's up to date"""
+        merged: Dict = {}
+        directory = self.directory
+        if directory is not None and os.path.isdir(directory):
+            own = f"{os.getpid()}.json"
+            with _locked(directory, exclusive=False):
+                for name in sorted(os.listdir(directory)):
+                    if not name.endswith('.json') or name == own:
+                        continue
+                    try:
+                        with open(os.path.join(directory, name)) as f:
+                            _merge(merged, json.load(f))
+                    except (OSError, ValueError) as e:
+                        logger.warning(f"Skipping metrics file {name}: {str(e)}")
+        _merge(merged, self.snapshot())
+        return format_metrics(merged)
+
+
+REGISTRY = Registry()
+os.register_at_fork(after_in_child=REGISTRY.clear)
+
+STAGE_SECONDS = REGISTRY.histogram('sylph_stage_seconds', 'Time spent in each stage of searching, indexing and crawling',
+                                   labels=('stage',))
+
+
+class Trace:
+    """Time spent per stage during one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        totals = self.stages.get(stage)
+        if totals is None:
+            self.stages[stage] = [1, seconds]
+        else:
+            totals[0] += 1
+            totals[1] += seconds
+
+    def to_dict(self) -> Dict:
+        return {
+            'total_ms': (time.perf_counter() - self.start) * 1e3,
+            'stages': [{'stage': stage, 'calls': calls, 'ms': seconds * 1e3}
+                       for stage, (calls, seconds) in self.stages.items()]
+        }
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar('sylph_trace', default=None)
+
+
+class tracing:
+    """Collects the stages timed inside the block into a Trace"""
+
+    def __enter__(self) -> Trace:
+        self.trace = Trace()
+        self._token = _trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc_info) -> None:
+        _trace.reset(self._token)
+
+
+class timed:
+    """Times a block into the stage histogram, and the current trace if any"""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> 'timed':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(seconds, self.stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(self.stage, seconds)
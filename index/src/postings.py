@@ -0,0 +1,153 @@
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from typing import Callable, Iterator, List, Sequence, Tuple
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class PostingList:
+    """Postings of one term as flat integer arrays, ordered by doc ID
+
+    ``doc_ids[i]`` has the positions ``positions[offsets[i]:offsets[i + 1]]``.
+    ``max_tf`` is maintained as postings are added and bounds per-term scores.
+
+    Positions can be deferred (see ``defer_positions``): doc IDs and term
+    frequencies are then available straight away, and the positions are
+    only decoded the first time ``positions`` is read.
+    """
+    __slots__ = ('doc_ids', 'offsets', '_positions', '_pending', 'max_tf')
+
+    def __init__(self):
+        self.doc_ids = array('I')
+        self.offsets = array('I')
+        self._positions = array('I')
+        # (position count, loader) while the positions are not decoded yet
+        self._pending = None
+        self.max_tf = 0
+
+    @property
+    def positions(self) -> array:
+        if self._pending is not None:
+            self._positions = self._pending[1]()
+            self._pending = None
+        return self._positions
+
+    def defer_positions(self, count: int, load: Callable[[], array]) -> None:
+        """Leave the ``count`` positions to ``load()``, called on first access"""
+        self._pending = (count, load)
+
+    def position_count(self) -> int:
+        return self._pending[0] if self._pending is not None else len(self._positions)
+
+    def add(self, doc_id: int, position: int) -> None:
+        positions = self.positions
+        if not self.doc_ids or self.doc_ids[-1] != doc_id:
+            self.doc_ids.append(doc_id)
+            self.offsets.append(len(positions))
+        positions.append(position)
+        self.max_tf = max(self.max_tf, len(positions) - self.offsets[-1])
+
+    def extend(self, other: 'PostingList', doc_base: int = 0) -> None:
+        """Append postings whose doc IDs (after adding ``doc_base``) all sort after this list's"""
+        base = len(self.positions)
+        if doc_base:
+            self.doc_ids.extend(doc_id + doc_base for doc_id in other.doc_ids)
+        else:
+            self.doc_ids.extend(other.doc_ids)
+        self.offsets.extend(offset + base for offset in other.offsets)
+        self.positions.extend(other.positions)
+        self.max_tf = max(self.max_tf, other.max_tf)
+
+    def append(self, doc_id: int, positions) -> None:
+        """Append all positions of a doc ID greater than any already in the list"""
+        self.doc_ids.append(doc_id)
+        self.offsets.append(len(self.positions))
+        self.positions.extend(positions)
+        self.max_tf = max(self.max_tf, len(positions))
+
+    def without(self, doc_ids) -> 'PostingList':
+        """Copy of the postings minus the given doc IDs"""
+        return self.subset([i for i, doc_id in enumerate(self.doc_ids) if doc_id not in doc_ids])
+
+    def subset(self, indexes: Sequence[int]) -> 'PostingList':
+        """Copy of the postings at the given sorted indexes, copying positions only when read"""
+        postings = PostingList()
+        count = 0
+        for i in indexes:
+            tf = self.term_frequency_at(i)
+            postings.doc_ids.append(self.doc_ids[i])
+            postings.offsets.append(count)
+            postings.max_tf = max(postings.max_tf, tf)
+            count += tf
+        postings.defer_positions(count, lambda: array('I', chain.from_iterable(self.positions_at(i) for i in indexes)))
+        return postings
+
+    def _end(self, i: int) -> int:
+        return self.offsets[i + 1] if i + 1 < len(self.offsets) else self.position_count()
+
+    def positions_at(self, i: int) -> array:
+        return self.positions[self.offsets[i]:self._end(i)]
+
+    def term_frequency_at(self, i: int) -> int:
+        return self._end(i) - self.offsets[i]
+
+    def index_of(self, doc_id: int) -> int:
+        i = bisect_left(self.doc_ids, doc_id)
+        return i if i < len(self.doc_ids) and self.doc_ids[i] == doc_id else -1
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __contains__(self, doc_id: int) -> bool:
+        return self.index_of(doc_id) >= 0
+
+    def __getitem__(self, doc_id: int) -> array:
+        i = self.index_of(doc_id)
+        if i < 0:
+            raise KeyError(doc_id)
+        return self.positions_at(i)
+
+    def get(self, doc_id: int, default=None):
+        i = self.index_of(doc_id)
+        return self.positions_at(i) if i >= 0 else default
+
+    def keys(self) -> array:
+        return self.doc_ids
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.doc_ids)
+
+    def items(self) -> Iterator[Tuple[int, array]]:
+        for i, doc_id in enumerate(self.doc_ids):
+            yield doc_id, self.positions_at(i)
+
+    def to_dict(self) -> dict:
+        return {doc_id: list(positions) for doc_id, positions in self.items()}
+
+    @classmethod
+    def from_items(cls, items: List[Tuple[int, List[int]]]) -> 'PostingList':
+        postings = cls()
+        for doc_id, positions in sorted(items):
+            postings.doc_ids.append(doc_id)
+            postings.offsets.append(len(postings.positions))
+            postings.positions.extend(sorted(positions))
+            postings.max_tf = max(postings.max_tf, len(positions))
+        return postings
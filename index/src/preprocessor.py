@@ -2,23 +2,160 @@ import nltk
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer
-from typing import List
+from array import array
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Local directory with the NLTK data, used before falling back to NLTK's default search path
+NLTK_DATA = os.environ.get('SYLPH_NLTK_DATA')
+# Missing NLTK data is an error unless downloading it is allowed here
+NLTK_DOWNLOAD = os.environ.get('SYLPH_NLTK_DOWNLOAD', '').lower() in ('1', 'true', 'yes')
+# 'nltk' for word_tokenize, 'fast' for the regex tokenizer below. The crawler
+# and the API must use the same one, or queries stop matching indexed terms.
+TOKENIZER = os.environ.get('SYLPH_TOKENIZER', 'nltk')
+
+# Everything word_tokenize always splits on, including the unicode quotes it pads
+_SEPARATORS = re.compile(r"[\s,;:!?@#$%&*()\[\]{}<>\"`«»“”‘’„]+|\.{2,}|--")
+# Clitics and trailing punctuation word_tokenize splits off the end of a word
+_SUFFIX = re.compile(r"(?:'[smd]|'ll|'re|'ve|n't|'|\.)$", re.IGNORECASE)
+_SPLIT_WORDS: Dict[str, List[str]] = {
+    'cannot': ['can', 'not'],
+    'gimme': ['gim', 'me'],
+    'gonna': ['gon', 'na'],
+    'gotta': ['got', 'ta'],
+    'lemme': ['lem', 'me'],
+    'wanna': ['wan', 'na'],
+}
+
+
+def fast_tokenize(text: str) -> List[str]:
+    """Regex approximation of word_tokenize for lowercased text
+
+    Only alphabetic tokens survive preprocessing, so this only has to agree with
+    word_tokenize on those: words are split on the same separators, and lose the
+    clitic or sentence-final period word_tokenize would split off. Punkt's
+    abbreviation handling (``mr.`` stays one non-alphabetic token there) is not
+    reproduced. ``tests/test_preprocessor.py`` checks the agreement on a fixed
+    sample, ``benchmarks/bench_preprocess.py`` measures it on crawled pages.
+    """
+    tokens = []
+    for chunk in _SEPARATORS.split(text):
+        if not chunk.isalpha():
+            chunk = _SUFFIX.sub('', chunk)
+        split = _SPLIT_WORDS.get(chunk)
+        if split:
+            tokens.extend(split)
+        else:
+            tokens.append(chunk)
+    return tokens
+
+
+def _ensure_resource(resource: str, package: str, data_path: Optional[str], download: bool = False) -> None:
+    if data_path and data_path not in nltk.data.path:
+        nltk.data.path.insert(0, data_path)
+    try:
+        nltk.data.find(resource)
+        return
+    except LookupError:
+        if not download:
+            where = data_path or ', '.join(nltk.data.path)
+            target = f"-d {data_path} {package}" if data_path else package
+            raise LookupError(f"NLTK resource {package} not found in {where}; install it with "
+                              f"'python -m nltk.downloader {target}' or set SYLPH_NLTK_DOWNLOAD=1") from None
+    logger.info(f"Downloading NLTK resource {package}")
+    if not nltk.download(package, download_dir=data_path, quiet=True):
+        raise LookupError(f"Could not download NLTK resource {package}")
+
+
+@lru_cache(maxsize=None)
+def load_stopwords(data_path: Optional[str] = None, download: bool = False) -> FrozenSet[str]:
+    """English stopwords, loaded once per process"""
+    _ensure_resource('corpora/stopwords', 'stopwords', data_path, download)
+    return frozenset(stopwords.words('english'))
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str, data_path: Optional[str] = None, download: bool = False) -> Callable[[str], List[str]]:
+    if name == 'fast':
+        return fast_tokenize
+    if name == 'nltk':
+        _ensure_resource('tokenizers/punkt_tab/english/', 'punkt_tab', data_path, download)
+        return word_tokenize
+    raise ValueError(f"Unknown tokenizer {name!r}, expected 'nltk' or 'fast'")
+
 
 class TextPreprocessor:
-    def __init__(self):
-        nltk.download('punkt')
-        nltk.download('punkt_tab')
-        nltk.download('stopwords')
+    """Lowercases, tokenizes, drops stopwords and non-words, and stems
+
+    NLTK resources are looked up once per process. Missing ones raise
+    LookupError, or are downloaded with ``download`` (``SYLPH_NLTK_DOWNLOAD``
+    by default), so startup never reaches the network unless asked to.
+    Stems are memoised in a bounded LRU cache: term frequencies are Zipfian,
+    so almost every token after the first few documents is a hit.
+    """
+
+    def __init__(self, tokenizer: Optional[str] = None, data_path: Optional[str] = None,
+                 stem_cache_size: int = 100_000, download: Optional[bool] = None):
+        self.tokenizer = tokenizer or TOKENIZER
+        data_path = data_path or NLTK_DATA
+        download = NLTK_DOWNLOAD if download is None else download
+        self.tokenize = load_tokenizer(self.tokenizer, data_path, download)
         self.stemmer = PorterStemmer()
-        self.stop_words = set(stopwords.words('english'))
+        self.stop_words = load_stopwords(data_path, download)
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+    def preprocess(self, text: str, words: Optional[List[str]] = None) -> List[str]:
+        """Stemmed tokens of ``text``, appending each token's unstemmed word to ``words`` if given"""
+        stop_words = self.stop_words
+        stem = self.stem
+        if words is None:
+            return [
+                stem(token) for token in self.tokenize(text.lower())
+                if token.isalpha() and token not in stop_words
+            ]
+        kept = [token for token in self.tokenize(text.lower()) if token.isalpha() and token not in stop_words]
+        words.extend(kept)
+        return [stem(token) for token in kept]
 
-    def preprocess(self,text: str) -> List[str]:
-        tokens = word_tokenize(text.lower())
-        tokens = [
-            token for token in tokens
-            if token.isalpha() and token not in self.stop_words
-        ]
+    def preprocess_with_offsets(self, text: str, words: Optional[List[str]] = None) -> Tuple[List[str], array]:
+        """``preprocess(text)`` plus the UTF-8 byte offset in ``text`` where each token starts
 
-        stemmed_tokens = [self.stemmer.stem(token) for token in tokens]
+        Tokens are found in order in the lowercased text; one the tokenizer
+        rewrote gets the offset of the previous one.
+        """
+        stop_words = self.stop_words
+        stem = self.stem
+        lowered = text.lower()
+        # Lowercasing a few characters changes the length ('İ' becomes two), so
+        # map each lowercased character back to the original one it came from
+        origins = None
+        if len(lowered) != len(text):
+            origins = [i for i, char in enumerate(text) for _ in char.lower()]
+            origins.append(len(text))
+        tokens: List[str] = []
+        offsets = array('I')
+        cursor = char_pos = byte_pos = 0
+        for token in self.tokenize(lowered):
+            start = lowered.find(token, cursor)
+            if start < 0:
+                start = cursor
+            else:
+                cursor = start + len(token)
+            if token.isalpha() and token not in stop_words:
+                if origins is not None:
+                    start = origins[start]
+                byte_pos += len(text[char_pos:start].encode('utf-8'))
+                char_pos = start
+                tokens.append(stem(token))
+                offsets.append(byte_pos)
+                if words is not None:
+                    words.append(token)
+        return tokens, offsets
 
-        return stemmed_tokens
+    def preprocess_many(self, texts: Iterable[str], words: Optional[List[str]] = None) -> List[List[str]]:
+        return [self.preprocess(text, words) for text in texts]
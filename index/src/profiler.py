@@ -0,0 +1,84 @@
+"""A sampling profiler that can be switched on in a running process.
+
+A background thread records the stack of every other thread every
+``interval`` seconds. Stacks are kept in the collapsed format, one
+``frame;frame;frame count`` line per distinct stack, which flamegraph.pl
+and speedscope read directly. Waiting threads are sampled too, so the
+profile shows where wall-clock time goes. Unlike cProfile it adds nothing
+to the profiled code: the cost is the sampling thread taking the GIL
+``1 / interval`` times a second, about 1% at the default 10 ms.
+"""
+from collections import Counter
+from typing import Optional
+import logging
+import os
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started, every {self.interval * 1e3:.0f} ms")
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Sampling profiler stopped after {self.samples} samples")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+    def _frame_name(self, frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        code = frame.f_code
+                        name = names.get(code)
+                        if name is None:
+                            name = names[code] = self._frame_name(frame)
+                        stack.append(name)
+                        frame = frame.f_back
+                    if stack:
+                        self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Stacks sampled so far, most frequent first"""
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
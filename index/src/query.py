@@ -0,0 +1,329 @@
+"""Query syntax on top of plain keyword search.
+
+    "new york"          phrase: the terms adjacent and in order
+    python NEAR/3 web   proximity: at most 3 other tokens between the terms,
+                        in either order; ``a NEAR/2 b NEAR/4 c`` is one
+                        clause with the largest distance
+    a AND (b OR NOT c)  boolean: NOT binds tighter than AND, AND tighter
+                        than OR; adjacent terms are ANDed
+    progr*              prefix: any of the most frequent terms starting
+                        with "progr", at most MAX_EXPANSIONS of them
+
+With a ``fuzzy`` resolver (see SearchEngine.search), a plain word that is
+not in the vocabulary stands for the terms a few edits away from it, as an
+OR like a prefix; phrases and NEAR words are matched exactly.
+
+Without boolean operators every phrase and NEAR clause must match and other
+terms are optional. With them, the expression alone decides which documents
+match. Either way, all terms not under a NOT contribute to the score.
+Distances count tokens after preprocessing, so stopwords inside a phrase are
+skipped exactly as they were at index time.
+"""
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Union
+import re
+from .intersect import (difference_sorted, intersect_doc_ids, intersect_sorted,
+                        min_window_span, phrase_starts, union_sorted)
+from .postings import PostingList
+
+_QUERY_PARTS = re.compile(r'"([^"]*)"|NEAR/(\d+)|([()])|([^\s()"]+)')
+_OPERATORS = {'AND', 'OR', 'NOT'}
+_BOOLEAN_SYNTAX = re.compile(r'[()]|\b(?:AND|OR|NOT)\b')
+MAX_EXPANSIONS = 20
+
+
+@dataclass
+class ProximityClause:
+    tokens: List[str]
+    # Most tokens allowed between the terms; phrases are ordered with none
+    slop: int = 0
+    ordered: bool = True
+
+    def match(self, postings: Dict[str, PostingList]) -> Dict[int, float]:
+        """Matching doc IDs with their closeness, 1.0 when the terms are adjacent"""
+        terms = list(dict.fromkeys(self.tokens)) if not self.ordered else self.tokens
+        if any(token not in postings for token in terms):
+            return {}
+        lists = [postings[token] for token in terms]
+        matches = {}
+        for doc_id, indexes in intersect_doc_ids(lists):
+            positions = [results.positions_at(i) for results, i in zip(lists, indexes)]
+            if self.ordered:
+                if phrase_starts(positions):
+                    matches[doc_id] = 1.0
+            else:
+                span = min_window_span(positions)
+                if span - (len(terms) - 1) <= self.slop:
+                    matches[doc_id] = (len(terms) - 1) / max(span, 1) if len(terms) > 1 else 1.0
+        return matches
+
+
+@dataclass
+class TermNode:
+    # All tokens one query word preprocesses to
+    tokens: List[str]
+
+
+@dataclass
+class AndNode:
+    children: list
+
+
+@dataclass
+class OrNode:
+    children: list
+
+
+@dataclass
+class NotNode:
+    child: object
+
+
+Node = Union[TermNode, ProximityClause, AndNode, OrNode, NotNode]
+
+
+@dataclass
+class ParsedQuery:
+    tokens: List[str]
+    clauses: List[ProximityClause] = field(default_factory=list)
+    # Boolean expression deciding the matching documents, None for keyword queries
+    expression: Optional[Node] = None
+    # Tokens only needed to evaluate the expression, not scored
+    excluded_tokens: List[str] = field(default_factory=list)
+
+    def cache_key(self) -> str:
+        """Normalised form: queries that parse the same share results"""
+        if self.expression is None and not self.clauses:
+            return ' '.join(self.tokens)
+        return repr((self.expression, self.clauses, self.tokens))
+
+
+class _Parser:
+    def __init__(self, query: str, preprocessor, expand: Optional[Callable[[str, int], List[str]]] = None,
+                 fuzzy: Optional[Callable[[str], List[str]]] = None):
+        self.preprocessor = preprocessor
+        self.expand = expand
+        self.fuzzy = fuzzy
+        self.parts = []
+        for phrase, distance, paren, word in _QUERY_PARTS.findall(query):
+            if distance:
+                self.parts.append(('near', int(distance)))
+            elif paren:
+                self.parts.append(('paren', paren))
+            elif word:
+                self.parts.append(('op' if word in _OPERATORS else 'word', word))
+            else:
+                self.parts.append(('phrase', phrase))
+        self.i = 0
+
+    def peek(self, ahead: int = 0):
+        i = self.i + ahead
+        return self.parts[i] if i < len(self.parts) else (None, None)
+
+    def take(self):
+        part = self.peek()
+        self.i += 1
+        return part
+
+    def atom(self) -> Optional[Node]:
+        """A phrase, or a word with any NEAR/k words chained to it"""
+        kind, value = self.take()
+        if kind not in ('phrase', 'word'):
+            # Nothing to apply the preceding NOT to
+            return None
+        if kind == 'phrase':
+            tokens = self.preprocessor.preprocess(value)
+            return ProximityClause(tokens) if tokens else None
+
+        if self.expand is not None and value.endswith('*') and self.peek()[0] != 'near':
+            prefix = value.rstrip('*').lower()
+            if prefix:
+                # An OR of the expansions; with none it matches nothing
+                return OrNode([TermNode([term]) for term in self.expand(prefix, MAX_EXPANSIONS)])
+
+        words = [value]
+        slop = 0
+        while self.peek()[0] == 'near' and self.peek(1)[0] == 'word':
+            slop = max(slop, self.take()[1])
+            words.append(self.take()[1])
+        tokens = [token for word in words for token in self.preprocessor.preprocess(word)]
+        if not tokens:
+            return None
+        if len(words) > 1 and len(set(tokens)) > 1:
+            return ProximityClause(tokens, slop=slop, ordered=False)
+        if self.fuzzy is not None and len(tokens) == 1:
+            alternatives = self.fuzzy(tokens[0])
+            if alternatives != tokens:
+                return OrNode([TermNode([term]) for term in alternatives])
+        return TermNode(tokens)
+
+    def keywords(self) -> ParsedQuery:
+        tokens: List[str] = []
+        clauses: List[ProximityClause] = []
+        while self.i < len(self.parts):
+            if self.peek()[0] not in ('phrase', 'word'):
+                # NEAR without a word on both sides
+                self.take()
+                continue
+            node = self.atom()
+            if isinstance(node, OrNode):
+                tokens.extend(token for child in node.children for token in child.tokens)
+            elif node is not None:
+                tokens.extend(node.tokens)
+                if isinstance(node, ProximityClause):
+                    clauses.append(node)
+        return ParsedQuery(tokens, clauses)
+
+    def expression(self) -> Optional[Node]:
+        nodes = []
+        while self.i < len(self.parts):
+            node = self.or_expr()
+            if node is not None:
+                nodes.append(node)
+            if self.peek() == ('paren', ')'):
+                # Unbalanced closing parenthesis
+                self.take()
+        return _combine(AndNode, nodes)
+
+    def or_expr(self) -> Optional[Node]:
+        nodes = [self.and_expr()]
+        while self.peek() == ('op', 'OR'):
+            self.take()
+            nodes.append(self.and_expr())
+        return _combine(OrNode, [node for node in nodes if node is not None])
+
+    def and_expr(self) -> Optional[Node]:
+        nodes = []
+        while True:
+            kind, value = self.peek()
+            if kind is None or (kind, value) in (('op', 'OR'), ('paren', ')')):
+                break
+            if kind in ('op', 'near') and value != 'NOT':
+                # Explicit AND, or a NEAR without a word on both sides
+                self.take()
+                continue
+            node = self.unary()
+            if node is not None:
+                nodes.append(node)
+        return _combine(AndNode, nodes)
+
+    def unary(self) -> Optional[Node]:
+        kind, value = self.peek()
+        if (kind, value) == ('op', 'NOT'):
+            self.take()
+            child = self.unary()
+            return NotNode(child) if child is not None else None
+        if (kind, value) == ('paren', '('):
+            self.take()
+            node = self.or_expr()
+            if self.peek() == ('paren', ')'):
+                self.take()
+            return node
+        return self.atom()
+
+
+def _combine(node_class, nodes: list) -> Optional[Node]:
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else node_class(nodes)
+
+
+def _collect(node: Node, negated: bool, tokens: List[str], excluded: List[str],
+             clauses: List[ProximityClause]) -> None:
+    if isinstance(node, (TermNode, ProximityClause)):
+        (excluded if negated else tokens).extend(node.tokens)
+        if isinstance(node, ProximityClause) and not negated:
+            clauses.append(node)
+    elif isinstance(node, NotNode):
+        _collect(node.child, not negated, tokens, excluded, clauses)
+    else:
+        for child in node.children:
+            _collect(child, negated, tokens, excluded, clauses)
+
+
+def parse_query(query: str, preprocessor,
+                expand: Optional[Callable[[str, int], List[str]]] = None,
+                fuzzy: Optional[Callable[[str], List[str]]] = None) -> ParsedQuery:
+    """Parses a query; ``expand(prefix, limit)`` resolves ``prefix*`` terms, which are literal without it,
+    and ``fuzzy(token)`` gives the terms to search for a word's token, just the token when it is known
+    """
+    if ('"' not in query and 'NEAR/' not in query and not _BOOLEAN_SYNTAX.search(query)
+            and (expand is None or '*' not in query)):
+        tokens = preprocessor.preprocess(query)
+        if fuzzy is not None:
+            tokens = [term for token in tokens for term in fuzzy(token)]
+        return ParsedQuery(tokens)
+
+    parser = _Parser(query, preprocessor, expand, fuzzy)
+    if not _BOOLEAN_SYNTAX.search(query):
+        return parser.keywords()
+
+    expression = parser.expression()
+    tokens: List[str] = []
+    excluded: List[str] = []
+    clauses: List[ProximityClause] = []
+    if expression is not None:
+        _collect(expression, False, tokens, excluded, clauses)
+    return ParsedQuery(tokens, clauses, expression, excluded)
+
+
+class BooleanEvaluator:
+    """Evaluates an expression to a sorted array of doc IDs
+
+    AND evaluates its cheapest operands first and stops as soon as the
+    intersection is empty; NOT under AND is a difference, and only a NOT
+    elsewhere needs the full set of documents from ``all_doc_ids``.
+    Closeness of the phrase and NEAR clauses matched outside a NOT is kept
+    in ``clause_matches`` for proximity scoring.
+    """
+
+    def __init__(self, postings: Dict[str, PostingList], all_doc_ids: Callable[[], Sequence[int]]):
+        self.postings = postings
+        self.all_doc_ids = all_doc_ids
+        self.clause_matches: List[Dict[int, float]] = []
+        self._universe: Optional[Sequence[int]] = None
+
+    def _all(self) -> Sequence[int]:
+        if self._universe is None:
+            self._universe = self.all_doc_ids()
+        return self._universe
+
+    def _doc_ids(self, token: str) -> Sequence[int]:
+        results = self.postings.get(token)
+        return results.doc_ids if results is not None else array('I')
+
+    def _cost(self, node: Node) -> int:
+        if isinstance(node, (TermNode, ProximityClause)):
+            return min(len(self._doc_ids(token)) for token in node.tokens)
+        # Nested expressions go last, their size is unknown without evaluating them
+        return 1 << 32
+
+    def evaluate(self, node: Node, negated: bool = False) -> Sequence[int]:
+        if isinstance(node, TermNode):
+            return intersect_sorted([self._doc_ids(token) for token in node.tokens])
+        if isinstance(node, ProximityClause):
+            matches = node.match(self.postings)
+            if not negated:
+                self.clause_matches.append(matches)
+            return array('I', sorted(matches))
+        if isinstance(node, OrNode):
+            return union_sorted([self.evaluate(child, negated) for child in node.children])
+        if isinstance(node, NotNode):
+            return difference_sorted(self._all(), self.evaluate(node.child, not negated))
+
+        positives = sorted((child for child in node.children if not isinstance(child, NotNode)), key=self._cost)
+        negatives = [child.child for child in node.children if isinstance(child, NotNode)]
+        result = None
+        for child in positives:
+            doc_ids = self.evaluate(child, negated)
+            result = doc_ids if result is None else intersect_sorted([result, doc_ids])
+            if not result:
+                return array('I')
+        if result is None:
+            result = self._all()
+        for child in negatives:
+            result = difference_sorted(result, self.evaluate(child, not negated))
+            if not result:
+                break
+        return result
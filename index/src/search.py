@@ -1,50 +1,324 @@
-from typing import List, Dict, Set
+from typing import Callable, List, Dict, Optional, Tuple, Type
+from array import array
 from collections import defaultdict
-from .preprocessor import TextPreprocessor
+import time
+import numpy as np
 from .indexer import InvertedIndex
-from ranking.src.ranker import SearchRanker, TFIDFScorer, DocumentScore
+from .cache import ResultCache
+from .fuzzy import auto_distance
+from .intersect import restrict
+from .metrics import timed
+from .postings import PostingList
+from .query import MAX_EXPANSIONS, BooleanEvaluator, ParsedQuery, ProximityClause, parse_query
+from .stats import CollectionStatistics
+from ranking.src.scoring import BM25FScorer, DocumentScore, Scorer
+from ranking.src.topk import WandTopK, rank_key
 
 
+class _FuzzyResolver:
+    """Maps a query token to itself when indexed, else to the indexed terms within a few edits"""
+
+    def __init__(self, index: InvertedIndex, max_distance: int, deadline: float):
+        self.index = index
+        self.doc_freq = index.statistics().doc_freq
+        self.max_distance = max_distance
+        self.deadline = deadline
+        # False once a lookup ran out of time and returned only the matches found by then
+        self.finished = True
+
+    def __call__(self, token: str) -> List[str]:
+        if token in self.doc_freq:
+            return [token]
+        distance = auto_distance(token, self.max_distance)
+        if not distance:
+            return [token]
+        terms, finished = self.index.expand_fuzzy(token, distance, MAX_EXPANSIONS, self.deadline)
+        self.finished = self.finished and finished
+        return terms or [token]
+
+
+def _boosted(doc_score: DocumentScore, boost: float) -> DocumentScore:
+    # TF-IDF scores can be negative, a boost must still move them up
+    doc_score.score = doc_score.score * boost if doc_score.score >= 0 else doc_score.score / boost
+    return doc_score
+
 
 class SearchEngine:
-    def __init__(self, index: InvertedIndex):
+    def __init__(self, index: InvertedIndex, scorer_class: Type[Scorer] = BM25FScorer,
+                 proximity_weight: float = 0.5, cache: Optional[ResultCache] = None):
         self.index = index
-        self.preprocessor = TextPreprocessor()
-        self.scorer =  TFIDFScorer(total_docs=max(1, index.doc_count))
-        
-    def search(self, query: str, max_results: int = 10) -> List[str]:
-        query_tokens = self.preprocessor.preprocess(query)
+        self.cache = cache
+        # Phrase and NEAR matches get up to this much extra score, by how close their terms are
+        self.proximity_weight = proximity_weight
+        # Queries must be tokenised exactly like the indexed documents
+        self.preprocessor = index.preprocessor
+        self.scorer_class = scorer_class
+        self.scorer = scorer_class(index.statistics())
+        self._shard_scorer = None
+
+    def _current_scorer(self, collection: Optional[CollectionStatistics] = None) -> Scorer:
+        """Scorer for the index's current statistics snapshot
+
+        Scorers are immutable; a new one replaces the reference when the
+        index changes, so concurrent queries never share mutable state.
+        With a ``collection``, this index is one shard of it and scores use
+        the collection's totals and document frequencies.
+        """
+        scorer = self.scorer
+        statistics = self.index.statistics()
+        if scorer.statistics is not statistics:
+            scorer = self.scorer = self.scorer_class(statistics)
+        if collection is None:
+            return scorer
+
+        key = (statistics.generation, collection.totals_key())
+        shard_scorer = self._shard_scorer
+        if shard_scorer is None or shard_scorer[0] != key:
+            shard_scorer = self._shard_scorer = (key, self.scorer_class(statistics.with_collection(collection)))
+        return shard_scorer[1].with_doc_freqs(collection.doc_freq)
+
+    def _expander(self, expansions: Optional[Dict[str, List[str]]]) -> Callable[[str, int], List[str]]:
+        """Resolves ``prefix*`` terms from this index, or from ``expansions`` decided for a whole collection"""
+        if expansions is None:
+            return self.index.expand_prefix
+        return lambda prefix, limit: expansions.get(prefix, [])[:limit]
+
+    def prefix_candidates(self, query: str) -> Dict[str, List[Tuple[str, str, int]]]:
+        """This index's (word, term, doc freq) completions of each ``prefix*`` in a query"""
+        candidates = {}
+        completions = self.index.completions()
+
+        def expand(prefix: str, limit: int) -> List[str]:
+            candidates[prefix] = completions.complete(prefix, limit)
+            return [term for _, term, _ in candidates[prefix]]
+
+        parse_query(query, self.preprocessor, expand)
+        return candidates
+
+    def collection_statistics(self, query: str,
+                              expansions: Optional[Dict[str, List[str]]] = None) -> CollectionStatistics:
+        """This index's part of the statistics a sharded search of ``query`` needs"""
+        parsed = parse_query(query, self.preprocessor, self._expander(expansions))
+        return CollectionStatistics.of(self.index.statistics(), dict.fromkeys(parsed.tokens + parsed.excluded_tokens))
+
+    def _fuzzy_resolver(self, max_distance: int, budget: float) -> '_FuzzyResolver':
+        return _FuzzyResolver(self.index, max_distance, time.perf_counter() + budget)
+
+    def search(self, query: str, max_results: int = 10,
+               collection: Optional[CollectionStatistics] = None,
+               fuzzy: int = 0, fuzzy_budget: float = 0.05,
+               expansions: Optional[Dict[str, List[str]]] = None) -> List[DocumentScore]:
+        """Top results for a query
+
+        Batch scorers score every candidate in one vectorised pass; others go
+        through WAND to skip documents that cannot make the cut. Phrase and
+        NEAR clauses or a boolean expression (see query.py) first narrow the
+        candidates down with sorted-list intersections, so only documents
+        that can match get scored. With a cache, repeated queries against an
+        unchanged index skip all of that.
+
+        With ``fuzzy`` at 1 or 2, words missing from the index match the
+        terms at most that many edits away (fewer for short words, see
+        fuzzy.py). Lookups stop after ``fuzzy_budget`` seconds in total and
+        use the matches found by then; such results depend on timing, so
+        they are neither cached nor answered from the cache.
+
+        ``expansions`` maps each ``prefix*`` of the query to its terms in
+        place of this index's own completions, so the shards of a collection
+        all search the terms chosen for the whole of it (see coordinator.py).
+        """
+        with timed('search.parse'):
+            resolve = self._fuzzy_resolver(fuzzy, fuzzy_budget) if fuzzy > 0 else None
+            parsed = parse_query(query, self.preprocessor, self._expander(expansions), resolve)
+        if self.cache is None or collection is not None or (resolve is not None and not resolve.finished):
+            return self._search(parsed, max_results, collection)
+
+        version = self.index.version
+        with timed('search.cache'):
+            key = self.cache.key(version, self.scorer_class.__name__, parsed.cache_key(), max_results)
+            results = self.cache.get(version, key)
+        if results is None:
+            results = self._search(parsed, max_results)
+            with timed('search.cache'):
+                self.cache.put(key, results)
+        return results
+
+    def _search(self, parsed: ParsedQuery, max_results: int,
+                collection: Optional[CollectionStatistics] = None) -> List[DocumentScore]:
+        query_tokens = parsed.tokens
         if not query_tokens:
             return []
-        matching_docs: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        scorer = self._current_scorer(collection)
+        if parsed.expression is not None:
+            with timed('search.lookup'):
+                postings = self._lookup(query_tokens + parsed.excluded_tokens)
+            with timed('search.match'):
+                boosts = self._match_expression(parsed, postings)
+            with timed('search.score'):
+                return self._search_candidates(scorer, query_tokens, postings, boosts, max_results)
+        with timed('search.lookup'):
+            postings = self._lookup(query_tokens)
+        if parsed.clauses:
+            with timed('search.match'):
+                boosts = self._match_clauses(parsed.clauses, postings)
+            with timed('search.score'):
+                return self._search_candidates(scorer, query_tokens, postings, boosts, max_results)
+        with timed('search.score'):
+            return self._score_all(scorer, query_tokens, postings, max_results)
 
-        for token in query_tokens:
-            results = self.index.trie.search(token)
-            if results:
-                self.scorer.document_frequency[token] = len(results)
-                for doc_id, positions in results.items():
-                    matching_docs[doc_id][token] = positions
+    def _score_all(self, scorer: Scorer, query_tokens: List[str], postings: Dict[str, PostingList],
+                   max_results: int) -> List[DocumentScore]:
+        """Top documents among all that match any query term"""
+        if scorer.supports_batch:
+            return self._search_batch(scorer, query_tokens, postings, max_results)
 
+        def score(doc_id: int, matched: Dict[str, int]) -> DocumentScore:
+            term_positions = {token: postings[token].positions_at(i) for token, i in matched.items()}
+            return self._score_document(scorer, doc_id, query_tokens, term_positions)
+
+        def doc_upper_bound(doc_id: int, matched: Dict[str, int]) -> float:
+            bound = 0.0
+            for token, i in matched.items():
+                results = postings[token]
+                bound += scorer.upper_bound(token, results.term_frequency_at(i), results.positions[results.offsets[i]])
+            return bound
+
+        return WandTopK(max_results).search(
+            {token: results.doc_ids for token, results in postings.items()},
+            {token: scorer.upper_bound(token, results.max_tf) for token, results in postings.items()},
+            score,
+            doc_upper_bound
+        )
+
+    def _match_clauses(self, clauses: List[ProximityClause], postings: Dict[str, PostingList]) -> Dict[int, float]:
+        """Boost of every document matching all clauses"""
+        matches = None
+        for clause in clauses:
+            clause_matches = clause.match(postings)
+            if matches is None:
+                matches = clause_matches
+            else:
+                matches = {doc_id: closeness + clause_matches[doc_id]
+                           for doc_id, closeness in matches.items() if doc_id in clause_matches}
+            if not matches:
+                return {}
+        return {doc_id: 1 + self.proximity_weight * closeness / len(clauses) for doc_id, closeness in matches.items()}
+
+    def _match_expression(self, parsed: ParsedQuery, postings: Dict[str, PostingList]) -> Dict[int, float]:
+        """Boost of every document matching a boolean expression"""
+        evaluator = BooleanEvaluator(postings, lambda: array('I', (doc_id for doc_id, _ in self.index.iter_documents())))
+        doc_ids = evaluator.evaluate(parsed.expression)
+        if not parsed.clauses:
+            return dict.fromkeys(doc_ids, 1.0)
+        weight = self.proximity_weight / len(parsed.clauses)
+        return {
+            doc_id: 1 + weight * sum(matches.get(doc_id, 0.0) for matches in evaluator.clause_matches)
+            for doc_id in doc_ids
+        }
+
+    def _search_candidates(self, scorer: Scorer, query_tokens: List[str], postings: Dict[str, PostingList],
+                           boosts: Dict[int, float], max_results: int) -> List[DocumentScore]:
+        """Scores only the documents in ``boosts``, scaling each score by its boost"""
+        if not boosts:
+            return []
+        candidates = array('I', sorted(boosts))
+        postings = {token: restrict(postings[token], candidates) for token in dict.fromkeys(query_tokens) if token in postings}
+        if scorer.supports_batch:
+            return self._search_batch(scorer, query_tokens, postings, max_results, boosts)
+
+        scored_docs = []
+        for doc_id in candidates:
+            term_positions = {}
+            for token, results in postings.items():
+                positions = results.get(doc_id)
+                if positions is not None:
+                    term_positions[token] = positions
+            if not term_positions:
+                # Matched only through a NOT, nothing to score
+                continue
+            doc_score = self._score_document(scorer, doc_id, query_tokens, term_positions)
+            scored_docs.append(_boosted(doc_score, boosts[doc_id]))
+        scored_docs.sort(key=rank_key)
+        return scored_docs[:max_results]
+
+    def _search_batch(self, scorer: Scorer, query_tokens: List[str], postings: Dict[str, PostingList],
+                      max_results: int, boosts: Optional[Dict[int, float]] = None) -> List[DocumentScore]:
+        # Boosts can lift any document into the top k, so only plain queries are pruned
+        doc_ids, scores = scorer.score_batch(query_tokens, postings, None if boosts else max_results)
+        if boosts:
+            factors = np.fromiter((boosts[doc_id] for doc_id in doc_ids.tolist()), dtype=np.float64, count=len(doc_ids))
+            scores = np.where(scores >= 0, scores * factors, scores / factors)
+        k = min(max_results, len(doc_ids))
+        if k <= 0:
+            return []
+
+        # Partition for the k-th best score, then order the survivors (ties included) by rank_key
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+        survivors = np.flatnonzero(scores >= kth_score)
+        order = survivors[np.lexsort((doc_ids[survivors], -scores[survivors]))][:k]
+
+        results = []
+        for i in order:
+            doc_id = int(doc_ids[i])
+            term_positions = {}
+            for token, results_for_token in postings.items():
+                positions = results_for_token.get(doc_id)
+                if positions is not None:
+                    term_positions[token] = positions
+            doc_score = self._score_document(scorer, doc_id, query_tokens, term_positions)
+            results.append(_boosted(doc_score, boosts[doc_id]) if boosts else doc_score)
+        return results
+
+    def search_exhaustive(self, query: str, max_results: int = 10) -> List[DocumentScore]:
+        """Scores every matching document, the reference for search()"""
+        parsed = parse_query(query, self.preprocessor, self.index.expand_prefix)
+        query_tokens = parsed.tokens
+        if not query_tokens:
+            return []
+        scorer = self._current_scorer()
+        postings = self._lookup(query_tokens + parsed.excluded_tokens)
+        matching_docs: Dict[int, Dict[str, List[int]]] = defaultdict(dict)
+
+        for token in dict.fromkeys(query_tokens):
+            for doc_id, positions in postings.get(token, PostingList()).items():
+                matching_docs[doc_id][token] = positions
+
+        if parsed.expression is not None:
+            boosts = self._match_expression(parsed, postings)
+        else:
+            boosts = self._match_clauses(parsed.clauses, postings) if parsed.clauses else None
         scored_docs: List[DocumentScore] = []
         for doc_id, term_positions in matching_docs.items():
-            doc_meta = next((doc for doc in self.index.get_documents() if doc['url'] == doc_id), {})
-            
+            if boosts is not None and doc_id not in boosts:
+                continue
+            doc_score = self._score_document(scorer, doc_id, query_tokens, term_positions)
+            scored_docs.append(_boosted(doc_score, boosts[doc_id]) if boosts is not None else doc_score)
+        scored_docs.sort(key=rank_key)
+        return scored_docs[:max_results]
+
+    def _lookup(self, query_tokens: List[str]) -> Dict[str, PostingList]:
+        postings = {}
+        for token in dict.fromkeys(query_tokens):
+            results = self.index.lookup(token)
+            if results:
+                postings[token] = results
+        return postings
+
+    def _score_document(self, scorer: Scorer, doc_id: int, query_tokens: List[str], term_positions: Dict[str, List[int]]) -> DocumentScore:
+        with timed('search.metadata'):
+            doc_meta = self.index.get_document(doc_id)
+
             # Check for matches in title and description
-            title = doc_meta.get('title', '').lower()
-            description = doc_meta.get('meta_description', '').lower()
-            
+            title = doc_meta.title.lower()
+            description = doc_meta.meta_description.lower()
+
             title_match = any(token in title for token in query_tokens)
             desc_match = any(token in description for token in query_tokens)
-            
-            # Score document
-            score = self.scorer.score_document(
-                doc_id=doc_id,
-                query_terms=query_tokens,
-                term_positions=term_positions,
-                title_match=title_match,
-                description_match=desc_match
-            )
-            scored_docs.append(score)
-
-        scored_docs.sort(key=lambda x: x.score, reverse=True)
-        return [doc.doc_id for doc in scored_docs[:max_results]]
+
+        return scorer.score_document(
+            doc_id=doc_id,
+            query_terms=query_tokens,
+            term_positions=term_positions,
+            title_match=title_match,
+            description_match=desc_match
+        )
@@ -0,0 +1,289 @@
+"""Binary on-disk segment format for the inverted index.
+
+Layout (all integers little-endian):
+
+    header      magic, version, doc count, term count, section offsets
+    term index  (n_terms + 1) entries of (term offset u64, docs offset u64, doc freq u32, max tf u32,
+                positions offset u64)
+    term data   UTF-8 terms, sorted bytewise
+    docs        per term: for each doc, varint(doc delta), varint(tf)
+    positions   per term: for each doc, tf x varint(position delta)
+
+Doc IDs are the dense integer IDs of the index's DocumentStore, which is
+saved next to the segment (see ``docstore_path``). The max tf bounds a term's
+score for top-k pruning. Positions are kept apart from the doc IDs and tfs,
+so scoring by term frequency decodes only the docs block; positions are
+decoded when a phrase, NEAR or field-aware scorer first reads them.
+
+The file is opened through ``mmap`` so loading only parses the header; term
+lookups binary-search the term index and decode just the postings they touch.
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+import json
+import mmap
+import os
+import struct
+import logging
+import numpy as np
+from .docstore import DocumentStore, docstore_path
+from .postings import PostingList, encode_varint
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SYLPHSEG'
+VERSION = 4
+
+_HEADER = struct.Struct('<8sHHIIQQQQ')
+_TERM_ENTRY = struct.Struct('<QQIIQ')
+
+
+def encode_postings(postings: PostingList) -> Tuple[bytes, bytes]:
+    """(docs, positions) blocks of one posting list"""
+    docs = bytearray()
+    positions_out = bytearray()
+    last_doc = 0
+    for i, doc_id in enumerate(postings.doc_ids):
+        encode_varint(doc_id - last_doc, docs)
+        last_doc = doc_id
+        positions = postings.positions_at(i)
+        encode_varint(len(positions), docs)
+        last_pos = 0
+        for pos in positions:
+            encode_varint(pos - last_pos, positions_out)
+            last_pos = pos
+    return bytes(docs), bytes(positions_out)
+
+
+def decode_varints(data: bytes) -> np.ndarray:
+    """Every varint in ``data``, decoded at once"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    if len(ends) == len(raw):
+        return raw.astype(np.uint64)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = (np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)) * 7
+    values = (raw & 0x7F).astype(np.uint64) << shifts.astype(np.uint64)
+    return np.add.reduceat(values, starts)
+
+
+def _as_array(values: np.ndarray) -> array:
+    return array('I', values.astype(np.uint32).tobytes())
+
+
+def decode_positions(data: bytes, offsets: np.ndarray, tfs: np.ndarray) -> array:
+    """Positions block of a posting list, deltas restart at each document"""
+    running = np.cumsum(decode_varints(data))
+    # Running total before each document's first position
+    before = np.concatenate((np.zeros(1, dtype=np.uint64), running))[offsets]
+    return _as_array(running - np.repeat(before, tfs))
+
+
+def decode_postings(buf, docs: Tuple[int, int], positions: Tuple[int, int],
+                    max_tf: int = 0) -> PostingList:
+    """Posting list from the ``(start, end)`` byte ranges of its docs and positions blocks
+
+    Only the docs block is decoded. The positions block is copied out of
+    ``buf``, so the postings outlive the segment, and decoded on first use.
+    """
+    postings = PostingList()
+    postings.max_tf = max_tf
+    values = decode_varints(buf[docs[0]:docs[1]])
+    tfs = values[1::2].astype(np.int64)
+    ends = np.cumsum(tfs)
+    offsets = ends - tfs
+    postings.doc_ids = _as_array(np.cumsum(values[0::2]))
+    postings.offsets = _as_array(offsets)
+    data = buf[positions[0]:positions[1]]
+    postings.defer_positions(int(ends[-1]) if len(ends) else 0, lambda: decode_positions(data, offsets, tfs))
+    return postings
+
+
+def write_segment(filepath: str, terms: Iterable[Tuple[str, PostingList]], doc_count: int) -> int:
+    """Write (term, postings) pairs as a segment, returns the term count"""
+    entries = sorted(
+        (term.encode('utf-8'), postings) for term, postings in terms if len(postings)
+    )
+
+    term_index = bytearray()
+    term_data = bytearray()
+    docs_data = bytearray()
+    positions_data = bytearray()
+    for term_bytes, postings in entries:
+        term_index += _TERM_ENTRY.pack(len(term_data), len(docs_data), len(postings), postings.max_tf,
+                                       len(positions_data))
+        term_data += term_bytes
+        docs, positions = encode_postings(postings)
+        docs_data += docs
+        positions_data += positions
+    term_index += _TERM_ENTRY.pack(len(term_data), len(docs_data), 0, 0, len(positions_data))
+
+    term_index_offset = _HEADER.size
+    term_data_offset = term_index_offset + len(term_index)
+    docs_offset = term_data_offset + len(term_data)
+    positions_offset = docs_offset + len(docs_data)
+    header = _HEADER.pack(MAGIC, VERSION, 0, doc_count, len(entries),
+                          term_index_offset, term_data_offset, docs_offset, positions_offset)
+
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for section in (header, term_index, term_data, docs_data, positions_data):
+            f.write(section)
+    os.replace(tmp_path, filepath)
+
+    return len(entries)
+
+
+def is_segment(filepath: str) -> bool:
+    with open(filepath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class SegmentReader:
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Empty segment file {filepath}")
+
+        magic, self.version = struct.unpack_from('<8sH', self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{filepath} is not a Sylph index segment")
+        if self.version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported segment version {self.version} in {filepath}")
+        (_, _, _, self.doc_count, self.term_count,
+         self._term_index, self._term_data, self._docs, self._positions) = _HEADER.unpack_from(self._mm, 0)
+
+    def __len__(self) -> int:
+        return self.term_count
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _entry(self, i: int) -> Tuple[int, ...]:
+        # (term offset, docs offset, doc freq, max tf, positions offset)
+        return _TERM_ENTRY.unpack_from(self._mm, self._term_index + i * _TERM_ENTRY.size)
+
+    def _term_bytes(self, i: int) -> bytes:
+        start = self._entry(i)[0]
+        end = self._entry(i + 1)[0]
+        return self._mm[self._term_data + start:self._term_data + end]
+
+    def term(self, i: int) -> str:
+        return self._term_bytes(i).decode('utf-8')
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, term: str) -> int:
+        key = term.encode('utf-8')
+        i = self._lower_bound(key)
+        if i < self.term_count and self._term_bytes(i) == key:
+            return i
+        return -1
+
+    def doc_freq(self, term: str) -> int:
+        i = self.find(term)
+        return self._entry(i)[2] if i >= 0 else 0
+
+    def terms(self) -> Iterator[str]:
+        for i in range(self.term_count):
+            yield self.term(i)
+
+    def max_tf(self, term: str) -> int:
+        i = self.find(term)
+        return self._entry(i)[3] if i >= 0 else 0
+
+    def _postings_at(self, i: int) -> PostingList:
+        entry = self._entry(i)
+        following = self._entry(i + 1)
+        return decode_postings(self._mm,
+                               (self._docs + entry[1], self._docs + following[1]),
+                               (self._positions + entry[4], self._positions + following[4]),
+                               entry[3])
+
+    def search(self, term: str) -> PostingList:
+        i = self.find(term)
+        return self._postings_at(i) if i >= 0 else PostingList()
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        key = prefix.encode('utf-8')
+        i = self._lower_bound(key)
+        while i < self.term_count:
+            term_bytes = self._term_bytes(i)
+            if not term_bytes.startswith(key):
+                break
+            yield term_bytes.decode('utf-8')
+            i += 1
+
+    def starts_with(self, prefix: str) -> Set[int]:
+        documents = set()
+        for term in self.terms_with_prefix(prefix):
+            documents.update(self.search(term).keys())
+        return documents
+
+    def items(self) -> Iterator[Tuple[str, PostingList]]:
+        for i in range(self.term_count):
+            yield self.term(i), self._postings_at(i)
+
+
+def _walk_json_trie(root: Dict) -> Iterator[Tuple[str, Dict[str, List[int]]]]:
+    # Iterative walk, the nested layout is as deep as the longest token
+    stack = [("", root)]
+    while stack:
+        prefix, node = stack.pop()
+        if node.get("is_end") and node.get("documents"):
+            yield prefix, node["documents"]
+        for char, child in node.get("children", {}).items():
+            stack.append((prefix + char, child))
+
+
+def convert_json_index(json_path: str, segment_path: str) -> Tuple[int, int]:
+    """Convert a legacy nested-JSON trie dump into a binary segment and document store
+
+    The legacy format only kept URLs, so the converted documents have no
+    title, description or text until they are re-crawled.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        index_data = json.load(f)
+
+    documents = DocumentStore()
+    terms = []
+    for term, url_postings in _walk_json_trie(index_data):
+        items = []
+        for url, positions in url_postings.items():
+            doc_id = documents.url_to_id.get(url)
+            if doc_id is None:
+                doc_id = documents.add(url)
+            items.append((doc_id, positions))
+        terms.append((term, PostingList.from_items(items)))
+
+    doc_count = len(documents)
+    term_count = write_segment(segment_path, terms, doc_count)
+    documents.save(docstore_path(segment_path))
+    logger.info(f"Converted {json_path} to {segment_path} ({term_count} terms, {doc_count} documents)")
+    return doc_count, term_count
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python -m index.src.segment <index.json> <index.seg>")
+        sys.exit(1)
+    convert_json_index(sys.argv[1], sys.argv[2])
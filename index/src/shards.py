@@ -0,0 +1,81 @@
+"""Document-partitioned sharding.
+
+A sharded index is a root directory holding one ordinary index directory per
+shard, ``shard_000`` to ``shard_<N-1>``. Documents are routed by a stable
+hash of their URL, the identity every re-crawl and delete goes by, so all
+versions of a page land in the same shard. Each shard is served on its own
+(api/shard.py) and queried through a scatter-gather coordinator
+(api/coordinator.py).
+"""
+from hashlib import blake2b
+from typing import List, Optional, Tuple
+import logging
+import os
+from .indexer import InvertedIndex
+from .merge import IndexMerger
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(url: str, num_shards: int) -> int:
+    digest = blake2b(url.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % num_shards
+
+
+def shard_dir(root: str, shard: int) -> str:
+    return os.path.join(root, f"shard_{shard:03d}")
+
+
+def shard_dirs(root: str) -> List[str]:
+    """Shard directories of a sharded index root, in shard order"""
+    return sorted(
+        os.path.join(root, name) for name in os.listdir(root)
+        if name.startswith('shard_') and os.path.isdir(os.path.join(root, name))
+    )
+
+
+class ShardedIndexWriter:
+    """Routes document updates to the shards of a sharded index"""
+
+    def __init__(self, root: str, num_shards: int):
+        existing = shard_dirs(root) if os.path.isdir(root) else []
+        if existing and len(existing) != num_shards:
+            raise ValueError(f"{root} has {len(existing)} shards, not {num_shards}")
+        self.root = root
+        self.num_shards = num_shards
+        self.shards = [InvertedIndex() for _ in range(num_shards)]
+        for shard, index in enumerate(self.shards):
+            index.open(shard_dir(root, shard))
+        self.mergers = [IndexMerger(index.directory, index.merge_policy) for index in self.shards]
+
+    def shard_of(self, url: str) -> InvertedIndex:
+        return self.shards[shard_for(url, self.num_shards)]
+
+    def add_document(self, url: str, text: str, title: str = "", meta_description: str = "") -> Optional[Tuple[int, int]]:
+        """Returns the (shard, doc ID in the shard) of the new document"""
+        shard = shard_for(url, self.num_shards)
+        doc_id = self.shards[shard].add_document(url=url, text=text, title=title, meta_description=meta_description)
+        return (shard, doc_id) if doc_id is not None else None
+
+    def delete_document(self, url: str) -> bool:
+        return self.shard_of(url).delete_document(url)
+
+    def flush(self) -> List[int]:
+        """Flushes every shard, returns the shards that wrote a new segment"""
+        return [shard for shard, index in enumerate(self.shards) if index.flush() is not None]
+
+    def merge_in_background(self, shards: Optional[List[int]] = None) -> None:
+        for shard in range(self.num_shards) if shards is None else shards:
+            self.mergers[shard].merge_in_background()
+
+    def wait(self) -> None:
+        for merger in self.mergers:
+            merger.wait()
+
+    @property
+    def doc_count(self) -> int:
+        return sum(index.doc_count for index in self.shards)
+
+    def close(self) -> None:
+        for index in self.shards:
+            index.close()
@@ -0,0 +1,91 @@
+"""Query-biased snippets read straight from the document store.
+
+A hit's token position maps to a byte offset in the stored text through the
+per-document offset table (see docstore.py). The snippet is the window of at
+most ``max_bytes`` holding the most hits, with its edges moved to token
+starts so no word is cut. Only that window of text, plus a few table
+entries, is read from the mmap'd store.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+import re
+from .docstore import DocumentStore
+
+_WORD = re.compile(r'\w+')
+_ELLIPSIS = '...'
+
+
+@dataclass
+class Snippet:
+    text: str
+    # Character spans of the matched words in text
+    highlights: List[Tuple[int, int]]
+
+    def marked(self, open_tag: str = '<b>', close_tag: str = '</b>') -> str:
+        parts = []
+        end = 0
+        for start, stop in self.highlights:
+            parts += [self.text[end:start], open_tag, self.text[start:stop], close_tag]
+            end = stop
+        parts.append(self.text[end:])
+        return ''.join(parts)
+
+
+def _densest_window(hits: List[int], width: int) -> Tuple[int, int]:
+    """Indexes of the first and last hit of the window of ``width`` bytes with the most hits"""
+    best = (0, 0)
+    first = 0
+    for last, offset in enumerate(hits):
+        while offset - hits[first] > width:
+            first += 1
+        if last - first > best[1] - best[0]:
+            best = (first, last)
+    return best
+
+
+def _token_at_or_after(documents: DocumentStore, local_id: int, offset: int, lo: int, hi: int) -> int:
+    """First body token in [lo, hi) starting at or after a byte offset, hi if none"""
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if documents.token_offset(local_id, mid) < offset:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def make_snippet(documents: DocumentStore, local_id: int, positions: Iterable[int],
+                 max_bytes: int = 300) -> Optional[Snippet]:
+    """Snippet around the body hits among ``positions``, None without any or without offsets"""
+    record = documents.get(local_id)
+    first_body = record.title_token_count + record.description_token_count
+    body_positions = sorted({position - first_body for position in positions
+                             if first_body <= position < first_body + record.offset_count})
+    if not body_positions:
+        return None
+
+    hit_offsets = documents.token_offsets(local_id, body_positions)
+    # Leave room for the last hit's word
+    first, last = _densest_window(hit_offsets, max_bytes * 3 // 4)
+    context = max_bytes - (hit_offsets[last] - hit_offsets[first])
+    start = max(0, hit_offsets[first] - min(context // 2, max_bytes // 3))
+    if start > 0:
+        start = documents.token_offset(local_id, _token_at_or_after(documents, local_id, start, 0, body_positions[first]))
+    end_token = _token_at_or_after(documents, local_id, start + max_bytes, body_positions[last] + 1, record.offset_count)
+    end = documents.token_offset(local_id, end_token) if end_token < record.offset_count else record.length
+
+    # Both edges are token starts, so the slice decodes and re-encodes to the same bytes
+    window = documents.text_slice(local_id, start, end)
+    data = window.encode('utf-8')
+    prefix = _ELLIPSIS if start > 0 else ''
+    highlights = []
+    for offset in hit_offsets[bisect_left(hit_offsets, start):bisect_left(hit_offsets, end)]:
+        word = _WORD.match(window, len(data[:offset - start].decode('utf-8', errors='ignore')))
+        if word:
+            highlights.append((len(prefix) + word.start(), len(prefix) + word.end()))
+    # Tokens split from one word share its offset
+    highlights = list(dict.fromkeys(highlights))
+    text = window.rstrip()
+    suffix = _ELLIPSIS if end < record.length else ''
+    return Snippet(f"{prefix}{text}{suffix}", highlights)
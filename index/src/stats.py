@@ -0,0 +1,123 @@
+from array import array
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
+import heapq
+
+
+class DocumentFrequencies(Mapping):
+    """Document frequencies summed over an index's segments when looked up
+
+    Each source has ``doc_freq(term)`` and ``vocabulary()``, its terms in
+    sorted order. Nothing is built up front, so a snapshot costs the same
+    whatever the vocabulary size; iterating merges the sorted vocabularies.
+    """
+
+    def __init__(self, sources: Iterable):
+        self._sources = tuple(sources)
+
+    def __getitem__(self, term: str) -> int:
+        count = sum(source.doc_freq(term) for source in self._sources)
+        if not count:
+            raise KeyError(term)
+        return count
+
+    def __iter__(self) -> Iterator[str]:
+        last = None
+        for term in heapq.merge(*(source.vocabulary() for source in self._sources)):
+            if term != last:
+                yield term
+                last = term
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+@dataclass(frozen=True)
+class IndexStatistics:
+    """Read-only corpus statistics for one index generation
+
+    Built by ``InvertedIndex.statistics()`` and shared by every query of
+    that generation; scorers precompute their per-document factors from it
+    and derive per-term ones only for the terms queries use.
+    """
+    generation: int
+    total_docs: int
+    total_tokens: int
+    doc_freq: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    doc_lengths: array = field(default_factory=lambda: array('I'))
+    title_lengths: array = field(default_factory=lambda: array('I'))
+    description_lengths: array = field(default_factory=lambda: array('I'))
+    # Per-field token totals of a larger collection this index is part of, see with_collection()
+    collection_field_tokens: Optional[Mapping[str, int]] = None
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_tokens / self.total_docs if self.total_docs else 0.0
+
+    def field_token_totals(self) -> Dict[str, int]:
+        if self.collection_field_tokens is not None:
+            return dict(self.collection_field_tokens)
+        title = sum(self.title_lengths)
+        description = sum(self.description_lengths)
+        return {'title': title, 'description': description, 'body': self.total_tokens - title - description}
+
+    def avg_field_lengths(self) -> Dict[str, float]:
+        return {
+            name: total / self.total_docs if self.total_docs else 0.0
+            for name, total in self.field_token_totals().items()
+        }
+
+    def with_collection(self, collection: 'CollectionStatistics') -> 'IndexStatistics':
+        """These per-document statistics with a whole collection's totals, e.g. across shards
+
+        Document frequencies stay local; scorers take the collection's for
+        the query terms (``Scorer.with_doc_freqs``).
+        """
+        return replace(
+            self,
+            total_docs=collection.total_docs,
+            total_tokens=collection.total_tokens,
+            collection_field_tokens=MappingProxyType(dict(collection.field_tokens))
+        )
+
+    def field_lengths(self) -> Dict[str, List[int]]:
+        """Per-document token counts of the title, description and body fields"""
+        body = [
+            total - title - description
+            for total, title, description in zip(self.doc_lengths, self.title_lengths, self.description_lengths)
+        ]
+        return {'title': self.title_lengths, 'description': self.description_lengths, 'body': body}
+
+
+@dataclass
+class CollectionStatistics:
+    """Totals and query-term document frequencies summed over the parts of a collection"""
+    total_docs: int = 0
+    total_tokens: int = 0
+    field_tokens: Dict[str, int] = field(default_factory=dict)
+    doc_freq: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def of(cls, statistics: IndexStatistics, terms: Iterable[str]) -> 'CollectionStatistics':
+        return cls(
+            total_docs=statistics.total_docs,
+            total_tokens=statistics.total_tokens,
+            field_tokens=statistics.field_token_totals(),
+            doc_freq={term: statistics.doc_freq.get(term, 0) for term in terms}
+        )
+
+    @classmethod
+    def merge(cls, parts: Iterable['CollectionStatistics']) -> 'CollectionStatistics':
+        merged = cls()
+        for part in parts:
+            merged.total_docs += part.total_docs
+            merged.total_tokens += part.total_tokens
+            for name, count in part.field_tokens.items():
+                merged.field_tokens[name] = merged.field_tokens.get(name, 0) + count
+            for term, count in part.doc_freq.items():
+                merged.doc_freq[term] = merged.doc_freq.get(term, 0) + count
+        return merged
+
+    def totals_key(self) -> tuple:
+        return (self.total_docs, self.total_tokens, tuple(sorted(self.field_tokens.items())))
@@ -0,0 +1,150 @@
+"""Prefix completions over the words of the index, as they were written.
+
+Completions are the unstemmed words of the indexed documents, each with the
+index term it stems to, so a prefix of an inflected word still finds it:
+``runn`` completes to ``running``, whose term is ``run``. Each segment's
+words are kept sorted in a ``.sug`` file written next to it by flush and
+merge, with the top-k words of every prefix that covers more than
+``max_scan`` words. Other prefixes are answered by scanning their range of
+the sorted words, so a prefix never costs more than ``max_scan`` steps per
+segment. A query merges the segments' candidates and ranks them by the
+index-wide document frequency of their term; since each segment offers only
+its own top k, a term frequent overall but in no segment's top k is missed.
+"""
+from bisect import bisect_left
+from itertools import groupby
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+import heapq
+import json
+import logging
+import os
+from .stats import IndexStatistics
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def suggestions_path(segment_path: str) -> str:
+    return f"{os.path.splitext(segment_path)[0]}.sug"
+
+
+class WordList:
+    """Sorted words of one segment with their terms, and the top words of prefixes covering many of them"""
+
+    def __init__(self, words: List[str], terms: List[str], freqs: List[int], top: Dict[str, List[int]]):
+        self.words = words
+        self.terms = terms
+        # Document frequency of each word's term in the segment
+        self.freqs = freqs
+        self.top = top
+
+    @classmethod
+    def build(cls, forms: Mapping[str, str], doc_freq: Callable[[str], int],
+              k: int = 20, max_scan: int = 1000) -> 'WordList':
+        """Word list of ``forms``, mapping words to their terms, ranked by ``doc_freq(term)``
+
+        Words whose term has no documents are left out.
+        """
+        term_freqs: Dict[str, int] = {}
+        words, terms, freqs = [], [], []
+        for word in sorted(forms):
+            term = forms[word]
+            freq = term_freqs.get(term)
+            if freq is None:
+                freq = term_freqs[term] = doc_freq(term)
+            if freq:
+                words.append(word)
+                terms.append(term)
+                freqs.append(freq)
+        word_list = cls(words, terms, freqs, {})
+
+        # Prefixes one character longer only need looking at inside the ranges that were too long
+        ranges = [(0, len(words))]
+        length = 1
+        while ranges:
+            longer = []
+            for start, end in ranges:
+                for prefix, group in groupby(range(start, end), key=lambda i: words[i][:length]):
+                    indexes = list(group)
+                    if len(indexes) > max_scan:
+                        word_list.top[prefix] = word_list._best(indexes, k)
+                        longer.append((indexes[0], indexes[-1] + 1))
+            ranges = longer
+            length += 1
+        return word_list
+
+    def _best(self, indexes: Iterable[int], limit: int) -> List[int]:
+        """The ``limit`` most frequent terms among ``indexes``, each as its shortest word"""
+        words = self.words
+        best: Dict[str, int] = {}
+        for i in indexes:
+            j = best.get(self.terms[i])
+            if j is None or len(words[i]) < len(words[j]):
+                best[self.terms[i]] = i
+        return heapq.nsmallest(limit, best.values(), key=lambda i: (-self.freqs[i], words[i]))
+
+    def candidates(self, prefix: str, limit: int, max_scan: int = 1000) -> List[Tuple[str, str]]:
+        """(word, term) of up to ``limit`` of this segment's most frequent terms with a word starting with ``prefix``"""
+        indexes = self.top.get(prefix)
+        if indexes is None:
+            start = bisect_left(self.words, prefix)
+            end = min(start + max_scan, len(self.words))
+            scanned = []
+            for i in range(start, end):
+                if not self.words[i].startswith(prefix):
+                    break
+                scanned.append(i)
+            indexes = self._best(scanned, limit)
+        return [(self.words[i], self.terms[i]) for i in indexes[:limit]]
+
+    def save(self, filepath: str) -> None:
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': VERSION, 'words': self.words, 'terms': self.terms,
+                       'freqs': self.freqs, 'top': self.top}, f, separators=(',', ':'))
+        os.replace(tmp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'WordList':
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"Unsupported word list version {data.get('version')} in {filepath}")
+        return cls(data['words'], data['terms'], data['freqs'], data['top'])
+
+
+def load_word_list(segment_path: str, reader) -> WordList:
+    """A segment's word list, or a list of its terms for segments written without one"""
+    path = suggestions_path(segment_path)
+    if os.path.exists(path):
+        return WordList.load(path)
+    logger.info(f"No word list for {segment_path}, completing its stemmed terms")
+    return WordList.build({term: term for term in reader.terms()}, reader.doc_freq)
+
+
+class CompletionIndex:
+    """Top-k completions of word prefixes by document frequency, for one statistics snapshot"""
+
+    def __init__(self, statistics: IndexStatistics, word_lists: Iterable[WordList], k: int = 20,
+                 max_scan: int = 1000):
+        self.statistics = statistics
+        self.word_lists = list(word_lists)
+        self.k = k
+        self.max_scan = max_scan
+        self.doc_freq = statistics.doc_freq
+
+    def complete(self, prefix: str, limit: Optional[int] = None) -> List[Tuple[str, str, int]]:
+        """Up to ``limit`` (word, term, document frequency) triples, most frequent term first"""
+        limit = min(limit or self.k, self.k)
+        if not prefix or limit <= 0:
+            return []
+        best: Dict[str, str] = {}
+        for word_list in self.word_lists:
+            for word, term in word_list.candidates(prefix, limit, self.max_scan):
+                current = best.get(term)
+                if current is None or (len(word), word) < (len(current), current):
+                    best[term] = word
+        doc_freq = {term: self.doc_freq.get(term, 0) for term in best}
+        terms = heapq.nsmallest(limit, best, key=lambda term: (-doc_freq[term], best[term]))
+        return [(best[term], term, doc_freq[term]) for term in terms]
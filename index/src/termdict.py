@@ -0,0 +1,59 @@
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from .postings import PostingList
+
+
+class TermDictionary:
+    """Compact drop-in for Trie: one hash entry per term plus a sorted term array for prefix scans"""
+    __slots__ = ('_postings', '_sorted_terms', '_size')
+
+    def __init__(self):
+        self._postings: Dict[str, PostingList] = {}
+        self._sorted_terms: Optional[List[str]] = None
+        self._size = 0
+
+    def insert(self, word: str, doc_id: int, position: int) -> None:
+        postings = self._postings.get(word)
+        if postings is None:
+            postings = self._postings[word] = PostingList()
+            self._sorted_terms = None
+
+        postings.add(doc_id, position)
+        self._size += 1
+
+    def add_postings(self, word: str, postings: PostingList, doc_base: int = 0) -> None:
+        """Append a posting list built elsewhere, shifting its doc IDs by ``doc_base``"""
+        existing = self._postings.get(word)
+        if existing is None:
+            existing = self._postings[word] = PostingList()
+            self._sorted_terms = None
+        existing.extend(postings, doc_base)
+        self._size += postings.position_count()
+
+    def search(self, word: str) -> PostingList:
+        return self._postings.get(word) or PostingList()
+
+    def _terms(self) -> List[str]:
+        # Rebuilt lazily, so bulk inserts pay for one sort instead of one per new term
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        return self._sorted_terms
+
+    def terms_with_prefix(self, prefix: str) -> Iterator[str]:
+        terms = self._terms()
+        i = bisect_left(terms, prefix)
+        while i < len(terms) and terms[i].startswith(prefix):
+            yield terms[i]
+            i += 1
+
+    def starts_with(self, prefix: str) -> Set[int]:
+        documents = set()
+        for term in self.terms_with_prefix(prefix):
+            documents.update(self._postings[term].keys())
+        return documents
+
+    def items(self) -> Iterator[Tuple[str, PostingList]]:
+        return iter(self._postings.items())
+
+    def __len__(self) -> int:
+        return self._size
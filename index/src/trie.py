@@ -1,4 +1,4 @@
-from typing import Dict, List, Set, Optional
+from typing import Dict, Iterator, List, Set, Optional, Tuple
 from collections import defaultdict
 
 class TrieNode:
@@ -23,6 +23,11 @@ class Trie:
         node.documents[doc_id].append(position)
         self._size += 1
 
+    def add_postings(self, word: str, postings, doc_base: int = 0) -> None:
+        for doc_id, positions in postings.items():
+            for position in positions:
+                self.insert(word, doc_id + doc_base, position)
+
     def search(self, word: str) -> Dict[str, List[int]]:
         node = self._find_node(word)
         return node.documents if node and node.is_end else {}
@@ -52,6 +57,14 @@ class Trie:
         for child in node.children.values():
             self._collect_documents(child, documents)
 
-        
+    def items(self) -> Iterator[Tuple[str, Dict[str, List[int]]]]:
+        stack = [("", self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.is_end:
+                yield prefix, node.documents
+            for char, child in node.children.items():
+                stack.append((prefix + char, child))
+
     def __len__(self) -> int:
         return self._size
\ No newline at end of file
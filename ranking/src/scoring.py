@@ -1,28 +1,112 @@
+from collections import ChainMap
 from dataclasses import dataclass
-from typing import Dict, List
+from typing import Dict, List, Mapping, MutableMapping, Optional, Tuple
+import copy
+from index.src.stats import IndexStatistics
 import math
+import numpy as np
 
 @dataclass
 class DocumentScore:
-    doc_id: str
+    doc_id: int
     score: float
     title_match: bool
     description_match: bool
     positions: List[int]
 
-class TFIDFScorer:
-    def __init__(self, total_docs: int):
-        self.total_docs = total_docs
-        self.document_frequency: Dict[str, int] = {}
+def _as_numpy(values) -> np.ndarray:
+    # Zero-copy view over an array.array of postings or statistics
+    return np.frombuffer(values, dtype=values.typecode) if len(values) else np.zeros(0, dtype=np.uint32)
+
+
+# Up to this many postings in a query, scoring them all costs less than working out what to skip
+EXHAUSTIVE_MAX_POSTINGS = 10_000
+
+
+def term_frequencies(postings) -> np.ndarray:
+    offsets = _as_numpy(postings.offsets).astype(np.int64)
+    return np.diff(offsets, append=postings.position_count())
+
+
+class Scorer:
+    """Base class for scorers built from one immutable IndexStatistics snapshot
+
+    Scorers precompute their per-document factors in ``__init__``. Per-term
+    idf is computed the first time a query uses the term and memoised; the
+    value only depends on the snapshot, so concurrent queries computing it
+    at once store the same number. ``upper_bound`` feeds WAND pruning;
+    scorers with ``supports_batch`` also score a whole candidate set at
+    once with ``score_batch``.
+    """
+    supports_batch = False
+
+    def __init__(self, statistics: IndexStatistics):
+        self.statistics = statistics
+        self.total_docs = max(1, statistics.total_docs)
+        self.document_frequency = statistics.doc_freq
+        self.idf: MutableMapping[str, float] = {}
+
+    def compute_idf(self, term: str, doc_count: int) -> float:
+        raise NotImplementedError
+
+    def with_doc_freqs(self, doc_freq: Mapping[str, int]) -> 'Scorer':
+        """A copy scoring the given terms with these document frequencies instead"""
+        scorer = copy.copy(self)
+        scorer.idf = ChainMap({term: self.compute_idf(term, count) for term, count in doc_freq.items()}, self.idf)
+        return scorer
+
+    def term_idf(self, term: str) -> float:
+        idf = self.idf.get(term)
+        if idf is None:
+            idf = self.idf[term] = self.compute_idf(term, self.document_frequency.get(term, 0))
+        return idf
+
+    def upper_bound(self, term: str, max_tf: int, first_position: int = 0) -> float:
+        raise NotImplementedError
+
+    def score_document(self,
+                      doc_id: int,
+                      query_terms: List[str],
+                      term_positions: Dict[str, List[int]],
+                      title_match: bool = False,
+                      description_match: bool = False) -> DocumentScore:
+        raise NotImplementedError
+
+    def score_batch(self, query_terms: List[str], postings: Mapping,
+                    k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc IDs, scores) for the documents in the query terms' posting lists
+
+        With ``k``, documents that cannot be among the k best may be left out.
+        """
+        raise NotImplementedError
+
+
+class TFIDFScorer(Scorer):
     
     def compute_tf(self, term: str, positions: List[int]) -> float:
         return 1 + math.log10(len(positions)) if positions else 0
     
     def compute_idf(self, term: str, doc_count: int) -> float:
         return math.log10(self.total_docs / (doc_count + 1))
-    
+
+    def upper_bound(self, term: str, max_tf: int, first_position: int = 0) -> float:
+        """Largest score a document can get from this term
+
+        With the default ``first_position`` this bounds the whole posting list;
+        passing a document's actual tf and first position bounds just that
+        document. Includes the title and description boosts and is clamped at
+        zero so bounds can be summed across terms.
+        """
+        if max_tf <= 0:
+            return 0.0
+        idf = self.term_idf(term)
+        position_boost = 1.0 / (1 + first_position)
+        bound = (1 + math.log10(max_tf)) * idf * (1 + position_boost) * 1.5 * 1.2
+        # Headroom for float rounding between this product and score_document
+        return max(0.0, bound * (1 + 1e-9))
+
     def score_document(self, 
-                      doc_id: str, 
+                      doc_id: int, 
                       query_terms: List[str],
                       term_positions: Dict[str, List[int]], 
                       title_match: bool = False,
@@ -31,16 +115,16 @@ class TFIDFScorer:
         score = 0.0
         all_positions = []
         
-        for term in query_terms:
+        for term in dict.fromkeys(query_terms):
             if term in term_positions:
                 term_pos = term_positions[term]
                 all_positions.extend(term_pos)
                 tf = self.compute_tf(term, term_pos)
-                idf = self.compute_idf(term, self.document_frequency.get(term, 0))
-                score = tf * idf
+                idf = self.term_idf(term)
+                term_score = tf * idf
 
                 position_boost = 1.0 / (1 + min(term_pos)) if term_pos else 1.0
-                score += score * position_boost
+                score += term_score + term_score * position_boost
         
         # Boost scores based on matches
         if title_match:
@@ -54,4 +138,229 @@ class TFIDFScorer:
             title_match=title_match,
             description_match=description_match,
             positions=sorted(all_positions)
-        )
\ No newline at end of file
+        )
+
+
+class BM25Scorer(Scorer):
+    """Okapi BM25 with per-document length normalisation"""
+    supports_batch = True
+
+    def __init__(self, statistics: IndexStatistics, k1: float = 1.2, b: float = 0.75):
+        super().__init__(statistics)
+        self.k1 = k1
+        self.b = b
+        lengths = _as_numpy(statistics.doc_lengths).astype(np.float64)
+        avg_length = statistics.avg_doc_length or 1.0
+        self.norms = k1 * (1 - b + b * lengths / avg_length)
+
+    def compute_idf(self, term: str, doc_count: int) -> float:
+        return math.log(1 + (self.total_docs - doc_count + 0.5) / (doc_count + 0.5))
+
+    def upper_bound(self, term: str, max_tf: int, first_position: int = 0) -> float:
+        if max_tf <= 0:
+            return 0.0
+        # The smallest possible norm is k1 * (1 - b), for an empty document
+        bound = self.term_idf(term) * max_tf * (self.k1 + 1) / (max_tf + self.k1 * (1 - self.b))
+        return bound * (1 + 1e-9)
+
+    def score_document(self,
+                      doc_id: int,
+                      query_terms: List[str],
+                      term_positions: Dict[str, List[int]],
+                      title_match: bool = False,
+                      description_match: bool = False) -> DocumentScore:
+        score = 0.0
+        all_positions = []
+        norm = self.norms[doc_id]
+        for term in dict.fromkeys(query_terms):
+            term_pos = term_positions.get(term)
+            if term_pos:
+                all_positions.extend(term_pos)
+                tf = len(term_pos)
+                score += self.term_idf(term) * tf * (self.k1 + 1) / (tf + norm)
+
+        return DocumentScore(
+            doc_id=doc_id,
+            score=float(score),
+            title_match=title_match,
+            description_match=description_match,
+            positions=sorted(all_positions)
+        )
+
+    def score_batch(self, query_terms: List[str], postings: Mapping,
+                    k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores every posting up to ``EXHAUSTIVE_MAX_POSTINGS``, then prunes with MaxScore
+
+        Pruning takes the k-th best score from the highest-bound term alone,
+        which every document's full score is at least. Terms whose upper
+        bounds together stay below it are non-essential: a document only in
+        those cannot reach the top k, so they are scored just for the
+        documents of the other terms. Kept documents get their full scores.
+        """
+        lists = [(term, postings[term]) for term in dict.fromkeys(query_terms) if postings.get(term)]
+        total_postings = sum(len(term_postings) for _, term_postings in lists)
+        if k is None or len(lists) < 2 or total_postings <= EXHAUSTIVE_MAX_POSTINGS:
+            return self._score_all(lists)
+
+        bounds = {term: self.upper_bound(term, term_postings.max_tf) for term, term_postings in lists}
+        lists.sort(key=lambda item: -bounds[item[0]])
+        first_term, first_postings = lists[0]
+        first_ids = _as_numpy(first_postings.doc_ids)
+        first_scores = self._term_scores(first_term, first_ids, first_postings)
+        if len(first_scores) < k:
+            return self._score_all(lists)
+        threshold = np.partition(first_scores, len(first_scores) - k)[len(first_scores) - k]
+
+        essential = len(lists)
+        total = 0.0
+        while essential > 1 and total + bounds[lists[essential - 1][0]] < threshold:
+            essential -= 1
+            total += bounds[lists[essential][0]]
+
+        doc_ids = [first_ids]
+        contributions = [first_scores]
+        for term, term_postings in lists[1:essential]:
+            ids = _as_numpy(term_postings.doc_ids)
+            doc_ids.append(ids)
+            contributions.append(self._term_scores(term, ids, term_postings))
+        if essential == len(lists):
+            return _accumulate(doc_ids, contributions)
+        candidates = _union(doc_ids)
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        for ids, contribution in zip(doc_ids, contributions):
+            scores += np.bincount(np.searchsorted(candidates, ids), weights=contribution, minlength=len(candidates))
+        for term, term_postings in lists[essential:]:
+            ids = _as_numpy(term_postings.doc_ids)
+            slots = np.searchsorted(candidates, ids)
+            mask = candidates[np.minimum(slots, len(candidates) - 1)] == ids
+            scores += np.bincount(slots[mask], weights=self._term_scores(term, ids, term_postings, mask),
+                                  minlength=len(candidates))
+        return candidates.astype(np.int64), scores
+
+    def _score_all(self, lists: List[Tuple[str, object]]) -> Tuple[np.ndarray, np.ndarray]:
+        doc_ids = []
+        contributions = []
+        for term, term_postings in lists:
+            ids = _as_numpy(term_postings.doc_ids)
+            doc_ids.append(ids)
+            contributions.append(self._term_scores(term, ids, term_postings))
+        return _accumulate(doc_ids, contributions)
+
+    def _term_scores(self, term: str, ids: np.ndarray, postings, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Scores of the term in each posting, or in the postings selected by ``mask``"""
+        tf = term_frequencies(postings)
+        if mask is not None:
+            ids, tf = ids[mask], tf[mask]
+        return self.term_idf(term) * tf * (self.k1 + 1) / (tf + self.norms[ids])
+
+
+class BM25FScorer(BM25Scorer):
+    """BM25F over the title, description and body fields
+
+    Term frequencies are weighted and length-normalised per field before
+    the BM25 saturation. Fields are recovered from token positions, since a
+    document's tokens are its title, description and body in that order.
+    """
+    FIELDS = ('title', 'description', 'body')
+
+    def __init__(self,
+                 statistics: IndexStatistics,
+                 k1: float = 1.2,
+                 field_weights: Optional[Dict[str, float]] = None,
+                 field_b: Optional[Dict[str, float]] = None):
+        super().__init__(statistics, k1=k1)
+        self.field_weights = field_weights or {'title': 3.0, 'description': 2.0, 'body': 1.0}
+        self.field_b = field_b or {'title': 0.5, 'description': 0.5, 'body': 0.75}
+
+        lengths = {
+            field: np.asarray(values, dtype=np.float64)
+            for field, values in statistics.field_lengths().items()
+        }
+        avg_lengths = statistics.avg_field_lengths()
+        self.field_norms = {}
+        for field in self.FIELDS:
+            b = self.field_b[field]
+            avg_length = avg_lengths[field]
+            relative = lengths[field] / avg_length if avg_length else np.zeros_like(lengths[field])
+            self.field_norms[field] = 1 - b + b * relative
+
+        self.title_end = lengths['title'].astype(np.int64)
+        self.description_end = self.title_end + lengths['description'].astype(np.int64)
+
+    def upper_bound(self, term: str, max_tf: int, first_position: int = 0) -> float:
+        # Saturation keeps tf~ / (k1 + tf~) below one whatever the field weights
+        return self.term_idf(term) * (self.k1 + 1) * (1 + 1e-9) if max_tf > 0 else 0.0
+
+    def _field_counts(self, ids: np.ndarray, tf: np.ndarray, positions: np.ndarray) -> Dict[str, np.ndarray]:
+        rows = np.repeat(np.arange(len(ids)), tf)
+        title_end = self.title_end[ids][rows]
+        description_end = self.description_end[ids][rows]
+        in_title = positions < title_end
+        in_description = ~in_title & (positions < description_end)
+        counts = {
+            'title': np.bincount(rows, weights=in_title, minlength=len(ids)),
+            'description': np.bincount(rows, weights=in_description, minlength=len(ids)),
+        }
+        counts['body'] = tf - counts['title'] - counts['description']
+        return counts
+
+    def _pseudo_tf(self, ids: np.ndarray, counts: Dict[str, np.ndarray]) -> np.ndarray:
+        pseudo_tf = np.zeros(len(ids), dtype=np.float64)
+        for field in self.FIELDS:
+            pseudo_tf += self.field_weights[field] * counts[field] / self.field_norms[field][ids]
+        return pseudo_tf
+
+    def _term_scores(self, term: str, ids: np.ndarray, postings, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        tf = term_frequencies(postings)
+        positions = _as_numpy(postings.positions).astype(np.int64)
+        if mask is not None:
+            positions = positions[np.repeat(mask, tf)]
+            ids, tf = ids[mask], tf[mask]
+        counts = self._field_counts(ids, tf, positions)
+        pseudo_tf = self._pseudo_tf(ids, counts)
+        return self.term_idf(term) * pseudo_tf * (self.k1 + 1) / (self.k1 + pseudo_tf)
+
+    def score_document(self,
+                      doc_id: int,
+                      query_terms: List[str],
+                      term_positions: Dict[str, List[int]],
+                      title_match: bool = False,
+                      description_match: bool = False) -> DocumentScore:
+        score = 0.0
+        all_positions = []
+        title_match = description_match = False
+        ids = np.array([doc_id])
+        for term in dict.fromkeys(query_terms):
+            term_pos = term_positions.get(term)
+            if not term_pos:
+                continue
+            all_positions.extend(term_pos)
+            counts = self._field_counts(ids, np.array([len(term_pos)]), np.asarray(term_pos, dtype=np.int64))
+            title_match = title_match or counts['title'][0] > 0
+            description_match = description_match or counts['description'][0] > 0
+            pseudo_tf = self._pseudo_tf(ids, counts)[0]
+            score += self.term_idf(term) * pseudo_tf * (self.k1 + 1) / (self.k1 + pseudo_tf)
+
+        return DocumentScore(
+            doc_id=doc_id,
+            score=float(score),
+            title_match=bool(title_match),
+            description_match=bool(description_match),
+            positions=sorted(all_positions)
+        )
+
+
+def _union(doc_ids: List[np.ndarray]) -> np.ndarray:
+    """Sorted union of sorted doc ID arrays"""
+    if len(doc_ids) == 1:
+        return doc_ids[0]
+    merged = np.sort(np.concatenate(doc_ids))
+    return merged[np.concatenate(([True], merged[1:] != merged[:-1]))]
+
+
+def _accumulate(doc_ids: List[np.ndarray], contributions: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    if not doc_ids:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    unique_ids, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(unique_ids))
+    return unique_ids.astype(np.int64), scores
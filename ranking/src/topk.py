@@ -0,0 +1,117 @@
+from bisect import bisect_left
+from operator import attrgetter
+from typing import Callable, Dict, List, Optional, Sequence
+import heapq
+from .scoring import DocumentScore
+
+_EXHAUSTED = float('inf')
+
+
+class _Cursor:
+    __slots__ = ('term', 'doc_ids', 'index', 'doc', 'upper_bound')
+
+    def __init__(self, term: str, doc_ids: Sequence[int], upper_bound: float):
+        self.term = term
+        self.doc_ids = doc_ids
+        self.index = 0
+        self.doc = doc_ids[0] if len(doc_ids) else _EXHAUSTED
+        self.upper_bound = upper_bound
+
+    def _seek(self, index: int) -> None:
+        self.index = index
+        self.doc = self.doc_ids[index] if index < len(self.doc_ids) else _EXHAUSTED
+
+    def next(self) -> None:
+        self._seek(self.index + 1)
+
+    def advance_to(self, doc_id: int) -> None:
+        self._seek(bisect_left(self.doc_ids, doc_id, self.index))
+
+
+_by_doc = attrgetter('doc')
+
+
+def rank_key(doc: DocumentScore):
+    """Result order shared by exhaustive and pruned evaluation: score desc, then doc ID"""
+    return (-doc.score, doc.doc_id)
+
+
+class WandTopK:
+    """Top-k evaluation with WAND dynamic pruning
+
+    Each term's posting list is walked with a cursor in doc ID order. A
+    document is only scored once the summed upper bounds of the terms that
+    could contain it exceed the current k-th best score, so documents that
+    cannot enter the top k are skipped without being scored. Upper bounds
+    must be non-negative and never below the term's real contribution, which
+    keeps the result identical to exhaustive scoring.
+
+    ``doc_upper_bound`` optionally gives a tighter, cheap bound for one
+    candidate (e.g. from its actual term frequencies) that is checked before
+    the full ``score_fn`` call.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.scored = 0
+
+    def search(self,
+               doc_ids: Dict[str, Sequence[int]],
+               upper_bounds: Dict[str, float],
+               score_fn: Callable[[int, Dict[str, int]], Optional[DocumentScore]],
+               doc_upper_bound: Optional[Callable[[int, Dict[str, int]], float]] = None) -> List[DocumentScore]:
+        """``score_fn(doc_id, {term: index into that term's doc IDs})`` fully scores one document"""
+        if self.k <= 0:
+            return []
+
+        cursors = [
+            _Cursor(term, ids, upper_bounds.get(term, 0.0))
+            for term, ids in doc_ids.items() if len(ids)
+        ]
+        # Min-heap of (score, -doc_id, result): the root is the current k-th best
+        heap = []
+
+        while True:
+            cursors.sort(key=_by_doc)
+            pivot = self._find_pivot(cursors, heap)
+            if pivot is None:
+                break
+
+            pivot_doc = cursors[pivot].doc
+            if cursors[0].doc == pivot_doc:
+                matched = {}
+                for cursor in cursors:
+                    if cursor.doc != pivot_doc:
+                        break
+                    matched[cursor.term] = cursor.index
+                    cursor.next()
+
+                if (doc_upper_bound is not None and len(heap) >= self.k
+                        and doc_upper_bound(pivot_doc, matched) <= heap[0][0]):
+                    continue
+
+                result = score_fn(pivot_doc, matched)
+                self.scored += 1
+                if result is None:
+                    continue
+                entry = (result.score, -result.doc_id, result)
+                if len(heap) < self.k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.advance_to(pivot_doc)
+
+        return sorted((entry[2] for entry in heap), key=rank_key)
+
+    def _find_pivot(self, cursors: List[_Cursor], heap: list) -> Optional[int]:
+        threshold = heap[0][0] if len(heap) >= self.k else None
+        accumulated = 0.0
+        for i, cursor in enumerate(cursors):
+            if cursor.doc == _EXHAUSTED:
+                return None
+            accumulated += cursor.upper_bound
+            if threshold is None or accumulated > threshold:
+                return i
+        return None
@@ -0,0 +1,161 @@
+"""Result caching: backend bounds and expiry, and invalidation by index version"""
+import pytest
+from index.src.cache import LRUCache, RedisCache, ResultCache
+from index.src.indexer import InvertedIndex
+from index.src.search import SearchEngine
+from ranking.src.scoring import DocumentScore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRedis:
+    """The part of redis-py's client RedisCache uses, over a dict"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.entries = {}
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= self.clock():
+            del self.entries[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.entries[key] = (self.clock() + ex if ex is not None else None, value.encode('utf-8'))
+
+
+RESULTS = [DocumentScore(doc_id=3, score=1.5, title_match=True, description_match=False, positions=[0, 4])]
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture(params=['lru', 'redis'])
+def backend(request, clock):
+    if request.param == 'lru':
+        return LRUCache(max_entries=3, ttl=60, clock=clock)
+    return RedisCache(FakeRedis(clock), ttl=60)
+
+
+def test_backend_round_trips_results(backend):
+    assert backend.get('query') is None
+    backend.set('query', RESULTS)
+    assert backend.get('query') == RESULTS
+
+
+def test_backend_entries_expire(backend, clock):
+    backend.set('query', RESULTS)
+    clock.now += 59
+    assert backend.get('query') == RESULTS
+    clock.now += 1
+    assert backend.get('query') is None
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = LRUCache(max_entries=3, ttl=60, clock=clock)
+    for key in 'abc':
+        cache.set(key, RESULTS)
+    assert cache.get('a') == RESULTS
+    cache.set('d', RESULTS)
+    assert len(cache) == 3
+    assert cache.evictions == 1
+    assert cache.get('b') is None
+    assert all(cache.get(key) == RESULTS for key in 'acd')
+
+
+def test_result_cache_counts_hits_and_misses(backend):
+    cache = ResultCache(backend)
+    key = cache.key('v1', 'BM25FScorer', 'harbour', 10)
+    assert cache.get('v1', key) is None
+    cache.put(key, RESULTS)
+    assert cache.get('v1', key) == RESULTS
+    assert cache.get('v1', key) == RESULTS
+    assert cache.stats.to_dict() == dict(hits=2, misses=1, errors=0, invalidations=1, hit_rate=2 / 3)
+
+
+def test_result_cache_counts_backend_errors():
+    class Broken:
+        def get(self, key):
+            raise ConnectionError("down")
+
+        def set(self, key, value):
+            raise ConnectionError("down")
+
+        def invalidate(self):
+            pass
+
+    cache = ResultCache(Broken())
+    assert cache.get('v1', 'key') is None
+    cache.put('key', RESULTS)
+    assert (cache.stats.misses, cache.stats.errors) == (1, 2)
+
+
+@pytest.fixture
+def engine(tmp_path, backend):
+    index = InvertedIndex()
+    index.open(str(tmp_path / 'index'))
+    index.add_document("https://example.com/harbour", "The harbour master keeps the tide tables")
+    index.flush()
+    yield SearchEngine(index, cache=ResultCache(backend))
+    index.close()
+
+
+def search(engine):
+    """Number of results for the test query, and whether they came from the cache"""
+    hits = engine.cache.stats.hits
+    results = engine.search('harbour')
+    return len(results), engine.cache.stats.hits > hits
+
+
+def test_search_hits_until_the_index_changes(engine, tmp_path):
+    index = engine.index
+    assert search(engine) == (1, False)
+    assert search(engine) == (1, True)
+
+    index.add_document("https://example.com/ships", "Ships shelter in the harbour")
+    assert search(engine) == (2, False)
+    assert search(engine) == (2, True)
+
+    index.flush()
+    assert search(engine) == (2, False)
+    assert search(engine) == (2, True)
+
+    # Another writer flushes to the same directory; the change shows up on refresh
+    writer = InvertedIndex()
+    writer.open(str(tmp_path / 'index'))
+    writer.add_document("https://example.com/storms", "Storms batter the harbour wall")
+    writer.flush()
+    writer.close()
+    assert search(engine) == (2, True)
+    assert index.refresh()
+    assert search(engine) == (3, False)
+    assert search(engine) == (3, True)
+    assert engine.cache.stats.invalidations == 4
+
+
+def test_fuzzy_results_cut_short_are_not_cached(engine, monkeypatch):
+    stats = engine.cache.stats
+    assert engine.search('harbor', fuzzy=1)
+    assert engine.search('harbor', fuzzy=1)
+    assert (stats.hits, stats.misses) == (1, 1)
+
+    expand_fuzzy = engine.index.expand_fuzzy
+    # As if the lookup ran out of its time budget after finding what it did
+    monkeypatch.setattr(engine.index, 'expand_fuzzy', lambda *args: (expand_fuzzy(*args)[0], False))
+    assert engine.search('harbur', fuzzy=1)
+    assert engine.search('harbur', fuzzy=1)
+    assert engine.search('harbor', fuzzy=1)
+    assert (stats.hits, stats.misses) == (1, 1)
@@ -0,0 +1,110 @@
+"""Scatter-gather search over local shard processes matches searching one index"""
+import asyncio
+import socket
+import pytest
+from api.coordinator import ScatterGatherCoordinator, launch_local_shards
+from index.src.indexer import InvertedIndex
+from index.src.search import SearchEngine
+from index.src.query import MAX_EXPANSIONS
+from index.src.shards import ShardedIndexWriter, shard_for
+
+DOCUMENTS = [
+    ("https://example.com/python", "Python", "A programming language",
+     "Python is a programming language that lets you work quickly and integrate systems"),
+    ("https://example.com/rust", "Rust", "Systems programming",
+     "Rust is a language empowering everyone to build reliable and efficient software"),
+    ("https://example.com/search", "Search engines", "Inverted indexes",
+     "A search engine keeps an inverted index of the words in every crawled document"),
+    ("https://example.com/crawler", "Crawlers", "Fetching pages",
+     "A web crawler fetches pages, follows their links and hands the text to the indexer"),
+    ("https://example.com/ranking", "Ranking", "BM25 and friends",
+     "Ranking functions such as BM25 score documents by term frequency and document length"),
+    ("https://example.com/shards", "Sharding", "Splitting an index",
+     "A sharded search engine splits its index by document and merges the results of every shard"),
+    ("https://example.com/python-search", "Search in Python", "Writing a search engine",
+     "Writing a search engine in Python: crawl pages, build an inverted index, rank with BM25"),
+    ("https://example.com/languages", "Languages", "Programming languages compared",
+     "Python, Rust and many other programming languages compared for building search software"),
+]
+
+# More words starting with "zet" than a prefix expands to. The first shard's most frequent
+# ones are rare in the second, so its own top terms are not the collection's.
+COMMON = [f"zet{a}{b}" for a in 'bdfg' for b in 'bdfgk'][:MAX_EXPANSIONS]
+RARE = [f"zet{a}{b}" for a in 'mnp' for b in 'bdfgk'][:10]
+
+
+def prefix_documents():
+    urls = ([], [])
+    i = 0
+    while len(urls[0]) < 3 or len(urls[1]) < 3:
+        url = f"https://example.com/zet/{i}"
+        urls[shard_for(url, 2)].append(url)
+        i += 1
+    texts = [" ".join(COMMON), " ".join(COMMON), " ".join(RARE)] + [" ".join(RARE)] * 3
+    return [(url, "Zet", "", text) for url, text in zip(urls[0][:3] + urls[1][:3], texts)]
+
+
+ALL_DOCUMENTS = DOCUMENTS + prefix_documents()
+
+
+def free_ports(count: int):
+    """First of ``count`` consecutive ports that are free right now"""
+    while True:
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            base = probe.getsockname()[1]
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as sock:
+                    sock.bind(('127.0.0.1', port))
+            return base
+        except OSError:
+            continue
+
+
+@pytest.fixture
+def indexes(tmp_path):
+    writer = ShardedIndexWriter(str(tmp_path / 'sharded'), 2)
+    single = InvertedIndex()
+    single.open(str(tmp_path / 'single'))
+    for url, title, description, text in ALL_DOCUMENTS:
+        writer.add_document(url, text, title=title, meta_description=description)
+        single.add_document(url, text, title=title, meta_description=description)
+    writer.flush()
+    assert all(shard.doc_count for shard in writer.shards)
+    writer.close()
+    single.flush()
+    yield str(tmp_path / 'sharded'), single
+    single.close()
+
+
+def test_merged_shard_results_match_single_index(indexes):
+    root, single = indexes
+    processes, urls = launch_local_shards(root, base_port=free_ports(2))
+    try:
+        async def search_all(queries):
+            coordinator = ScatterGatherCoordinator(urls, timeout=10.0)
+            await coordinator.start()
+            try:
+                return [await coordinator.search(query, len(ALL_DOCUMENTS)) for query in queries]
+            finally:
+                await coordinator.close()
+
+        queries = ["search engine", "python programming", "index shard results", "language",
+                   "program* search", "zet*", "zet* OR python"]
+        engine = SearchEngine(single)
+        for query, response in zip(queries, asyncio.run(search_all(queries))):
+            assert not response["partial"]
+            # Every match is returned, so ties broken differently by the two cannot change what is found
+            expected = sorted(
+                (single.get_document(result.doc_id).url, result.score)
+                for result in engine.search(query, len(ALL_DOCUMENTS))
+            )
+            merged = sorted((result["url"], result["score"]) for result in response["results"])
+            assert expected, query
+            assert [url for url, _ in merged] == [url for url, _ in expected], query
+            assert [score for _, score in merged] == pytest.approx([score for _, score in expected]), query
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
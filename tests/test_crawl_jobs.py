@@ -0,0 +1,102 @@
+"""A crawl job started through the API indexes a local site while searches keep answering"""
+import functools
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from fastapi.testclient import TestClient
+import api.app as app_module
+from api.jobs import COMPLETED, FINISHED, RUNNING, CrawlJobManager
+from index.src.indexer import InvertedIndex
+from index.src.search import SearchEngine
+
+PAGES = {
+    'index.html': ("Sylph test site", "Welcome to the lighthouse keeper's notebook",
+                   ['tides.html', 'storms.html']),
+    'tides.html': ("Tides", "Spring tides flood the harbour twice a month", ['index.html', 'storms.html']),
+    'storms.html': ("Storms", "Winter storms batter the lighthouse and the harbour wall", ['ships.html']),
+    'ships.html': ("Ships", "Fishing ships shelter in the harbour when storms arrive", ['index.html']),
+}
+# Seconds a search may take while the crawl runs
+SEARCH_LATENCY = 1.0
+CRAWL_TIMEOUT = 120.0
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    root = tmp_path / 'site'
+    root.mkdir()
+    for name, (title, text, links) in PAGES.items():
+        anchors = ''.join(f'<a href="{link}">{link}</a> ' for link in links)
+        (root / name).write_text(f"<html><head><title>{title}</title></head>"
+                                 f"<body><h1>{title}</h1><p>{text}</p>{anchors}</body></html>", encoding='utf-8')
+    # Port 0 picks a free port
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/index.html"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    index_dir = str(tmp_path / 'index')
+    index = InvertedIndex()
+    index.open(index_dir)
+    # Something to search before the crawl has flushed anything
+    index.add_document("https://example.com/harbour", "The harbour master keeps the tide tables",
+                       title="Harbour")
+    index.flush()
+    jobs = CrawlJobManager(
+        jobs_dir=str(tmp_path / 'crawls'),
+        index_dir=index_dir,
+        on_complete=app_module.refresh_after_crawl,
+        # No HTTP cache, it would be written into the project directory; a short delay keeps the crawl running
+        command=[sys.executable, '-m', 'scrapy', 'crawl', 'sylph_spider',
+                 '-s', 'HTTPCACHE_ENABLED=False', '-s', 'DOWNLOAD_DELAY=0.5']
+    )
+    monkeypatch.setattr(app_module, 'index_dir', index_dir)
+    monkeypatch.setattr(app_module, 'index', index)
+    monkeypatch.setattr(app_module, 'search_engine', SearchEngine(index))
+    monkeypatch.setattr(app_module, 'crawl_jobs', jobs)
+    monkeypatch.setattr(app_module, 'REFRESH_INTERVAL', 0.0)
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+def test_search_answers_while_crawl_runs(site, client):
+    response = client.post('/crawl/', json=[site])
+    assert response.status_code == 202
+    status_url = response.json()['status_url']
+
+    searched_while_running = 0
+    deadline = time.monotonic() + CRAWL_TIMEOUT
+    while True:
+        job = client.get(status_url).json()
+        if job['status'] in FINISHED:
+            break
+        assert time.monotonic() < deadline, f"Crawl still {job['status']} after {CRAWL_TIMEOUT}s"
+        start = time.perf_counter()
+        response = client.get('/search/', params={'query': 'harbour', 'limit': 10})
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200
+        assert response.json()['results_count'] >= 1
+        assert elapsed < SEARCH_LATENCY, f"Search took {elapsed:.2f}s during the crawl"
+        if job['status'] == RUNNING:
+            searched_while_running += 1
+        time.sleep(0.1)
+
+    assert job['status'] == COMPLETED, job
+    assert searched_while_running > 0
+    assert job['items_crawled'] == len(PAGES)
+
+    urls = {result['url'] for result in client.get('/search/', params={'query': 'harbour', 'limit': 10})
+            .json()['results']}
+    assert {f"{site.rsplit('/', 1)[0]}/{name}" for name in ('tides.html', 'ships.html')} <= urls
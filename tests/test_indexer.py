@@ -0,0 +1,49 @@
+"""Incremental indexing into segments: flushes, deletes and refreshes"""
+import pytest
+from index.src.indexer import InvertedIndex
+from index.src.merge import IndexMerger, LogMergePolicy
+from index.src.search import SearchEngine
+
+
+def urls(index, query):
+    return {index.get_document(result.doc_id).url for result in SearchEngine(index).search(query, 100)}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = InvertedIndex()
+    index.open(str(tmp_path / 'index'))
+    for flush in range(2):
+        for i in range(3):
+            index.add_document(f"https://example.com/{flush}/{i}", f"lighthouse keeper notebook page {flush} {i}")
+        index.flush()
+    yield index
+    index.close()
+
+
+def merge_elsewhere(index):
+    """Merges the flushed segments the way another writer would, changing the manifest"""
+    assert IndexMerger(index.directory, LogMergePolicy(merge_factor=2)).merge() == 1
+
+
+def test_readded_url_survives_refresh_after_merge(index):
+    index.add_document("https://example.com/0/1", "harbour storm ships")
+    merge_elsewhere(index)
+    assert index.refresh()
+
+    assert urls(index, 'harbour') == {"https://example.com/0/1"}
+    assert "https://example.com/0/1" not in urls(index, 'lighthouse')
+    index.flush()
+    assert urls(index, 'harbour') == {"https://example.com/0/1"}
+    assert len(urls(index, 'lighthouse')) == 5
+
+
+def test_delete_survives_refresh_after_merge(index):
+    assert index.delete_document("https://example.com/1/2")
+    merge_elsewhere(index)
+    assert index.refresh()
+
+    assert "https://example.com/1/2" not in urls(index, 'lighthouse')
+    index.flush()
+    assert urls(index, 'lighthouse') == {f"https://example.com/{flush}/{i}" for flush in range(2) for i in range(3)} - {
+        "https://example.com/1/2"}
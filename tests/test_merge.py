@@ -0,0 +1,110 @@
+"""Segment merging keeps every live document and purges deleted ones"""
+import os
+import pytest
+from index.src.directory import IndexDirectory
+from index.src.indexer import InvertedIndex
+from index.src.merge import IndexMerger, LogMergePolicy
+from index.src.search import SearchEngine
+
+URLS = [f"https://example.com/{segment}/{i}" for segment in range(3) for i in range(4)]
+
+
+def text_of(url):
+    segment, i = url.rsplit('/', 2)[-2:]
+    return f"lighthouse keeper notebook page {segment} {i}"
+
+
+@pytest.fixture
+def directory(tmp_path):
+    index = InvertedIndex()
+    index.open(str(tmp_path / 'index'))
+    for segment in range(3):
+        for url in URLS[segment * 4:(segment + 1) * 4]:
+            index.add_document(url, text_of(url), title=f"Page {url}")
+        index.flush()
+    assert len(index.segments) == 3
+    index.close()
+    return IndexDirectory(str(tmp_path / 'index'))
+
+
+def delete(directory, urls):
+    """Deletes URLs the way another writer would"""
+    writer = InvertedIndex()
+    writer.open(directory.path)
+    for url in urls:
+        assert writer.delete_document(url)
+    writer.flush()
+    writer.close()
+
+
+def merge(directory) -> IndexMerger:
+    merger = IndexMerger(directory, LogMergePolicy(merge_factor=3))
+    assert merger.merge() == 1
+    return merger
+
+
+def assert_live(directory, live):
+    index = InvertedIndex()
+    index.open(directory.path)
+    try:
+        assert index.doc_count == len(live)
+        for url in URLS:
+            if url in live:
+                assert index.text_by_url(url) == text_of(url)
+                assert index.get_document_by_url(url).title == f"Page {url}"
+            else:
+                assert index.get_document_by_url(url) is None
+        found = {index.get_document(result.doc_id).url for result in SearchEngine(index).search('lighthouse', 100)}
+        assert found == set(live)
+    finally:
+        index.close()
+
+
+def test_merge_keeps_live_documents_and_purges_deletes(directory):
+    sources = [info.name for info in directory.read_manifest().segments]
+    deleted = {URLS[1], URLS[4], URLS[5], URLS[11]}
+    delete(directory, deleted)
+    merge(directory)
+
+    segments = directory.read_manifest().segments
+    assert len(segments) == 1
+    # Deleted documents are gone from the merged segment, not just marked
+    assert segments[0].doc_count == len(URLS) - len(deleted)
+    assert not directory.read_deletes(segments[0].name)
+    for name in sources:
+        assert not os.path.exists(directory.file(name, '.seg'))
+    assert_live(directory, [url for url in URLS if url not in deleted])
+
+
+def test_delete_during_merge_is_carried_over(directory, monkeypatch):
+    delete(directory, [URLS[0]])
+    commit = IndexMerger._commit
+
+    def commit_after_delete(merger, *args):
+        # Lands after the merge read its sources and before it commits
+        delete(directory, [URLS[2], URLS[7]])
+        return commit(merger, *args)
+
+    monkeypatch.setattr(IndexMerger, '_commit', commit_after_delete)
+    merge(directory)
+
+    segments = directory.read_manifest().segments
+    assert len(segments) == 1
+    assert segments[0].doc_count == len(URLS) - 1
+    assert len(directory.read_deletes(segments[0].name)) == 2
+    assert_live(directory, [url for url in URLS if url not in (URLS[0], URLS[2], URLS[7])])
+
+
+def test_merge_of_merged_segments_is_abandoned(directory, monkeypatch):
+    commit = IndexMerger._commit
+
+    def commit_after_other_merge(merger, *args):
+        monkeypatch.setattr(IndexMerger, '_commit', commit)
+        merge(directory)
+        return commit(merger, *args)
+
+    monkeypatch.setattr(IndexMerger, '_commit', commit_after_other_merge)
+    names = [info.name for info in directory.read_manifest().segments]
+    assert not IndexMerger(directory).merge_segments(names)
+    assert len(directory.read_manifest().segments) == 1
+    assert_live(directory, URLS)
@@ -0,0 +1,69 @@
+"""Preprocessing: NLTK resources stay local, the fast tokenizer keeps to word_tokenize, offsets fit the original text"""
+import nltk
+import pytest
+from nltk.tokenize import NLTKWordTokenizer
+from index.src.preprocessor import TextPreprocessor, fast_tokenize, load_stopwords
+
+# One sentence each: word_tokenize only adds Punkt's sentence splitting, which needs data files,
+# to the Treebank-style tokenizer used below
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog.",
+    "I can't believe it's not butter, said Sarah's brother!",
+    "They'll arrive at 5:30pm -- don't be late (or else).",
+    "\"Quoted text,\" she wrote; then [brackets] and {braces} followed...",
+    "E-mail me at someone@example.com or visit https://example.com/path?q=1&r=2",
+    "We're gonna need a bigger boat, and I cannot wait.",
+    "Prices rose 3.5% in Q4; analysts' forecasts were wrong again",
+    "Tabs\tand\nnewlines separate words too, as do “curly” ‘quotes’ and «guillemets»",
+    "Lemme see whether you've gotta go or wanna stay!",
+    "Hyphenated state-of-the-art systems aren't always better?",
+]
+
+
+@pytest.mark.parametrize('sentence', SENTENCES)
+def test_fast_tokenizer_keeps_the_same_words(sentence):
+    lowered = sentence.lower()
+    expected = [token for token in NLTKWordTokenizer().tokenize(lowered) if token.isalpha()]
+    assert [token for token in fast_tokenize(lowered) if token.isalpha()] == expected
+
+
+def test_missing_resource_names_the_data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(nltk.data, 'path', [])
+
+    def download(*args, **kwargs):
+        raise AssertionError("downloaded without being asked to")
+
+    monkeypatch.setattr(nltk, 'download', download)
+    with pytest.raises(LookupError, match=str(tmp_path)):
+        load_stopwords(str(tmp_path))
+
+
+def test_missing_resource_downloads_when_allowed(tmp_path, monkeypatch):
+    monkeypatch.setattr(nltk.data, 'path', [])
+    downloads = []
+
+    def download(package, download_dir=None, quiet=False):
+        downloads.append((package, download_dir))
+        corpus = tmp_path / 'corpora' / package
+        corpus.mkdir(parents=True)
+        (corpus / 'english').write_text("the\nand\n", encoding='utf-8')
+        return True
+
+    monkeypatch.setattr(nltk, 'download', download)
+    assert 'the' in load_stopwords(str(tmp_path), True)
+    assert downloads == [('stopwords', str(tmp_path))]
+
+
+@pytest.mark.parametrize('text', [
+    "The harbour of İzmir shelters fishing ships",
+    "İSTANBUL İSTANBUL harbour ships İ storms",
+    "Plain ascii text about the harbour and its ships",
+])
+def test_offsets_point_into_the_original_text(text):
+    preprocessor = TextPreprocessor(tokenizer='fast')
+    words = []
+    tokens, offsets = preprocessor.preprocess_with_offsets(text, words)
+    assert tokens == preprocessor.preprocess(text)
+    data = text.encode('utf-8')
+    for word, offset in zip(words, offsets):
+        assert data[offset:].decode('utf-8').lower().startswith(word), (word, offset)
@@ -0,0 +1,168 @@
+"""Query parsing and boolean evaluation over sorted postings"""
+import random
+from array import array
+import pytest
+from index.src.indexer import InvertedIndex
+from index.src.postings import PostingList
+from index.src.query import (MAX_EXPANSIONS, AndNode, BooleanEvaluator, NotNode, OrNode, ProximityClause,
+                             TermNode, parse_query)
+
+
+class Words:
+    """Lowercases and splits, so tests control exactly which tokens a query has"""
+
+    def preprocess(self, text, words=None):
+        return text.lower().split()
+
+
+def parse(query, expand=None):
+    return parse_query(query, Words(), expand)
+
+
+def term(token):
+    return TermNode([token])
+
+
+@pytest.mark.parametrize('query, expression', [
+    ("a OR b AND c", OrNode([term('a'), AndNode([term('b'), term('c')])])),
+    ("a AND b OR c", OrNode([AndNode([term('a'), term('b')]), term('c')])),
+    ("NOT a AND b", AndNode([NotNode(term('a')), term('b')])),
+    ("a OR NOT b c", OrNode([term('a'), AndNode([NotNode(term('b')), term('c')])])),
+    ("NOT NOT a OR b", OrNode([NotNode(NotNode(term('a'))), term('b')])),
+    ("(a OR b) AND c", AndNode([OrNode([term('a'), term('b')]), term('c')])),
+    ("NOT (a OR b)", NotNode(OrNode([term('a'), term('b')]))),
+    ("a b OR c", OrNode([AndNode([term('a'), term('b')]), term('c')])),
+])
+def test_not_binds_tighter_than_and_than_or(query, expression):
+    assert parse(query).expression == expression
+
+
+def test_boolean_tokens_leave_out_negated_terms():
+    parsed = parse('a AND NOT (b OR "c d") OR e')
+    assert parsed.tokens == ['a', 'e']
+    assert parsed.excluded_tokens == ['b', 'c', 'd']
+    assert parsed.clauses == []
+
+
+def test_phrases_and_near_clauses():
+    parsed = parse('"new york" pizza python NEAR/3 web')
+    assert parsed.expression is None
+    assert parsed.tokens == ['new', 'york', 'pizza', 'python', 'web']
+    assert parsed.clauses == [ProximityClause(['new', 'york']), ProximityClause(['python', 'web'], slop=3, ordered=False)]
+
+    # A chain is one clause with its largest distance
+    assert parse('a NEAR/2 b NEAR/4 c').clauses == [ProximityClause(['a', 'b', 'c'], slop=4, ordered=False)]
+    # NEAR without a word on both sides is dropped
+    assert parse('NEAR/2 a').clauses == []
+
+
+def test_prefix_expansions_are_capped():
+    requested = []
+
+    def expand(prefix, limit):
+        requested.append((prefix, limit))
+        return [f"{prefix}{i}" for i in range(limit)]
+
+    parsed = parse('Progr* language', expand)
+    assert requested == [('progr', MAX_EXPANSIONS)]
+    assert parsed.tokens == [f"progr{i}" for i in range(MAX_EXPANSIONS)] + ['language']
+    # Literal without an expander
+    assert parse('progr*').tokens == ['progr*']
+
+
+def test_index_expands_prefixes_to_the_most_frequent_terms():
+    index = InvertedIndex()
+    words = [f"zet{a}{b}" for a in 'bdfgkmn' for b in 'bdfgk']
+    assert len(words) > MAX_EXPANSIONS
+    for i, word in enumerate(words):
+        # Later words turn up in more documents
+        for j in range(i // 5 + 1):
+            index.add_document(f"https://example.com/{word}/{j}", f"{word} lighthouse")
+    terms = parse_query('zet*', index.preprocessor, index.expand_prefix).tokens
+    # Ties go to the alphabetically first word
+    assert terms == sorted(words, key=lambda word: (-(words.index(word) // 5), word))[:MAX_EXPANSIONS]
+
+
+DOCS = [
+    "new york pizza is the best pizza",
+    "york is not new",
+    "python web framework for the web",
+    "web scraping with python and a crawler",
+    "python is a language",
+    "the web",
+    "new python crawler in york",
+]
+
+
+@pytest.fixture
+def postings():
+    postings = {}
+    for doc_id, text in enumerate(DOCS):
+        for position, token in enumerate(text.split()):
+            postings.setdefault(token, PostingList()).add(doc_id, position)
+    return postings
+
+
+def evaluate(query, postings):
+    """Matching documents of a boolean query, or of a single phrase or NEAR clause"""
+    parsed = parse(query)
+    node = parsed.expression if parsed.expression is not None else parsed.clauses[0]
+    evaluator = BooleanEvaluator(postings, lambda: array('I', range(len(DOCS))))
+    return list(evaluator.evaluate(node)), evaluator
+
+
+def test_evaluates_boolean_expressions(postings):
+    assert evaluate("python AND web", postings)[0] == [2, 3]
+    assert evaluate("python OR york", postings)[0] == [0, 1, 2, 3, 4, 6]
+    assert evaluate("python AND NOT web", postings)[0] == [4, 6]
+    assert evaluate("NOT python", postings)[0] == [0, 1, 5]
+    assert evaluate("new OR python AND NOT web", postings)[0] == [0, 1, 4, 6]
+    assert evaluate("(new OR python) AND NOT web", postings)[0] == [0, 1, 4, 6]
+    assert evaluate("missing AND python", postings)[0] == []
+    assert evaluate("missing OR python", postings)[0] == [2, 3, 4, 6]
+
+
+def test_evaluates_phrases_and_near(postings):
+    doc_ids, evaluator = evaluate('"new york" OR "python web"', postings)
+    assert doc_ids == [0, 2]
+    assert [sorted(matches) for matches in evaluator.clause_matches] == [[0], [2]]
+    # "york is not new" has both words, in the wrong order
+    assert evaluate('"york new"', postings)[0] == []
+
+    assert evaluate('python NEAR/0 web', postings)[0] == [2]
+    # Either order, at most k tokens between
+    assert evaluate('web NEAR/2 python', postings)[0] == [2, 3]
+    assert evaluate('new NEAR/1 crawler', postings)[0] == [6]
+    assert evaluate('new NEAR/0 crawler', postings)[0] == []
+
+    # Clauses under a NOT only exclude, they add no proximity matches
+    doc_ids, evaluator = evaluate('python AND NOT "python web"', postings)
+    assert doc_ids == [3, 4, 6]
+    assert evaluator.clause_matches == []
+
+
+def test_matches_set_semantics_on_random_expressions(postings):
+    rng = random.Random(3)
+    vocabulary = sorted(postings) + ['missing']
+    universe = set(range(len(DOCS)))
+    docs = {token: set(postings[token].doc_ids) if token in postings else set() for token in vocabulary}
+
+    def expression(depth):
+        """A random query and the documents it matches"""
+        kind = rng.choice(['term', 'term', 'not', 'and', 'or'] if depth else ['term'])
+        if kind == 'term':
+            token = rng.choice(vocabulary)
+            return token, docs[token]
+        if kind == 'not':
+            query, matched = expression(depth - 1)
+            return f"NOT ({query})", universe - matched
+        (left, left_docs), (right, right_docs) = expression(depth - 1), expression(depth - 1)
+        if kind == 'and':
+            return f"({left}) AND ({right})", left_docs & right_docs
+        return f"({left}) OR ({right})", left_docs | right_docs
+
+    for _ in range(300):
+        query, expected = expression(3)
+        # Keeps a lone word a boolean query
+        query = f"({query}) OR missing"
+        assert evaluate(query, postings)[0] == sorted(expected), query
@@ -0,0 +1,51 @@
+"""Pruned top-k scoring returns exactly what scoring every matching document does"""
+import random
+import pytest
+from index.src.indexer import InvertedIndex
+from index.src.search import SearchEngine
+from ranking.src import scoring
+from ranking.src.scoring import BM25FScorer, BM25Scorer, TFIDFScorer
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ter', 'vun', 'sol', 'dra', 'pe', 'quo', 'rin']
+VOCABULARY = sorted({a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES})[:400]
+
+
+def zipf_words(rng, count):
+    # Word i turns up about 1 / (i + 1) as often as the most common one
+    return rng.choices(VOCABULARY, weights=[1 / (i + 1) for i in range(len(VOCABULARY))], k=count)
+
+
+@pytest.fixture(scope='module')
+def index():
+    rng = random.Random(7)
+    index = InvertedIndex()
+    for i in range(1500):
+        index.add_document(f"https://example.com/{i}", " ".join(zipf_words(rng, rng.randint(5, 60))),
+                           title=" ".join(zipf_words(rng, rng.randint(1, 5))),
+                           meta_description=" ".join(zipf_words(rng, rng.randint(0, 10))))
+    return index
+
+
+@pytest.fixture(scope='module')
+def queries():
+    rng = random.Random(11)
+    # Common and rare words together, where pruning skips the most
+    return [" ".join(rng.choice(VOCABULARY[:20] if rng.random() < 0.5 else VOCABULARY) for _ in range(rng.randint(2, 5)))
+            for _ in range(80)]
+
+
+@pytest.mark.parametrize('scorer_class', [TFIDFScorer, BM25Scorer, BM25FScorer])
+def test_pruned_search_matches_exhaustive(index, queries, scorer_class, monkeypatch):
+    monkeypatch.setattr(scoring, 'EXHAUSTIVE_MAX_POSTINGS', 0)
+    # Only the pruned path of the batch scorers takes a union of the essential terms' documents
+    pruned = []
+    union = scoring._union
+    monkeypatch.setattr(scoring, '_union', lambda doc_ids: pruned.append(len(doc_ids)) or union(doc_ids))
+    engine = SearchEngine(index, scorer_class)
+    for query in queries:
+        # Exhaustive results are sorted in full, so each k takes a prefix
+        expected = [result.doc_id for result in engine.search_exhaustive(query, 50)]
+        assert expected, query
+        for k in (1, 5, 10, 50):
+            assert [result.doc_id for result in engine.search(query, k)] == expected[:k], (query, k)
+    assert pruned or not scorer_class.supports_batch
@@ -0,0 +1,52 @@
+"""Pre-forked serving: flushes are picked up in place, only merges call for new workers"""
+import gc
+import pytest
+import api.app as app_module
+from api.serve import refresh_snapshot
+from index.src.directory import IndexDirectory
+from index.src.indexer import InvertedIndex
+from index.src.merge import IndexMerger, LogMergePolicy
+from index.src.search import SearchEngine
+
+
+def flush(path, url):
+    """Adds a page the way a crawl process would"""
+    writer = InvertedIndex()
+    writer.open(path)
+    writer.add_document(url, "Winter storms batter the harbour wall")
+    writer.flush()
+    writer.close()
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'index')
+    flush(path, "https://example.com/0")
+    index = InvertedIndex()
+    index.open(path)
+    monkeypatch.setattr(app_module, 'index', index)
+    monkeypatch.setattr(app_module, 'search_engine', SearchEngine(index))
+    yield path
+    index.close()
+    gc.unfreeze()
+
+
+def test_flushes_refresh_in_place_and_merges_replace_workers(path):
+    index = app_module.index
+    worker = InvertedIndex()
+    worker.open(path)
+
+    for i in range(1, 3):
+        flush(path, f"https://example.com/{i}")
+        assert not refresh_snapshot()
+        assert worker.refresh()
+        assert index.doc_count == worker.doc_count == i + 1
+    assert not refresh_snapshot()
+
+    assert IndexMerger(IndexDirectory(path), LogMergePolicy(merge_factor=3)).merge() == 1
+    assert refresh_snapshot()
+    assert len(index.segments) == 1
+    assert index.doc_count == 3
+    # SIGHUP
+    assert refresh_snapshot(force=True)
+    worker.close()